@@ -44,13 +44,17 @@ class XPlaneUdp:
       self.AddDataRef(next(iter(self.datarefs.values())), freq=0)
     self.socket.close()
 
-  def SendCommand(self,command):
-    message = struct.pack("<4sx500s", b'CMND', command.encode('utf-8'))
-    self.socket.sendto(message, (self.BeaconData["IP"], self.UDP_PORT))
+  @staticmethod
+  def CommandPacket(command):
+    '''
+    CMND packet for SendPacket(), built once for commands that are sent often
+    '''
+    return struct.pack("<4sx500s", b'CMND', command.encode('utf-8'))
 
-  def WriteDataRef(self,dataref,value,vtype='float'):
+  @staticmethod
+  def DataRefPacket(dataref,value,vtype='float'):
     '''
-    Write Dataref to XPlane
+    DREF packet for SendPacket()
     DREF0+(4byte byte value)+dref_path+0+spaces to complete the whole message to 509 bytes
     DREF0+(4byte byte value of 1)+ sim/cockpit/switches/anti_ice_surf_heat_left+0+spaces to complete to 509 bytes
     '''
@@ -66,8 +70,20 @@ class XPlaneUdp:
       message = struct.pack("<5sI500s", cmd, int(value), string)
 
     assert(len(message)==509)
+    return message
+
+  def SendPacket(self,message):
     self.socket.sendto(message, (self.BeaconData["IP"], self.UDP_PORT))
 
+  def SendCommand(self,command):
+    self.SendPacket(self.CommandPacket(command))
+
+  def WriteDataRef(self,dataref,value,vtype='float'):
+    '''
+    Write Dataref to XPlane, see DataRefPacket()
+    '''
+    self.SendPacket(self.DataRefPacket(dataref, value, vtype))
+
   def AddDataRef(self, dataref, freq = None):
 
     '''
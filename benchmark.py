@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# Micro benchmarks for the hot paths of the bridge, no MCDU or simulator needed.
+# usage: python3 benchmark.py [name ...] [--frames N] [--payloads FILE]
+#
+# --payloads takes SimBridge messages recorded with simbridge.py --record,
+# without it a generated update is used.
+#
+# Each benchmark prints the time per frame and what one warmed up frame allocates:
+# the peak of memory in use during the frame above what was in use before it
+# (tracemalloc) and the blocks still allocated after it.
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import tracemalloc
+import queue
+from threading import Thread
+from time import perf_counter, sleep
+
+import mcdu_init
+from mcdu_report import REPORT_ID, PAYLOAD_SIZE
+
+
+class NullDevice:
+    # takes the reports like a hid device, keeps nothing
+    def __init__(self):
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return len(data)
+
+
+def sample_pages(count: int = 16, seed: int = 1):
+    # MCDU like pages: text in the usual colors, some small font, # boxes and ° signs
+    from mcdu_core import PAGE_LINES, PAGE_CHARS_PER_LINE
+    rnd = random.Random(seed)
+    pages = []
+    for _ in range(count):
+        page = []
+        for _ in range(PAGE_LINES):
+            line = []
+            for _ in range(PAGE_CHARS_PER_LINE):
+                line.extend([rnd.choice('WWWGGBAM'), rnd.random() < 0.4, rnd.choice('ABCDEFG 0123/#`  ')])
+            page.append(line)
+        pages.append(page)
+    return pages
+
+
+def measure(name: str, frame, frames: int):
+    # frame(i) renders frame i, the result goes to the real stdout even if the frames print
+    for i in range(50):  # warm up, fills caches
+        frame(i)
+    start = perf_counter()
+    for i in range(frames):
+        frame(i)
+    elapsed = perf_counter() - start
+
+    blocks = sys.getallocatedblocks()
+    for i in range(frames):
+        frame(i)
+    blocks = sys.getallocatedblocks() - blocks
+
+    tracemalloc.start()
+    peak = 0
+    for i in range(min(frames, 200)):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        frame(i)
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    print(f"{name:28} {elapsed / frames * 1e6:9.1f} us/frame  "
+          f"peak {peak:6d} B/frame  {blocks:+d} blocks left after {frames} frames", file=sys.__stdout__)
+
+
+def legacy_chunks(buf, device):
+    # how set_from_page split a frame into reports before the ReportBuilder
+    while len(buf):
+        max_len = min(PAYLOAD_SIZE, len(buf))
+        usb_buf = buf[:max_len]
+        usb_buf.insert(0, REPORT_ID)
+        if max_len < PAYLOAD_SIZE:
+            usb_buf.extend([0] * (PAYLOAD_SIZE - max_len))
+        device.write(bytes(usb_buf))
+        del buf[:max_len]
+
+
+def bench_reports(args):
+    frames = args.frames
+    from mcdu_core import DisplayManager
+    pages = sample_pages()
+    mcdu_init.send_init = lambda device: None  # no init reports, only frames
+    display = DisplayManager(NullDevice())
+
+    measure('set_from_page', lambda i: display.set_from_page(pages[i % len(pages)], i % 4), frames)
+
+    # chunking alone, the same encoded frames
+    builder = display.reports
+    encoded = []
+    for page in pages:
+        display.set_from_page(page)
+        encoded.append(bytes(builder.frame[:builder.length]))
+    device = NullDevice()
+    frame_view = memoryview(builder.frame)
+
+    def builder_chunks(i):
+        frame = encoded[i % len(encoded)]
+        frame_view[:len(frame)] = frame
+        for r in range(builder.finish(len(frame))):
+            device.write(builder.reports[r])
+
+    measure('chunking (ReportBuilder)', builder_chunks, frames)
+    measure('chunking (list, before)', lambda i: legacy_chunks(list(encoded[i % len(encoded)]), device), frames)
+
+
+def sample_side(rnd, scratchpad: str = None):
+    # the data of one MCDU side in a SimBridge update, like the A32NX sends it
+    def text(length=12):
+        return ''.join(rnd.choice('ABCDEFGHIJ0123456789/ ') for _ in range(rnd.randint(0, length)))
+
+    def color():
+        return '{' + rnd.choice(['white', 'cyan', 'green', 'amber']) + '}'
+
+    return {
+        'title': '{white}{sp}{sp}{sp}{sp}{green}' + text(16) + '{end}',
+        'titleLeft': '', 'page': '', 'arrows': [False, False, False, False],
+        'lines': [[color() + ('{small}' if i % 2 else '') + text() + '{end}', color() + text(8) + '{end}', '']
+                  for i in range(12)],
+        'scratchpad': '{amber}' + (text(20) if scratchpad is None else scratchpad) + '{end}',
+        'annunciators': {k: rnd.random() < 0.2 for k in ('fmgc', 'fail', 'mcdu_menu', 'fm1', 'ind', 'rdy', 'fm2')},
+        'displayBrightness': 0.8, 'integralBrightness': 0.5,
+    }
+
+
+def sample_update(seed: int = 1):
+    # a SimBridge update for both sides
+    rnd = random.Random(seed)
+    return 'update:' + json.dumps({'left': sample_side(rnd), 'right': sample_side(rnd)}, separators=(',', ':'))
+
+
+def load_payloads(path):
+    # update payloads of a simbridge.py --record file
+    with open(path) as f:
+        return [line[len('update:'):].rstrip('\n') for line in f if line.startswith('update:')]
+
+
+def bench_decode(args):
+    import mcdu_decode
+    payloads = load_payloads(args.payloads) if args.payloads else [sample_update(i)[len('update:'):] for i in range(16)]
+    if not payloads:
+        print(f'no updates in {args.payloads}')
+        return
+    print(f"{len(payloads)} payloads, {sum(map(len, payloads)) // len(payloads)} bytes on average, "
+          f"backend {mcdu_decode.BACKEND}")
+    n = len(payloads)
+    measure('json.loads (before)', lambda i: json.loads(payloads[i % n]), args.frames)
+    measure(f'{mcdu_decode.BACKEND} both sides', lambda i: mcdu_decode.decode_update(payloads[i % n], ('left', 'right')), args.frames)
+    measure(f'{mcdu_decode.BACKEND} left side only', lambda i: mcdu_decode.decode_update(payloads[i % n], ('left',)), args.frames)
+
+
+def sample_xplane_values(names, rnd):
+    # the values X-Plane sends for an MCDU page: one char per dataref, most cells empty
+    values = {}
+    for name in names:
+        if 'VertSlew' in name:
+            values[name] = 1.0
+        elif 'DUBrightness' in name or '/anim' in name:
+            values[name] = 0.8
+        elif rnd.random() < 0.08:  # a cell has its char in one of the ~12 color datarefs of its line
+            values[name] = float(ord(rnd.choice('ABCDEFGHIJ0123456789/.')))
+        else:
+            values[name] = float(rnd.choice([0, 0x20]))
+    return values
+
+
+def bench_xplane(args):
+    # X-Plane values to the page (winwing_mcdu.set_datacache) for the same values every
+    # frame, so it is the loop over the ~2700 datarefs without a display write
+    try:
+        import winwing_mcdu
+    except ImportError as error:
+        print(f'skipped: {error}')
+        return
+    winwing_mcdu.create_button_list_mcdu()
+    config = winwing_mcdu.DEVICEMASK.MCDU | winwing_mcdu.DEVICEMASK.FO
+    names = [dataref for dataref, freq in winwing_mcdu.RequestDataRefs(config)]
+    values = sample_xplane_values(names, random.Random(1))
+    usb = type('Usb', (), {'device': NullDevice(), 'device_config': config})
+    mcdu_init.send_init = lambda device: None
+    display = winwing_mcdu.XPlaneDisplay(NullDevice())
+    print(f'{len(values)} datarefs, F/O side')
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):  # the led log
+        winwing_mcdu.set_datacache(usb, display, dict(values))  # the page is drawn once
+        measure('set_datacache', lambda i: winwing_mcdu.set_datacache(usb, display, dict(values)), args.frames)
+
+
+class NullSocket:
+    # takes what a websocket or UDP socket sends, keeps nothing
+    def send(self, data):
+        return len(data)
+
+    def sendto(self, data, address):
+        return len(data)
+
+    def gettimeout(self):
+        return None
+
+    def close(self):
+        pass
+
+
+def bench_dispatch(args):
+    # one key press from the input ring to the socket
+    keys = list(range(12)) + list(range(32, 74))  # line select keys, digits and letters
+    n = len(keys)
+
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):  # the key log
+        try:
+            import websocket
+            import simbridge
+        except ImportError as error:
+            print(f'simbridge dispatch skipped: {error}', file=sys.__stdout__)
+        else:
+            buttonlist = simbridge.create_button_list_mcdu('right')
+            simbridge.sim = simbridge.SimBridgeSource()
+            simbridge.sim.ws = websocket.WebSocketApp(simbridge.sim.url)
+            simbridge.sim.ws.sock = websocket.WebSocket()
+            simbridge.sim.ws.sock.sock = NullSocket()
+            mcdu = type('Mcdu', (), {'bindings': simbridge.create_bindings(buttonlist)})
+            buttons = {b.id: b for b in buttonlist}
+
+            def legacy(i):
+                # the text was formatted and encoded on every press before the bindings
+                b = buttons[keys[i % n]]
+                simbridge.sim.ws.send(b.dataref)
+                print(f'send command {b.dataref}')
+
+            print('SimBridge (websocket text frame)', file=sys.__stdout__)
+            measure('  send text (before)', legacy, args.frames)
+            measure('  pre-encoded binding', lambda i: simbridge.mcdu_button_event(mcdu, keys[i % n], True), args.frames)
+
+        import XPlaneUdp
+        xp = XPlaneUdp.XPlaneUdp()
+        xp.socket = NullSocket()
+        xp.BeaconData['IP'] = '127.0.0.1'
+        xp.UDP_PORT = 49000
+        datarefs = [f'AirbusFBW/MCDU1Key{c}' for c in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ']
+        commands = [XPlaneUdp.XPlaneUdp.CommandPacket(d.replace('AirbusFBW/MCDU1', 'AirbusFBW/MCDU2')) for d in datarefs]
+        values = [XPlaneUdp.XPlaneUdp.DataRefPacket(d, 1) for d in datarefs]
+
+        print('X-Plane (UDP, F/O side)', file=sys.__stdout__)
+        measure('  SendCommand (before)',
+                lambda i: xp.SendCommand(datarefs[i % 26].replace('AirbusFBW/MCDU1', 'AirbusFBW/MCDU2')), args.frames)
+        measure('  pre-encoded CMND', lambda i: xp.SendPacket(commands[i % 26]), args.frames)
+        measure('  WriteDataRef (before)', lambda i: xp.WriteDataRef(datarefs[i % 26], 1), args.frames)
+        measure('  pre-encoded DREF', lambda i: xp.SendPacket(values[i % 26]), args.frames)
+
+
+class EmulatedSimBridge:
+    # Stands in for the SimBridge websocket: a letter key appends to the scratchpad
+    # and the update goes back to on_message() right away, like a SimBridge without
+    # any latency.
+    name = 'SimBridge'
+
+    def __init__(self, simbridge):
+        self.simbridge = simbridge
+        self.data = sample_side(random.Random(1), '')
+        self._keys = queue.Queue()
+        Thread(target=self._run, daemon=True).start()
+
+    def send(self, frame):
+        data = frame.format()
+        mask = data[2:6]
+        self._keys.put(bytes(b ^ mask[i % 4] for i, b in enumerate(data[6:])).decode())
+
+    def _run(self):
+        while True:
+            key = self._keys.get().rsplit(':', 1)[1]
+            scratchpad = self.data['scratchpad'][len('{amber}'):-len('{end}')]
+            self.data = dict(self.data, scratchpad='{amber}' + typed(scratchpad, key) + '{end}')
+            self.simbridge.on_message('update:' + json.dumps({'left': self.data}, separators=(',', ':')))
+
+
+def typed(scratchpad: str, key: str):
+    return (scratchpad + key)[-20:]
+
+
+def bench_keystroke(args):
+    # key press on an emulated MCDU until its screen shows the key in the scratchpad
+    import simbridge
+    from mcdu_emulator import EmulatedDevice
+    keys = {chr(ord('A') + i): 44 + i for i in range(26)}  # KEYA .. KEYZ
+
+    device = EmulatedDevice(args.report_rate)
+    print(f'emulated MCDU at {args.report_rate} reports/s, {args.keys} key presses per run')
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):  # key and parser log
+        simbridge.quiet = True
+        simbridge.sim = EmulatedSimBridge(simbridge)
+        simbridge.renderers['left'] = simbridge.PageBuffer()
+        mcdu = simbridge.McduDevice(device, 'emulated MCDU', simbridge.DEVICEMASK.MCDU | simbridge.DEVICEMASK.CAP,
+                                    'left', simbridge.DisplayManager(device))
+        simbridge.add_device(mcdu)
+        simbridge.on_message('update:' + json.dumps({'left': simbridge.sim.data}, separators=(',', ':')))
+        device.wait_for(lambda d: d.frames > 1)
+        sleep(2.5)  # the input thread starts after 2 s
+
+        scratchpad = ''
+        latencies = []
+        for i in range(args.keys):
+            key = chr(ord('A') + i % 26)
+            scratchpad = typed(scratchpad, key)
+            start = perf_counter()
+            device.press(keys[key])
+            device.release(keys[key])
+            shown = device.wait_for(lambda d: d.row_text(13).rstrip() == scratchpad)
+            if shown is None:
+                print(f'key {key} not shown', file=sys.__stdout__)
+                break
+            latencies.append((shown - start) * 1000)
+            sleep(0.02)  # typing speed, the screen is idle again
+        latencies.sort()
+        print(f"key press to screen  p50 {latencies[len(latencies) // 2]:6.2f} ms  "
+              f"p99 {latencies[int(len(latencies) * 0.99)]:6.2f} ms  "
+              f"mean {sum(latencies) / len(latencies):6.2f} ms", file=sys.__stdout__)
+
+
+BENCHMARKS = {
+    'reports': bench_reports,
+    'decode': bench_decode,
+    'xplane': bench_xplane,
+    'dispatch': bench_dispatch,
+    'keystroke': bench_keystroke,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='winwing_mcdu micro benchmarks')
+    parser.add_argument('names', nargs='*', metavar='name', help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default all)")
+    parser.add_argument('--frames', type=int, default=2000, help='frames per benchmark')
+    parser.add_argument('--payloads', metavar='FILE', help='SimBridge messages recorded with simbridge.py --record')
+    parser.add_argument('--keys', type=int, default=200, help='key presses per keystroke run')
+    parser.add_argument('--report-rate', type=float, default=1000,
+                        help='reports per second of the emulated MCDU (default: 1000, 0 = no delay)')
+    args = parser.parse_args()
+    for name in args.names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark {name}')
+        print(f'--- {name}')
+        BENCHMARKS[name](args)
+    if 'keystroke' in (args.names or BENCHMARKS):
+        sys.stdout.flush()
+        os._exit(0)  # the input thread of the emulated MCDU does not end
+
+
+if __name__ == '__main__':
+    main()
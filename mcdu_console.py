@@ -0,0 +1,206 @@
+# Terminal mirror of the MCDU screen.
+# Only cells that changed since the last frame are repainted (ANSI cursor addressing)
+# and every frame goes to the terminal in a single write. Rendering runs in its own
+# thread and is throttled independently of the USB refresh.
+
+import os
+import sys
+from threading import Thread, Event, Lock
+from time import monotonic, sleep
+
+PAGE_LINES = 14
+PAGE_CHARS_PER_LINE = 24
+PAGE_BYTES_PER_CHAR = 3
+
+ESC = '\x1b['
+
+# page color code -> ANSI SGR, see DisplayManager.col_map
+ANSI_COLORS = {
+    'L': '30;47',  # black with grey background
+    'A': '33',     # amber
+    'W': '97',     # white
+    'B': '36',     # cyan
+    'G': '32',     # green
+    'M': '35',     # magenta
+    'R': '31',     # red
+    'Y': '93',     # yellow
+    'E': '90',     # grey
+    ' ': '97'      # use white
+}
+
+# page chars with a special glyph on the hardware
+SYMBOLS = {
+    '#': '☐',
+    '`': '°',
+}
+
+SLEW_UP = '↑'
+SLEW_DOWN = '↓'
+
+
+def page_cells(page, vertslew_key=0):
+    '''
+    Flatten a page (PAGE_LINES x PAGE_BYTES_PER_LINE) into a list of
+    (color, font_small, char) tuples, one per cell, row by row.
+    '''
+    cells = []
+    for row in page:
+        for j in range(0, PAGE_CHARS_PER_LINE * PAGE_BYTES_PER_CHAR, PAGE_BYTES_PER_CHAR):
+            color = row[j]
+            if type(color) == int:
+                color = chr(color)
+            cells.append((str(color).upper(), bool(row[j + 1]), row[j + PAGE_BYTES_PER_CHAR - 1]))
+    if vertslew_key in (1, 2):
+        c = cells[-2]
+        cells[-2] = (c[0], c[1], SLEW_UP)
+    if vertslew_key in (1, 3):
+        c = cells[-1]
+        cells[-1] = (c[0], c[1], SLEW_DOWN)
+    return cells
+
+
+def diff_cells(old, new):
+    '''Return the indexes of all cells that differ between two page_cells() lists.'''
+    if old is None or len(old) != len(new):
+        return list(range(len(new)))
+    return [i for i, c in enumerate(new) if c != old[i]]
+
+
+class TerminalMirror:
+    def __init__(self, fps: float = 10, stream=None, symbols: dict = None, row: int = 1, col: int = 1):
+        self.stream = stream or sys.stdout
+        self.interval = 1.0 / fps if fps > 0 else 0
+        self.symbols = dict(SYMBOLS)
+        if symbols:
+            self.symbols.update(symbols)
+        self.origin_row = row
+        self.origin_col = col
+        self.ansi = self.stream.isatty() and os.environ.get('TERM') != 'dumb'
+        self.stale = False
+
+        self._lock = Lock()
+        self._pending = None
+        self._new_frame = Event()
+        self._shown = None  # cells currently on the terminal
+        self._running = False
+        self._thread = None
+        self.frames = 0
+        self.cells_written = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        if self.ansi:
+            # keep the mirror in the top rows, everything else printed scrolls below it
+            top = self.origin_row + PAGE_LINES + 2
+            self.stream.write(f'{ESC}2J{ESC}{top};{self._term_lines()}r{ESC}{top};1H')
+            self.stream.flush()
+        self._thread = Thread(target=self._run, name='terminal-mirror', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._new_frame.set()
+        if self._thread:
+            self._thread.join(1)
+        if self.ansi:
+            self.stream.write(f'{ESC}r{ESC}{self._term_lines()};1H\n')
+            self.stream.flush()
+
+    def update(self, page, vertslew_key=0, stale: bool = False):
+        # snapshot the page, the caller keeps writing into its own buffer
+        snapshot = [row[:] for row in page]
+        with self._lock:
+            self._pending = (snapshot, vertslew_key, stale)
+        self._new_frame.set()
+
+    def _term_lines(self):
+        try:
+            return os.get_terminal_size(self.stream.fileno()).lines
+        except (OSError, ValueError, AttributeError):
+            return 24
+
+    def _run(self):
+        next_frame = 0
+        while self._running:
+            self._new_frame.wait()
+            if not self._running:
+                break
+            delay = next_frame - monotonic()
+            if delay > 0:
+                sleep(delay)  # throttle, newer updates replace the pending one meanwhile
+            with self._lock:
+                pending = self._pending
+                self._pending = None
+                self._new_frame.clear()
+            if pending is None:
+                continue
+            next_frame = monotonic() + self.interval
+            page, vertslew_key, stale = pending
+            try:
+                self._render(page_cells(page, vertslew_key), stale)
+            except (OSError, ValueError) as error:
+                print(f'terminal mirror stopped: {error}')
+                self._running = False
+
+    def _glyph(self, char):
+        if not char:
+            return ' '
+        return self.symbols.get(char, char)
+
+    def _render(self, cells, stale):
+        if self.ansi:
+            out = self._render_ansi(cells, stale)
+        else:
+            out = self._render_plain(cells, stale)
+        self.stale = stale
+        self._shown = cells
+        self.frames += 1
+        if out:
+            self.stream.write(out)
+            self.stream.flush()
+
+    def _render_plain(self, cells, stale):
+        out = ["|------ MCDU SCREEN -----|" + (" (stale)" if stale else "")]
+        for i in range(PAGE_LINES):
+            line = cells[i * PAGE_CHARS_PER_LINE:(i + 1) * PAGE_CHARS_PER_LINE]
+            out.append('|' + ''.join(self._glyph(c[2]) for c in line) + '|')
+        out.append("|------------------------|\n\n")
+        self.cells_written += len(cells)
+        return '\n'.join(out)
+
+    def _render_ansi(self, cells, stale):
+        out = []
+        top = self.origin_row
+        left = self.origin_col
+        if self._shown is None:
+            border = '+' + '-' * PAGE_CHARS_PER_LINE + '+'
+            out.append(f'{ESC}0m{ESC}{top};{left}H{border}')
+            for i in range(PAGE_LINES):
+                out.append(f'{ESC}{top + 1 + i};{left}H|{ESC}{top + 1 + i};{left + PAGE_CHARS_PER_LINE + 1}H|')
+            out.append(f'{ESC}{top + PAGE_LINES + 1};{left}H{border}')
+        if stale != self.stale or self._shown is None:
+            out.append(f'{ESC}0m{ESC}{top};{left + 2}H' + (' stale ' if stale else '-------'))
+
+        changed = diff_cells(self._shown, cells)
+        if not changed and not out:
+            return ''
+
+        sgr = None
+        last = -2
+        for idx in changed:
+            color, font_small, char = cells[idx]
+            if idx != last + 1 or idx % PAGE_CHARS_PER_LINE == 0:
+                row, col = divmod(idx, PAGE_CHARS_PER_LINE)
+                out.append(f'{ESC}{top + 1 + row};{left + 1 + col}H')
+            new_sgr = ANSI_COLORS.get(color, ANSI_COLORS['W']) + ('' if font_small else ';1')
+            if new_sgr != sgr:
+                out.append(f'{ESC}0;{new_sgr}m')
+                sgr = new_sgr
+            out.append(self._glyph(char))
+            last = idx
+        self.cells_written += len(changed)
+
+        # save/restore the cursor so log output below the mirror keeps its position
+        return '\x1b7' + ''.join(out) + f'{ESC}0m\x1b8'
@@ -0,0 +1,403 @@
+# What both bridges share, whatever the simulator: the page model, the encoder of
+# pages into display reports, the USB device layer and the input path.
+#   simbridge.py      MSFS via FlyByWire SimBridge
+#   winwing_mcdu.py   X-Plane via UDP
+# The simulator side sits behind a SimSource, see mcdu_sim.py. A front end renders
+# the data of its sim into a page and hands it to a DisplayManager, and maps the
+# key events of read_buttons()/dispatch_buttons() to what its sim understands.
+
+import hid
+from dataclasses import dataclass
+from enum import Enum, IntEnum
+from time import sleep
+
+from mcdu_input import report_buttons
+from mcdu_report import ReportBuilder, ARROW_UP, ARROW_DOWN
+import mcdu_init
+
+BUTTONS_CNT = 99  # TODO
+PAGE_LINES = 14  # Header + 6 * label + 6 * cont + textbox
+PAGE_CHARS_PER_LINE = 24
+PAGE_BYTES_PER_CHAR = 3
+PAGE_BYTES_PER_LINE = PAGE_CHARS_PER_LINE * PAGE_BYTES_PER_CHAR
+PAGE_BYTES_PER_PAGE = PAGE_BYTES_PER_LINE * PAGE_LINES
+
+
+class DEVICEMASK(IntEnum):
+    NONE = 0
+    MCDU = 0x01
+    PFP3N = 0x02
+    PFP4 = 0x04
+    PFP7 = 0x08
+    CAP = 0x10
+    FO = 0x20
+    OBS = 0x40
+
+
+class ButtonType(Enum):
+    SWITCH = 0
+    TOGGLE = 1
+    SEND_0 = 2
+    SEND_1 = 3
+    SEND_2 = 4
+    SEND_3 = 5
+    SEND_4 = 6
+    SEND_5 = 7
+    NONE = 5  # for testing
+
+
+class Leds(Enum):
+    BACKLIGHT = 0  # 0 .. 255
+    SCREEN_BACKLIGHT = 1  # 0 .. 255
+    FAIL = 8
+    FM = 9
+    MCDU = 10
+    MENU = 11
+    FM1 = 12
+    IND = 13
+    RDY = 14
+    STATUS = 15
+    FM2 = 16
+
+
+class DrefType(Enum):
+    DATA = 0
+    CMD = 1
+    NONE = 2  # for testing
+
+
+@dataclass
+class Button:
+    id: int
+    label: str
+    dataref: str = None
+    dreftype: DrefType = DrefType.DATA
+    type: ButtonType = ButtonType.NONE
+    led: Leds = None
+
+
+class Byte(Enum):
+    H0 = 0
+
+
+@dataclass
+class Flag:
+    name: str
+    byte: Byte
+    mask: int
+    value: bool = False
+
+
+def winwing_mcdu_set_leds(device, leds, brightness):
+    if isinstance(leds, list):
+        for i in range(len(leds)):
+            winwing_mcdu_set_led(device, leds[i], brightness)
+    else:
+        winwing_mcdu_set_led(device, leds, brightness)
+
+
+def winwing_mcdu_set_led(device, led, brightness):
+    data = [0x02, 0x32, 0xbb, 0, 0, 3, 0x49,
+            led.value, brightness, 0, 0, 0, 0, 0]
+    if 'data' in locals():
+        cmd = bytes(data)
+        device.write(cmd)
+
+
+# --- USB Manager Class for Device Detection ---
+
+
+class UsbManager:
+    backend = 'hidapi'  # or 'libusb': asynchronous transfers with mcdu_libusb
+    devlist = [
+        {'vid': 0x4098, 'pid': 0xbb36, 'name': 'MCDU - Captain',
+            'mask': DEVICEMASK.MCDU | DEVICEMASK.CAP},
+        {'vid': 0x4098, 'pid': 0xbb3e, 'name': 'MCDU - First Officer',
+            'mask': DEVICEMASK.MCDU | DEVICEMASK.FO},
+        {'vid': 0x4098, 'pid': 0xbb3a, 'name': 'MCDU - Observer',
+            'mask': DEVICEMASK.MCDU | DEVICEMASK.OBS},
+        {'vid': 0x4098, 'pid': 0xbc1e,
+            'name': 'PFP 3N (not tested)', 'mask': DEVICEMASK.PFP3N},
+        {'vid': 0x4098, 'pid': 0xbc1d,
+            'name': 'PFP 4 (not tested)', 'mask': DEVICEMASK.PFP4},
+        {'vid': 0x4098, 'pid': 0xba01,
+            'name': 'PFP 7 (not tested)', 'mask': DEVICEMASK.PFP7}
+    ]
+
+    def __init__(self):
+        self.device = None
+        self.device_config = 0
+
+    def connect_device(self, vid: int, pid: int, path: bytes = None):
+        if self.backend == 'libusb':
+            from mcdu_libusb import LibusbDevice
+            self.device = LibusbDevice()
+            self.device.open(vid, pid, path)
+            print("Device connected (libusb).")
+            return
+        # Linux uses device whereas mac uses Device
+        try:
+            self.device = hid.device()
+            if path:
+                self.device.open_path(path)
+            else:
+                self.device.open(vid, pid)
+        except AttributeError:
+            print("Using hidapi mac version")
+            if path:
+                self.device = hid.Device(path=path)
+            else:
+                self.device = hid.Device(vid=vid, pid=pid)
+
+        if self.device is None:
+            raise RuntimeError("Device not found")
+
+        print("Device connected.")
+
+    def find_devices(self, verbose: bool = True):
+        # one enumeration for all known devices, returns every attached one
+        found = []
+        if self.backend == 'libusb':
+            # a claimed device has no hidraw node, it would look unplugged to hid.enumerate()
+            from mcdu_libusb import enumerate_devices
+            attached = enumerate_devices()
+        else:
+            attached = hid.enumerate()
+        for d in self.devlist:
+            if verbose:
+                print(f"Searching for {d['name']}... ", end='')
+            matches = [dev for dev in attached
+                       if dev['vendor_id'] == d['vid'] and dev['product_id'] == d['pid']]
+            if not matches:
+                if verbose:
+                    print("not found")
+                continue
+            if verbose:
+                print("found" if len(matches) == 1 else f"found {len(matches)}")
+            for dev in matches:
+                found.append(dict(d, path=dev.get('path')))
+        return found
+
+
+# --- Page model and display ---
+
+
+class PageBuffer:
+    # Page model without a device: per line PAGE_CHARS_PER_LINE cells of
+    # color, small font flag and character
+
+    def __init__(self):
+        self.page = [[' ' for _ in range(PAGE_BYTES_PER_LINE)]
+                     for _ in range(PAGE_LINES)]
+
+    def empty_page(self):
+        self.page = [[' ' for _ in range(PAGE_BYTES_PER_LINE)]
+                     for _ in range(PAGE_LINES)]
+
+    def write_line_to_page(self, line, pos, text: str, color: str = 'W', font_small: bool = False):
+        if line < 0 or line >= PAGE_LINES:
+            raise ValueError("Line number out of range")
+        if pos < 0 or pos + len(text) > PAGE_CHARS_PER_LINE:
+            raise ValueError("Position number out of range")
+        if len(text) > PAGE_CHARS_PER_LINE:
+            raise ValueError("Text too long for line")
+
+        pos = pos * PAGE_BYTES_PER_CHAR
+        for c in range(len(text)):
+            self.page[line][pos + c * PAGE_BYTES_PER_CHAR] = color
+            self.page[line][pos + c * PAGE_BYTES_PER_CHAR + 1] = font_small
+            self.page[line][pos + c * PAGE_BYTES_PER_CHAR +
+                            PAGE_BYTES_PER_CHAR - 1] = text[c]
+
+
+class DisplayManager(PageBuffer):
+    col_map = {
+        'L': 0x0000,  # black with grey background
+        'A': 0x0021,  # amber
+        'W': 0x0042,  # white
+        'B': 0x0063,  # cyan
+        'G': 0x0084,  # green
+        'M': 0x00A5,  # magenta
+        'R': 0x00C6,  # red
+        'Y': 0x00E7,  # yellow
+        'E': 0x0108,  # grey
+        ' ': 0x0042  # use white
+    }
+    char_map = {  # page char -> utf-8 bytes sent to the MCDU
+        35: b'\xe2\x98\x90',  # # box
+        96: b'\xc2\xb0',  # °
+    }
+    # startup screen of the front end
+    title = ('MCDU for MSFS', 'FlyByWire SimBridge')
+    sim_name = 'SimBridge'
+    version = '0.1'
+
+    def __init__(self, device, device_path=None, warm_start=False):
+        super().__init__()
+        self.device = device
+        self.mirror = None  # optional TerminalMirror, gets every frame sent to the device
+        self.reports = ReportBuilder(PAGE_LINES * PAGE_CHARS_PER_LINE)  # reused for every frame
+        self._attrs = ({}, {})  # color -> attribute bytes, normal and small font
+        self._line_copies = [[None] * PAGE_BYTES_PER_LINE for _ in range(PAGE_LINES)]
+        self._encoded_lines = [None] * PAGE_LINES  # copies of the lines in the frame buffer
+        self._line_offsets = [0] * (PAGE_LINES + 1)  # where they start in it
+        self._encoded_vertslew = 0
+        # a device already initialized in this USB session keeps its screen
+        self.warm = warm_start and mcdu_init.is_initialized(device_path)
+        if not self.warm:
+            version = mcdu_init.send_init(device)
+            mcdu_init.mark_initialized(device_path, version)
+
+    def startupscreen(self, new_version: str = None):
+        self.clear()
+        self.write_line_to_page(0, 3, self.title[0], 'W')
+        self.write_line_to_page(1, 3, self.title[1], 'W')
+        self.write_line_to_page(12, 0, 'www.github.com/schenlap', 'W', True)
+        self.write_line_to_page(13, 0, '/winwing_mcdu', 'W', True)
+        self.write_line_to_page(8, 1, f'waiting for {self.sim_name} ', 'A')
+        self.write_line_to_page(3, 1, f'version {self.version}', 'W')
+        if new_version:
+            self.write_line_to_page(4, 1, f'New version {new_version}', 'A')
+            self.write_line_to_page(5, 1, 'available', 'A')
+        self.set_from_page()
+
+    def _data_from_col_font(self, color: str, font_small: bool = False):
+        if type(color) == int:
+            color = chr(color)
+        if color.upper() not in self.col_map:
+            raise ValueError(f"Invalid color '{color}'")
+        if font_small:
+            color = self.col_map[color.upper()] + 0x016b
+        else:
+            color = self.col_map[color.upper()]
+        data_low = color & 0x0ff
+        data_high = (color >> 8) & 0xff
+        return (data_low, data_high)
+
+    def clear(self):
+        blank_line = [0xf2] + [0x42, 0x00, ord(' ')] * PAGE_CHARS_PER_LINE
+        for _ in range(16):
+            self.device.write(bytes(blank_line))
+
+    def write_line_repeated(self, text: str, repeat: int = 16):
+        encoded = [ord(c) for c in text]
+        c = 0
+        for _ in range(repeat):
+            buf = [0xf2]
+            for _ in range(21):
+                buf.extend([0x42, 0x00, encoded[c]])
+                c = (c + 1) % len(encoded)
+            self.device.write(bytes(buf))
+
+    def set_from_page(self, page=None, vertslew_key=0, stale=False):
+        if page == None:  # use internal page
+            page = self.page
+        # encoded straight into the reused frame buffer, see mcdu_report.py,
+        # from the first line that differs from the last frame on
+        encoded_lines = self._encoded_lines
+        first = 0
+        while first < PAGE_LINES and page[first] == encoded_lines[first]:
+            first += 1
+        if vertslew_key != self._encoded_vertslew:
+            first = min(first, PAGE_LINES - 1)  # the arrows are in the last line
+        offsets = self._line_offsets
+        frame = self.reports.frame
+        attrs = self._attrs
+        char_map = self.char_map
+        n = offsets[first]
+        for i in range(first, PAGE_LINES):
+            offsets[i] = n
+            encoded_lines[i] = None  # until the line is complete
+            line = page[i]
+            for c in range(PAGE_CHARS_PER_LINE):
+                j = c * PAGE_BYTES_PER_CHAR
+                font_small = line[j + 1]
+                color = line[j]
+                cache = attrs[1 if font_small else 0]
+                attr = cache.get(color)
+                if attr is None:
+                    attr = cache[color] = self._data_from_col_font(color, font_small)
+                frame[n] = attr[0]
+                frame[n + 1] = attr[1]
+                n += 2
+                val = ord(line[j + PAGE_BYTES_PER_CHAR - 1])
+                encoded = char_map.get(val)
+                if encoded is None and i == PAGE_LINES - 1:
+                    if c == PAGE_CHARS_PER_LINE - 2 and (vertslew_key == 1 or vertslew_key == 2):
+                        encoded = ARROW_UP
+                    elif c == PAGE_CHARS_PER_LINE - 1 and (vertslew_key == 1 or vertslew_key == 3):
+                        encoded = ARROW_DOWN
+                if encoded is None:
+                    frame[n] = val
+                    n += 1
+                else:
+                    frame[n:n + len(encoded)] = encoded
+                    n += len(encoded)
+            encoded_lines[i] = self._line_copies[i]
+            encoded_lines[i][:] = line
+        offsets[PAGE_LINES] = n
+        self._encoded_vertslew = vertslew_key
+
+        # All reports are sent, also for a change in the last line only: the MCDU has
+        # no cell addressing, every report continues where the last one ended and the
+        # screen wraps after PAGE_LINES * PAGE_CHARS_PER_LINE cells. Reports of the
+        # scratchpad alone would be drawn from the top left.
+        reports = self.reports.reports
+        for r in range(self.reports.finish(n, offsets[first])):
+            self.device.write(reports[r])
+
+        if self.mirror:
+            self.mirror.update(page, vertslew_key, stale)
+
+
+# --- Input ---
+
+
+def read_buttons(name, get_device, button_events, on_error, ready=None, activity=None):
+    # The input thread of one MCDU: blocks in read() until the MCDU sends a report,
+    # nothing polls, and pushes every changed key to button_events.
+    # get_device() is asked before every read, the device may be reopened meanwhile.
+    # on_error(error) returns True if the device was replaced, the keys start released.
+    # ready (an Event) is waited for before every read, activity(source) is told of changes.
+    buttons_last = 0
+    while True:
+        if ready:
+            ready.wait()
+        device = get_device()
+        try:
+            data_in = device.read(0x81)
+        except Exception as error:
+            if on_error(error):
+                buttons_last = 0
+            continue
+        if len(data_in) == 14:  # we get this often but don't understand yet. May have someting to do with leds set
+            continue
+        if len(data_in) != 25:
+            print(f'rx data count {len(data_in)} not valid')
+            continue
+
+        # create button bit-pattern
+        buttons = report_buttons(data_in)
+        if buttons != buttons_last:
+            if activity:
+                activity('buttons')
+            if not button_events.push_report(buttons, buttons_last, getattr(device, 'last_read_ns', None)):
+                print(f' *** {name}: button events dropped, {button_events.overflows} so far ***')
+        buttons_last = buttons
+
+
+def input_error(error):
+    # on_error of read_buttons() for a device that is not reopened
+    print(f' *** continue after usb-in error: {error} ***')
+    sleep(0.5)
+    return False
+
+
+def dispatch_buttons(name, button_events, handle):
+    # the only consumer of button_events, handle(button_id, pressed) sends to the sim
+    while True:
+        button_id, pressed, timestamp = button_events.get()
+        try:
+            handle(button_id, pressed)
+        except Exception as error:
+            print(f' *** {name}: could not send button {button_id}: {error} ***')
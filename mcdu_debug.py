@@ -0,0 +1,234 @@
+# Debug hooks for a running bridge, to look into a session without restarting it.
+#   SIGUSR1             - sample all threads for PROFILE_SECONDS (30 s) and write the profile
+#   SIGUSR2             - heap snapshot (diff to the previous one) and the stacks of all threads
+#   debug socket        - the same as text commands, e.g.
+#                         echo "profile 60" | socat - UNIX-CONNECT:$XDG_RUNTIME_DIR/winwing-mcdu-debug-<pid>.sock
+#                         commands: profile [seconds], heap, stacks, all
+# Every result is written to a timestamped file in the debug directory
+# (default ~/.local/state/winwing_mcdu/debug/). The work runs in its own thread,
+# the signal handlers only start it.
+# The profiler samples sys._current_frames(), it sees every thread and costs
+# nothing while it is off. tracemalloc is started with the first heap snapshot,
+# that one is the baseline; it slows allocations down while it is on.
+
+import atexit
+import linecache
+import os
+import signal
+import socket
+import sys
+import tempfile
+import traceback
+import tracemalloc
+from collections import Counter
+from threading import Thread, Lock, current_thread, enumerate as threads
+from time import monotonic, sleep, strftime
+
+PROFILE_SECONDS = 30
+SAMPLE_INTERVAL = 0.005
+HEAP_FRAMES = 10       # stack depth kept by tracemalloc
+TOP = 40               # lines per table in the result files
+
+
+def default_debug_dir():
+    base = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(base, 'winwing_mcdu', 'debug')
+
+
+def socket_path(pid: int = None):
+    base = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(base, f'winwing-mcdu-debug-{pid or os.getpid()}.sock')
+
+
+def _location(frame):
+    code = frame.f_code
+    return f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}'
+
+
+def thread_stacks():
+    '''Text with the current stack of every thread.'''
+    names = {t.ident: t.name for t in threads()}
+    out = []
+    for ident, frame in sys._current_frames().items():
+        out.append(f'--- thread {names.get(ident, "?")} ({ident})\n')
+        out.extend(traceback.format_stack(frame))
+    return ''.join(out)
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()   # (thread name, 'a;b;c') -> samples, collapsed stacks, outermost first
+        self.own = Counter()      # location -> samples on top of a stack
+        self.total = Counter()    # location -> samples anywhere in a stack
+
+    def run(self, seconds: float):
+        me = current_thread().ident
+        end = monotonic() + seconds
+        while monotonic() < end:
+            names = {t.ident: t.name for t in threads()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or names.get(ident, '').startswith('debug'):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_location(frame))
+                    frame = frame.f_back
+                self.own[stack[0]] += 1
+                self.total.update(set(stack))
+                self.stacks[(names.get(ident, str(ident)), ';'.join(reversed(stack)))] += 1
+            self.samples += 1
+            sleep(self.interval)
+
+    def report(self):
+        out = [f'{self.samples} samples every {self.interval * 1000:.1f} ms\n',
+               '\n--- own samples (on top of the stack, waiting included)\n']
+        out += [f'{n:8} {n * 100 / max(self.samples, 1):6.1f}%  {loc}\n' for loc, n in self.own.most_common(TOP)]
+        out.append('\n--- total samples (anywhere in the stack)\n')
+        out += [f'{n:8} {n * 100 / max(self.samples, 1):6.1f}%  {loc}\n' for loc, n in self.total.most_common(TOP)]
+        return ''.join(out)
+
+    def collapsed(self):
+        # input for flamegraph.pl / speedscope
+        return ''.join(f'{name};{stack} {n}\n' for (name, stack), n in self.stacks.most_common())
+
+
+class DebugHooks:
+    def __init__(self, directory: str = None, profile_seconds: float = PROFILE_SECONDS):
+        self.directory = directory or default_debug_dir()
+        self.profile_seconds = profile_seconds
+        self._snapshot = None
+        self._lock = Lock()          # one heap snapshot at a time
+        self._profiling = False
+        self._sock = None
+
+    def install(self, listen: bool = True):
+        '''Install the signal handlers (main thread only) and start the debug socket.'''
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.trigger('profile'))
+            signal.signal(signal.SIGUSR2, lambda signum, frame: self.trigger('heap', 'stacks'))
+        if listen and hasattr(socket, 'AF_UNIX'):
+            self._listen()
+
+    def trigger(self, *commands):
+        # runs in a signal handler, the work is done elsewhere
+        Thread(target=self.run, args=commands, name='debug hooks', daemon=True).start()
+
+    def run(self, *commands, seconds: float = None):
+        '''Run the commands, return the files written.'''
+        files = []
+        for command in commands:
+            try:
+                if command == 'profile':
+                    files += self.profile(seconds or self.profile_seconds)
+                elif command == 'heap':
+                    files.append(self.heap())
+                elif command == 'stacks':
+                    files.append(self.stacks())
+                else:
+                    print(f"debug: unknown command {command}")
+            except Exception as error:
+                print(f"debug: {command} failed: {error}")
+        return [f for f in files if f]
+
+    def profile(self, seconds: float):
+        if self._profiling:
+            print("debug: profiler already running")
+            return []
+        self._profiling = True
+        try:
+            print(f"debug: profiling for {seconds:g} s")
+            profiler = SamplingProfiler()
+            profiler.run(seconds)
+            files = [self._write('profile', profiler.report()), self._write('profile', profiler.collapsed(), 'folded')]
+        finally:
+            self._profiling = False
+        print(f"debug: profile written to {files[0]}")
+        return files
+
+    def heap(self):
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(HEAP_FRAMES)
+                print("debug: tracemalloc started, the next heap snapshot shows the growth from now")
+            snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, linecache.__file__),   # source lines of the stack dumps
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ])
+            current, peak = tracemalloc.get_traced_memory()
+            out = [f'traced {current / 1024:.0f} KiB, peak {peak / 1024:.0f} KiB\n']
+            if self._snapshot is not None:
+                out.append('\n--- growth since the last snapshot\n')
+                out += [f'{stat}\n' for stat in snapshot.compare_to(self._snapshot, 'lineno')[:TOP]]
+                out.append('\n--- biggest growth by stack\n')
+                for stat in snapshot.compare_to(self._snapshot, 'traceback')[:5]:
+                    out.append(f'\n{stat}\n')
+                    out += [f'    {line}\n' for line in stat.traceback.format()]
+            out.append('\n--- biggest allocations\n')
+            out += [f'{stat}\n' for stat in snapshot.statistics('lineno')[:TOP]]
+            self._snapshot = snapshot
+        path = self._write('heap', ''.join(out))
+        print(f"debug: heap snapshot written to {path}")
+        return path
+
+    def stacks(self):
+        path = self._write('stacks', thread_stacks())
+        print(f"debug: thread stacks written to {path}")
+        return path
+
+    def close(self):
+        if self._sock:
+            path = self._sock.getsockname()
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+    def _write(self, kind, text, suffix='txt'):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{kind}-{strftime("%Y%m%d-%H%M%S")}-{os.getpid()}.{suffix}')
+        with open(path, 'w') as f:
+            f.write(text)
+        return path
+
+    def _listen(self):
+        path = socket_path()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            old_umask = os.umask(0o177)   # only for the user running the bridge
+            try:
+                sock.bind(path)
+            finally:
+                os.umask(old_umask)
+            sock.listen(1)
+        except OSError as error:
+            print(f"debug: no debug socket: {error}")
+            sock.close()
+            return
+        self._sock = sock
+        atexit.register(self.close)
+        Thread(target=self._serve, name='debug socket', daemon=True).start()
+
+    def _serve(self):
+        while self._sock:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return
+            with conn:
+                try:
+                    words = conn.makefile().readline().split()
+                    seconds = float(words[1]) if len(words) > 1 and words[0] == 'profile' else None
+                    commands = ['profile', 'heap', 'stacks'] if words[:1] == ['all'] else words[:1]
+                    files = self.run(*commands, seconds=seconds)
+                    conn.sendall(''.join(f'{f}\n' for f in files).encode())
+                except (OSError, ValueError) as error:
+                    print(f"debug: socket command failed: {error}")
@@ -0,0 +1,63 @@
+# Decoding of the SimBridge MCDU updates.
+# An update is {"left": {...}, "right": {...}}. Only the sides with an MCDU are
+# decoded: the top level keys are found with str.find() and only their values are
+# handed to the JSON parser. orjson is used when it is installed (pip install
+# orjson), the stdlib json module otherwise. Anything unexpected in the payload
+# falls back to decoding all of it.
+
+import json
+
+try:
+    import orjson
+    loads = orjson.loads
+    BACKEND = 'orjson'
+except ImportError:
+    loads = json.loads
+    BACKEND = 'json'
+
+SIDES = ('left', 'right')
+_KEYS = tuple((side, f'"{side}":') for side in SIDES)
+
+
+def decode_all(payload: str):
+    return loads(payload)
+
+
+def find_sides(payload: str):
+    '''Return [(start of the key, start of the value, side)] of the side keys in order,
+    None if the payload does not look like a compact SimBridge update.'''
+    found = []
+    for side, key in _KEYS:
+        i = payload.find(key)
+        if i >= 0:
+            found.append((i, i + len(key), side))
+        elif f'"{side}"' in payload:
+            return None  # written with blanks
+    found.sort()
+    # a '"' inside a string is always escaped, so these are keys. The first one is a top
+    # level key, if a later one is nested its value or the one before it does not parse.
+    if found and (payload[:found[0][0]].strip() != '{' or any(payload[i - 1] != ',' for i, _, _ in found[1:])):
+        return None
+    return found
+
+
+def decode_update(payload: str, sides):
+    '''Return {side: data} for the wanted sides of an update payload (without the "update:" prefix).'''
+    found = find_sides(payload)
+    if found is None or all(side in sides for _, _, side in found):
+        return _pick(decode_all(payload), sides)  # nothing to skip
+    result = {}
+    for n, (_, start, side) in enumerate(found):
+        if side not in sides:
+            continue
+        # the value ends at the ',' before the next side key, the last one at the closing brace
+        end = found[n + 1][0] - 1 if n + 1 < len(found) else payload.rindex('}')
+        try:
+            result[side] = loads(payload[start:end])
+        except ValueError:
+            return _pick(decode_all(payload), sides)  # there is more than the side keys
+    return result
+
+
+def _pick(update, sides):
+    return {side: update[side] for side in sides if side in update}
@@ -0,0 +1,119 @@
+# Emulated MCDU for benchmarks and checks without the hardware.
+# EmulatedDevice takes the HID reports like a hid.device: the display reports
+# (0xf2) are decoded into a screen of cells, the LED reports into a dict, and
+# read() returns the button reports queued with press()/release().
+# report_rate models the USB link, every write takes 1/report_rate seconds.
+
+from collections import deque
+from threading import Condition
+from time import perf_counter, sleep
+
+LINES = 14
+CHARS_PER_LINE = 24
+CELLS = LINES * CHARS_PER_LINE
+REPORT_SIZE = 64
+REPORT_RATE = 1000  # reports per second, USB full speed interrupt endpoint
+
+
+class EmulatedDevice:
+    def __init__(self, report_rate: float = REPORT_RATE):
+        self.interval = 1.0 / report_rate if report_rate else 0
+        self.screen = [[(' ', 0)] * CHARS_PER_LINE for _ in range(LINES)]  # (char, attribute)
+        self.leds = {}
+        self.writes = 0
+        self.frames = 0  # complete screens received
+        self.frame_time = None  # perf_counter() when the last screen was complete
+        self._cell = 0
+        self._pending = b''  # a cell split over two reports
+        self._reads = deque()
+        self._buttons = 0
+        self._changed = Condition()
+
+    # --- hid.device ---
+
+    def open(self, vid, pid):
+        pass
+
+    def open_path(self, path):
+        pass
+
+    def set_nonblocking(self, value):
+        pass
+
+    def close(self):
+        pass
+
+    def write(self, data):
+        data = bytes(data[:REPORT_SIZE])  # the rest of a longer write does not reach the MCDU
+        if self.interval:
+            sleep(self.interval)
+        self.writes += 1
+        if data[0] == 0xf2:
+            self._display(data[1:])
+        elif data[0] == 0x02 and len(data) > 8 and data[5:7] == b'\x03\x49':
+            with self._changed:
+                self.leds[data[7]] = data[8]
+                self._changed.notify_all()
+        return len(data)
+
+    def read(self, max_length, timeout_ms=0):
+        with self._changed:
+            if not self._reads:
+                self._changed.wait(timeout_ms / 1000 if timeout_ms else None)
+            if not self._reads:
+                return []
+            return self._reads.popleft()
+
+    # --- test side ---
+
+    def press(self, button: int):
+        self._queue_buttons(self._buttons | 1 << button)
+
+    def release(self, button: int):
+        self._queue_buttons(self._buttons & ~(1 << button))
+
+    def row_text(self, line: int):
+        return ''.join(char for char, _ in self.screen[line])
+
+    def wait_for(self, condition, timeout: float = 5.0):
+        '''Wait until condition(device) is true after a complete screen, returns the time it got true.'''
+        end = perf_counter() + timeout
+        with self._changed:
+            while not condition(self):
+                if not self._changed.wait(end - perf_counter()):
+                    return None
+            return self.frame_time
+
+    def _queue_buttons(self, buttons):
+        self._buttons = buttons
+        with self._changed:
+            self._reads.append([0x01] + list(buttons.to_bytes(12, 'little')) + [0] * 12)
+            self._changed.notify_all()
+
+    def _display(self, payload: bytes):
+        with self._changed:
+            data = self._pending + payload
+            self._pending = b''
+            i = 0
+            while i < len(data):
+                # a cell: attribute low, high, then one utf-8 char
+                if i + 3 > len(data):
+                    self._pending = data[i:]  # continues in the next report
+                    return
+                lead = data[i + 2]
+                size = 3 if lead < 0xc0 else 4 if lead < 0xe0 else 5
+                if i + size > len(data):
+                    self._pending = data[i:]
+                    return
+                line, column = divmod(self._cell, CHARS_PER_LINE)
+                self.screen[line][column] = (data[i + 2:i + size].decode('utf-8', errors='replace'),
+                                             data[i] | data[i + 1] << 8)
+                i += size
+                self._cell += 1
+                if self._cell == CELLS:
+                    self._cell = 0
+                    self.frames += 1
+                    self.frame_time = perf_counter()
+                    self._changed.notify_all()
+                    if not any(data[i:]):
+                        return  # the rest of the report is padding
@@ -0,0 +1,90 @@
+# Hot-plug events for the Winwing devices.
+# Listens to the kernel/udev uevents on a netlink socket (Linux only) and calls back
+# on hidraw add/remove of Winwing devices, so nothing polls while a device is unplugged.
+
+import re
+import socket
+import struct
+from threading import Thread
+
+NETLINK_KOBJECT_UEVENT = 15
+GROUP_KERNEL = 1   # sent by the kernel as soon as the device node exists
+GROUP_UDEV = 2     # sent by udev after the rules ran (permissions from udev/71-winwing.rules)
+UDEV_PREFIX = b'libudev\0'
+VENDOR_ID = 0x4098  # Winwing
+# the HID device in DEVPATH: bus:vendor:product.instance, e.g. .../0003:4098:BB36.0001/hidraw/hidraw3
+HID_DEVICE = re.compile(r'/([0-9A-Fa-f]{4}):([0-9A-Fa-f]{4}):([0-9A-Fa-f]{4})\.[0-9A-Fa-f]+/')
+
+
+def parse_uevent(data: bytes):
+    '''Return the properties of a kernel or udev uevent message as a dict.'''
+    if data.startswith(UDEV_PREFIX):
+        # libudev header: prefix, magic, header size, properties offset, properties length
+        offset, length = struct.unpack_from('=II', data, 16)
+        fields = data[offset:offset + length].split(b'\0')
+    else:
+        fields = data.split(b'\0')[1:]  # first field is 'action@devpath'
+    props = {}
+    for field in fields:
+        key, sep, value = field.partition(b'=')
+        if sep:
+            props[key.decode(errors='replace')] = value.decode(errors='replace')
+    return props
+
+
+def vendor_id(props):
+    '''USB vendor id of the HID device of a uevent, None if it does not say.'''
+    hid_id = props.get('HID_ID')  # e.g. 0003:00004098:0000BB36, on events of the HID device
+    if hid_id:
+        try:
+            return int(hid_id.split(':')[1], 16)
+        except (IndexError, ValueError):
+            return None
+    # a hidraw event only has the path, remove events included
+    match = HID_DEVICE.search(props.get('DEVPATH', ''))
+    return int(match.group(2), 16) if match else None
+
+
+class UeventMonitor:
+    def __init__(self, callback, subsystem: str = 'hidraw', vendor: int = VENDOR_ID):
+        self.callback = callback  # callable(action, props)
+        self.subsystem = subsystem
+        self.vendor = vendor  # other vendors are dropped, None: all; unknown vendor: passed on
+        self.available = False
+        self._sock = None
+
+    def start(self):
+        '''Start listening, returns False if uevents are not available on this system.'''
+        if not hasattr(socket, 'AF_NETLINK'):
+            return False
+        try:
+            self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, NETLINK_KOBJECT_UEVENT)
+            self._sock.bind((0, GROUP_KERNEL | GROUP_UDEV))  # port id assigned by the kernel
+        except OSError as error:
+            print(f"no hot-plug events: {error}")
+            return False
+        self.available = True
+        Thread(target=self._run, name='uevent monitor', daemon=True).start()
+        return True
+
+    def _run(self):
+        while True:
+            try:
+                data = self._sock.recv(16384)
+            except OSError as error:
+                print(f"hot-plug events stopped: {error}")
+                self.available = False
+                self.callback(None, {})
+                return
+            props = parse_uevent(data)
+            action = props.get('ACTION')
+            if self.wanted(action, props):
+                self.callback(action, props)
+
+    def wanted(self, action, props):
+        if props.get('SUBSYSTEM') != self.subsystem or action not in ('add', 'remove'):
+            return False
+        if self.vendor is None:
+            return True
+        vendor = vendor_id(props)
+        return vendor is None or vendor == self.vendor
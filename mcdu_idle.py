@@ -0,0 +1,105 @@
+# Idle detection for the bridges.
+# Every input report and every update from the simulator is reported as activity.
+# After IDLE_AFTER s without any the bridge is idle: the loops that have a period
+# park in wait_active() until the next activity, which ends the idle mode at once.
+# When it ends, the wakeups per second (context switches of all threads of the
+# process) and the CPU use of the idle period are printed.
+# The monitor thread wakes at most every IDLE_AFTER s while active and not at all
+# while idle.
+
+import os
+from collections import Counter
+from threading import Thread, Condition
+from time import monotonic
+
+IDLE_AFTER = 10.0  # seconds without input or updates
+
+
+def context_switches():
+    '''Voluntary + involuntary context switches of all threads, None if unknown (not Linux).'''
+    total = 0
+    try:
+        tasks = os.listdir('/proc/self/task')
+    except OSError:
+        return None
+    for task in tasks:
+        try:
+            with open(f'/proc/self/task/{task}/status') as f:
+                for line in f:
+                    if 'ctxt_switches:' in line:   # voluntary_ctxt_switches, nonvoluntary_ctxt_switches
+                        total += int(line.split()[1])
+        except (OSError, ValueError):
+            pass  # thread ended meanwhile
+    return total
+
+
+def cpu_seconds():
+    t = os.times()
+    return t.user + t.system
+
+
+class IdleMonitor:
+    def __init__(self, idle_after: float = IDLE_AFTER, verbose: bool = True):
+        self.idle_after = idle_after
+        self.verbose = verbose
+        self.idle = False
+        self.activity_counts = Counter()  # source -> activity count
+        self.idle_periods = 0
+        self.last_report = None           # stats of the last idle period
+        self._last_activity = monotonic()
+        self._idle_since = None           # (monotonic, cpu seconds, context switches)
+        self._changed = Condition()
+
+    def start(self):
+        Thread(target=self._run, name='idle monitor', daemon=True).start()
+        return self
+
+    def activity(self, source: str):
+        self.activity_counts[source] += 1
+        self._last_activity = monotonic()
+        if self.idle:
+            report = None  # only the thread that ends idle mode reports it
+            with self._changed:
+                if self.idle:
+                    self.idle = False
+                    report = self._report()
+                    self._changed.notify_all()
+            if report and self.verbose:
+                print(f"active again ({source}) after {report}")
+
+    def wait_active(self):
+        '''Block while the bridge is idle.'''
+        with self._changed:
+            while self.idle:
+                self._changed.wait()
+
+    def _run(self):
+        with self._changed:
+            while True:
+                if self.idle:
+                    self._changed.wait()
+                    continue
+                left = self._last_activity + self.idle_after - monotonic()
+                if left > 0:
+                    self._changed.wait(left)
+                    continue
+                self.idle = True
+                self.idle_periods += 1
+                self._idle_since = (monotonic(), cpu_seconds(), context_switches())
+                if self.verbose:
+                    print(f"idle, no input or updates for {self.idle_after:.0f} s")
+
+    def _stats(self):
+        start, cpu, switches = self._idle_since
+        seconds = max(monotonic() - start, 1e-9)
+        now_switches = context_switches()
+        return {
+            'seconds': seconds,
+            'cpu_percent': (cpu_seconds() - cpu) * 100 / seconds,
+            'wakeups_per_s': (now_switches - switches) / seconds if switches is not None else None,
+        }
+
+    def _report(self):
+        self.last_report = stats = self._stats()
+        wakeups = f"{stats['wakeups_per_s']:.1f} wakeups/s" if stats['wakeups_per_s'] is not None else 'wakeups unknown'
+        return f"{stats['seconds']:.0f} s idle: {wakeups}, {stats['cpu_percent']:.2f}% CPU"
@@ -0,0 +1,121 @@
+# Init sequence of the Winwing MCDU display.
+# The 0xf0 reports are kept in mcdu_init.bin (header: magic, version, report count,
+# then every report prefixed with its length) and are sent as one batch.
+# A marker per USB session remembers that a device was initialized, so a restart of
+# the bridge can skip the init and does not blank the screen. The marker is bound to
+# the boot (Linux boot_id, kern.boottime on macOS/BSD); without a boot identity
+# there is no marker and the init is always sent.
+
+import hashlib
+import os
+import struct
+import tempfile
+
+INIT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mcdu_init.bin')
+MAGIC = b'WWMI'
+HEADER = struct.Struct('<4sHH')   # magic, version, report count
+REPORT_LEN = struct.Struct('<H')
+
+_cache = None
+_boot_id = None
+
+
+def load_init_reports(path: str = INIT_FILE):
+    '''Return (version, [report bytes]) from an init blob.'''
+    global _cache
+    if _cache and _cache[0] == path:
+        return _cache[1]
+    with open(path, 'rb') as f:
+        blob = f.read()
+    magic, version, count = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not an MCDU init blob')
+    reports = []
+    offset = HEADER.size
+    for _ in range(count):
+        if offset + REPORT_LEN.size > len(blob):
+            break
+        n, = REPORT_LEN.unpack_from(blob, offset)
+        offset += REPORT_LEN.size
+        reports.append(blob[offset:offset + n])
+        offset += n
+    if len(reports) != count or offset > len(blob):
+        raise ValueError(f'{path} is truncated')
+    _cache = (path, (version, reports))
+    return version, reports
+
+
+def save_init_reports(reports, version: int, path: str = INIT_FILE):
+    blob = [HEADER.pack(MAGIC, version, len(reports))]
+    for report in reports:
+        blob.append(REPORT_LEN.pack(len(report)) + bytes(report))
+    with open(path, 'wb') as f:
+        f.write(b''.join(blob))
+
+
+def send_init(device, path: str = INIT_FILE):
+    version, reports = load_init_reports(path)
+    write = device.write
+    for report in reports:
+        write(report)
+    return version
+
+
+def boot_id():
+    '''Identity of the running boot, '' if this system has none we can read.'''
+    global _boot_id
+    if _boot_id is None:
+        _boot_id = ''
+        try:
+            with open('/proc/sys/kernel/random/boot_id') as f:
+                _boot_id = f.read().strip()
+        except OSError:
+            import subprocess
+            try:
+                # macOS, BSD: "{ sec = 1700000000, usec = 123456 } Tue Nov 14 ..."
+                result = subprocess.run(['sysctl', '-n', 'kern.boottime'], capture_output=True,
+                                        text=True, timeout=2)
+                if result.returncode == 0:
+                    _boot_id = result.stdout.strip()
+            except (OSError, subprocess.SubprocessError):
+                pass
+    return _boot_id
+
+
+def _marker_path(device_path, version):
+    # the key changes when the device is plugged in again (new device node) or on reboot,
+    # None without a boot identity: a marker from before a reboot would be trusted
+    boot = boot_id()
+    if not boot:
+        return None
+    if isinstance(device_path, bytes):
+        device_path = device_path.decode(errors='replace')
+    key = [str(device_path), str(version), boot]
+    try:
+        key.append(str(os.stat(device_path).st_ctime_ns))
+    except (OSError, ValueError):
+        pass
+    name = 'winwing-mcdu-' + hashlib.sha1('|'.join(key).encode()).hexdigest()[:16]
+    return os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(), name)
+
+
+def is_initialized(device_path, path: str = INIT_FILE) -> bool:
+    if not device_path:
+        return False
+    try:
+        version, _ = load_init_reports(path)
+    except (OSError, ValueError):
+        return False
+    marker = _marker_path(device_path, version)
+    return marker is not None and os.path.exists(marker)
+
+
+def mark_initialized(device_path, version: int):
+    marker = _marker_path(device_path, version) if device_path else None
+    if not marker:
+        return
+    try:
+        with open(marker, 'w'):
+            pass
+    except OSError as error:
+        print(f"could not write init marker: {error}")
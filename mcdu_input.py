@@ -0,0 +1,73 @@
+# Button events from the MCDU input reader to the command dispatch.
+# The reader pushes one (button id, pressed, timestamp) event per changed bit into a
+# bounded ring, the dispatcher pops them in order. One producer and one consumer,
+# so the ring itself needs no lock; a full ring drops the event and counts it.
+
+from threading import Event
+from time import monotonic_ns
+
+RING_SIZE = 256
+
+
+def report_buttons(data_in):
+    '''Button bit field of a 25 byte MCDU input report.'''
+    return int.from_bytes(bytes(data_in[1:13]), 'little')
+
+
+def changed_buttons(buttons: int, buttons_last: int):
+    '''Yield (button id, pressed) for every bit that differs, lowest id first.'''
+    changed = buttons ^ buttons_last
+    while changed:
+        bit = changed & -changed
+        yield bit.bit_length() - 1, bool(buttons & bit)
+        changed ^= bit
+
+
+class ButtonEventRing:
+    def __init__(self, size: int = RING_SIZE):
+        self.size = size
+        self._slots = [None] * size
+        self._head = 0   # written by the producer only
+        self._tail = 0   # written by the consumer only
+        self._ready = Event()
+        self.overflows = 0
+
+    def push(self, button: int, pressed: bool, timestamp: int = None):
+        if self._head - self._tail >= self.size:
+            self.overflows += 1
+            return False
+        self._slots[self._head % self.size] = (button, pressed, timestamp or monotonic_ns())
+        self._head += 1  # publish after the slot is written
+        self._ready.set()
+        return True
+
+    def push_report(self, buttons: int, buttons_last: int, timestamp: int = None):
+        '''Push the events between two button bit fields, returns False if one was dropped.'''
+        timestamp = timestamp or monotonic_ns()
+        ok = True
+        for button, pressed in changed_buttons(buttons, buttons_last):
+            ok = self.push(button, pressed, timestamp) and ok
+        return ok
+
+    def pop(self):
+        if self._tail == self._head:
+            return None
+        event = self._slots[self._tail % self.size]
+        self._tail += 1
+        return event
+
+    def get(self, timeout: float = None):
+        '''Next event, blocks until there is one (or None after timeout).'''
+        while True:
+            event = self.pop()
+            if event is not None:
+                return event
+            self._ready.clear()
+            event = self.pop()  # pushed between pop() and clear()
+            if event is not None:
+                return event
+            if not self._ready.wait(timeout) and timeout is not None:
+                return None
+
+    def __len__(self):
+        return self._head - self._tail
@@ -0,0 +1,249 @@
+# libusb backend for the MCDU with asynchronous transfers (simbridge.py --usb-backend libusb).
+# Needs python-libusb1 (pip install libusb1). LibusbDevice has the interface of a
+# hid.device: open()/open_path(), read(), write(), close().
+#   input   IN_TRANSFERS interrupt IN transfers are always submitted, a completed
+#           one is resubmitted from its callback before read() even sees the report,
+#           so the endpoint is polled while a frame is written
+#   output  write() copies the report into an OUT transfer, submits it and returns;
+#           up to OUT_TRANSFERS reports of a frame are on the bus at once. Transfers
+#           on one endpoint complete in order. write() blocks while all are in flight.
+# One thread per device runs the libusb event loop, it sleeps in libusb until a
+# transfer completes. A failed transfer (e.g. unplugged) makes the next read() or
+# write() raise OSError, like hidapi.
+# Claiming the interface detaches the kernel HID driver, the hidraw node of the
+# device goes away until close(). So with this backend devices are enumerated
+# through libusb (enumerate_devices()), paths are libusb:<bus>:<address>.
+
+import os
+from collections import deque
+from threading import Thread, Condition
+from time import monotonic, monotonic_ns
+
+import usb1
+
+INTERFACE = 0
+ENDPOINT_IN = 0x81
+REPORT_SIZE = 64
+IN_TRANSFERS = 4
+OUT_TRANSFERS = 8
+QUEUE_SIZE = 256  # input reports not read yet, the oldest is dropped
+SET_REPORT = 0x09
+HID_OUTPUT_REPORT = 0x02
+
+
+def enumerate_devices():
+    '''hid.enumerate() through libusb, lists devices claimed by this or another process too.'''
+    context = usb1.USBContext()
+    if hasattr(context, 'open'):
+        context.open()
+    try:
+        return [{'vendor_id': device.getVendorID(), 'product_id': device.getProductID(),
+                 'path': f'libusb:{device.getBusNumber()}:{device.getDeviceAddress()}'.encode()}
+                for device in context.getDeviceIterator(skip_on_error=True)]
+    finally:
+        context.close()
+
+
+def usb_address(path):
+    '''(bus, address) of a libusb: path or of the USB device behind a hidraw path,
+    None if unknown (not Linux).'''
+    if isinstance(path, bytes):
+        path = path.decode(errors='replace')
+    if path and path.startswith('libusb:'):
+        try:
+            bus, address = path[len('libusb:'):].split(':')
+            return int(bus), int(address)
+        except ValueError:
+            return None
+    if not path or not path.startswith('/dev/hidraw'):
+        return None
+    try:
+        # /sys/class/hidraw/hidrawN/device -> .../<usb device>/<interface>/<hid device>
+        usb_device = os.path.realpath(f'/sys/class/hidraw/{os.path.basename(path)}/device/../..')
+        with open(os.path.join(usb_device, 'busnum')) as f:
+            bus = int(f.read())
+        with open(os.path.join(usb_device, 'devnum')) as f:
+            address = int(f.read())
+    except (OSError, ValueError):
+        return None
+    return bus, address
+
+
+class LibusbDevice:
+    def __init__(self):
+        self._context = None
+        self._handle = None
+        self._endpoint_out = None
+        self._in = []
+        self._out = []
+        self._out_free = []
+        self._out_busy = 0
+        self._reports = deque(maxlen=QUEUE_SIZE)
+        self._changed = Condition()
+        self._error = None
+        self._closing = False
+        self._thread = None
+        self.last_read_ns = None  # when the report returned by the last read() arrived
+        self.dropped = 0          # input reports dropped because the queue was full
+
+    # --- hid.device ---
+
+    def open(self, vid, pid, path=None):
+        # path: libusb:<bus>:<address> of enumerate_devices() or a hidraw path, picks one of several
+        # devices with the same ids
+        self._context = usb1.USBContext()
+        if hasattr(self._context, 'open'):
+            self._context.open()
+        address = usb_address(path)
+        for device in self._context.getDeviceIterator(skip_on_error=True):
+            if address:
+                if (device.getBusNumber(), device.getDeviceAddress()) != address:
+                    continue
+            elif device.getVendorID() != vid or device.getProductID() != pid:
+                continue
+            self._handle = device.open()
+            self._endpoint_out = self._find_endpoint_out(device)
+            break
+        else:
+            self._context.close()
+            raise OSError(f'USB device {path or f"{vid:04x}:{pid:04x}"} not found')
+        self._handle.setAutoDetachKernelDriver(True)
+        self._handle.claimInterface(INTERFACE)
+        for _ in range(IN_TRANSFERS):
+            transfer = self._handle.getTransfer()
+            transfer.setInterrupt(ENDPOINT_IN, REPORT_SIZE, callback=self._on_read)
+            transfer.submit()
+            self._in.append(transfer)
+        self._out = [self._handle.getTransfer() for _ in range(OUT_TRANSFERS if self._endpoint_out else 0)]
+        self._out_free = list(self._out)
+        self._thread = Thread(target=self._events, name='libusb events', daemon=True)
+        self._thread.start()
+
+    def open_path(self, path):
+        self.open(None, None, path)
+
+    def set_nonblocking(self, value):
+        pass
+
+    def read(self, max_length, timeout_ms=0):
+        '''Next input report as a list of ints, [] after timeout_ms (0: wait for one).'''
+        end = monotonic() + timeout_ms / 1000 if timeout_ms else None
+        with self._changed:
+            while not self._reports:
+                if self._error:
+                    raise OSError(self._error)
+                if end is None:
+                    self._changed.wait()
+                elif not self._changed.wait(end - monotonic()):
+                    return []
+            self.last_read_ns, data = self._reports.popleft()
+        return list(data[:max_length])
+
+    def write(self, data):
+        data = bytes(data)  # the caller may refill its buffer as soon as write() returns
+        if not self._endpoint_out:
+            # no interrupt OUT endpoint: SET_REPORT on the control endpoint, synchronous
+            self._handle.controlWrite(usb1.TYPE_CLASS | usb1.RECIPIENT_INTERFACE, SET_REPORT,
+                                      HID_OUTPUT_REPORT << 8 | data[0], INTERFACE, data)
+            return len(data)
+        with self._changed:
+            while not self._out_free:
+                if self._error:
+                    raise OSError(self._error)
+                self._changed.wait()
+            if self._error:
+                raise OSError(self._error)
+            transfer = self._out_free.pop()
+            self._out_busy += 1
+        transfer.setInterrupt(self._endpoint_out, data, callback=self._on_written)
+        try:
+            transfer.submit()
+        except usb1.USBError as error:
+            with self._changed:
+                self._out_free.append(transfer)
+                self._out_busy -= 1
+            raise OSError(str(error)) from error
+        return len(data)
+
+    def close(self):
+        if not self._handle or self._closing:
+            return
+        self._closing = True
+        for transfer in self._in + self._out:
+            try:
+                if transfer.isSubmitted():
+                    transfer.cancel()
+            except usb1.USBError:
+                pass
+        with self._changed:
+            self._changed.notify_all()
+        if self._thread:
+            self._thread.join(1)
+        try:
+            self._handle.releaseInterface(INTERFACE)
+        except usb1.USBError:
+            pass  # unplugged
+        self._handle.close()
+        self._context.close()
+        self._handle = None
+
+    # --- libusb side ---
+
+    @staticmethod
+    def _find_endpoint_out(device):
+        for setting in device.iterSettings():
+            if setting.getNumber() != INTERFACE:
+                continue
+            for endpoint in setting.iterEndpoints():
+                if not endpoint.getAddress() & 0x80:
+                    return endpoint.getAddress()
+        return None
+
+    def _events(self):
+        # sleeps in libusb until a transfer completes, ends when all are cancelled
+        while not self._closing or any(t.isSubmitted() for t in self._in) or self._out_busy:
+            try:
+                self._context.handleEvents()
+            except usb1.USBErrorInterrupted:
+                continue
+            except usb1.USBError as error:
+                self._fail(str(error))
+                break
+
+    def _on_read(self, transfer):
+        status = transfer.getStatus()
+        if status == usb1.TRANSFER_COMPLETED:
+            data = bytes(transfer.getBuffer()[:transfer.getActualLength()])
+            now = monotonic_ns()
+            if not self._closing:
+                self._resubmit(transfer)  # back in the queue before anything else
+            with self._changed:
+                if len(self._reports) == self._reports.maxlen:
+                    self.dropped += 1
+                self._reports.append((now, data))
+                self._changed.notify_all()
+        elif status == usb1.TRANSFER_TIMED_OUT and not self._closing:
+            self._resubmit(transfer)
+        elif status != usb1.TRANSFER_CANCELLED:
+            self._fail(f'input transfer failed (status {status})')
+
+    def _resubmit(self, transfer):
+        try:
+            transfer.submit()
+        except usb1.USBError as error:
+            self._fail(f'input transfer not resubmitted ({error})')
+
+    def _on_written(self, transfer):
+        status = transfer.getStatus()
+        with self._changed:
+            self._out_free.append(transfer)
+            self._out_busy -= 1
+            self._changed.notify_all()
+        if status not in (usb1.TRANSFER_COMPLETED, usb1.TRANSFER_CANCELLED):
+            self._fail(f'output transfer failed (status {status})')
+
+    def _fail(self, error):
+        with self._changed:
+            if not self._error:
+                self._error = error
+            self._changed.notify_all()
@@ -0,0 +1,156 @@
+# Report pacing for the MCDU display.
+# The self-test pushes test patterns at increasing report rates and records the
+# highest rate the device takes without failed or blocking writes in a calibration
+# file. At runtime ReportPacer keeps the writes of a device at that rate.
+
+import json
+import os
+import zlib
+from time import perf_counter, sleep, strftime
+
+RATES = (250, 500, 1000, 2000, 4000, 8000, 0)  # reports per second, 0 = as fast as possible
+STEP_SECONDS = 2.0
+MIN_ACHIEVED = 0.95     # of the requested rate, less means the device/USB stack holds us back
+MAX_P99_MS = 20.0       # a step with slower writes is not sustainable
+SAFETY = 0.9            # runtime rate relative to the measured one
+BURST = 8               # reports that may go out back to back after a pause
+
+
+def default_calibration_file():
+    base = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(base, 'winwing_mcdu', 'calibration.json')
+
+
+def load_calibration(path: str = None):
+    try:
+        with open(path or default_calibration_file()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        print(f"calibration file ignored: {error}")
+        return {}
+
+
+def save_calibration(key: str, result: dict, path: str = None):
+    path = path or default_calibration_file()
+    calibration = load_calibration(path)
+    calibration[key] = result
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(calibration, f, indent=1)
+    os.replace(path + '.tmp', path)
+
+
+def calibrated_rate(key: str, path: str = None):
+    '''Reports per second to use at runtime for a device model, None if not measured.'''
+    result = load_calibration(path).get(key)
+    if not result or not result.get('safe_reports_per_s'):
+        return None
+    return result['safe_reports_per_s'] * SAFETY
+
+
+class ReportPacer:
+    def __init__(self, rate: float, burst: int = BURST):
+        self.rate = rate
+        self.interval = 1.0 / rate
+        self.burst = burst * self.interval
+        self._next = 0.0
+
+    def wait(self):
+        now = perf_counter()
+        slot = max(self._next, now - self.burst)
+        if slot > now:
+            sleep(slot - now)
+        self._next = slot + self.interval
+
+
+class _TimedDevice:
+    # device stand-in for the self-test, paces and times every report
+    def __init__(self, device, pacer):
+        self.device = device
+        self.pacer = pacer
+        self.latencies = []
+        self.failures = 0
+
+    def write(self, data):
+        if self.pacer:
+            self.pacer.wait()
+        start = perf_counter()
+        try:
+            result = self.device.write(data)
+            if result is not None and result < 0:
+                self.failures += 1
+        except Exception:
+            self.failures += 1
+        self.latencies.append(perf_counter() - start)
+
+
+def test_page(page_buf, frame: int, rate: int):
+    # diagonal stripes, a broken report shows as a break in the pattern;
+    # the last line has a checksum of the pattern to compare with the console
+    page_buf.empty_page()
+    title = f'SELFTEST {rate}/S' if rate else 'SELFTEST MAX'
+    page_buf.write_line_to_page(0, 0, title.center(24), 'W')
+    colors = 'AWBGMRY'
+    pattern = []
+    for line in range(1, 13):
+        text = ''.join(chr(ord('A') + (frame + line + i) % 26) for i in range(24))
+        page_buf.write_line_to_page(line, 0, text, colors[(frame + line) % len(colors)], line % 2 == 0)
+        pattern.append(text)
+    checksum = zlib.crc32(''.join(pattern).encode()) & 0xffff
+    page_buf.write_line_to_page(13, 0, f'#{frame:05d} CHK {checksum:04X}', 'G')
+    return checksum
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def selftest(display, name: str, rates=RATES, step_seconds: float = STEP_SECONDS):
+    '''Ramp the report rate on a DisplayManager, return the results of every step
+    and the highest sustainable rate.'''
+    device = display.device
+    steps = []
+    safe = 0
+    try:
+        for rate in rates:
+            timed = _TimedDevice(device, ReportPacer(rate) if rate else None)
+            display.device = timed
+            frame = 0
+            start = perf_counter()
+            while perf_counter() - start < step_seconds:
+                checksum = test_page(display, frame, rate)
+                display.set_from_page()
+                frame += 1
+            elapsed = perf_counter() - start
+            achieved = len(timed.latencies) / elapsed
+            p99 = percentile(timed.latencies, 99) * 1000
+            ok = (timed.failures == 0 and p99 <= MAX_P99_MS
+                  and (rate == 0 or achieved >= rate * MIN_ACHIEVED))
+            steps.append({
+                'rate': rate or 'max',
+                'achieved_reports_per_s': round(achieved),
+                'frames': frame,
+                'failures': timed.failures,
+                'latency_ms': {'p50': round(percentile(timed.latencies, 50) * 1000, 3),
+                               'p99': round(p99, 3),
+                               'max': round(max(timed.latencies) * 1000, 3)},
+                'ok': ok,
+            })
+            print(f"{name}: {rate or 'max':>5} reports/s -> {achieved:7.0f}/s, {timed.failures} failed, "
+                  f"p50 {steps[-1]['latency_ms']['p50']} ms, p99 {p99:.3f} ms, "
+                  f"last frame #{frame - 1:05d} CHK {checksum:04X}: {'ok' if ok else 'NOT sustainable'}")
+            if not ok:
+                break
+            safe = round(achieved) if rate == 0 else rate
+    finally:
+        display.device = device
+    display.empty_page()
+    display.write_line_to_page(5, 0, 'SELFTEST DONE'.center(24), 'G')
+    display.write_line_to_page(7, 0, f'SAFE {safe} REPORTS/S'.center(24), 'W')
+    display.set_from_page()
+    return {'safe_reports_per_s': safe, 'measured': strftime('%Y-%m-%d %H:%M:%S'), 'steps': steps}
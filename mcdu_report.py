@@ -0,0 +1,53 @@
+# HID reports for the MCDU display.
+# A frame is encoded once into a preallocated byte buffer and then copied into
+# preallocated 64 byte reports (0xf2 header + 63 bytes payload, the last one zero
+# padded). Both buffers are reused for every frame, no lists or bytes per report.
+# It is not allocation free: benchmark.py reports measures a peak of about 1 KB
+# per frame for set_from_page (interpreter temporaries of the encoder) and about
+# 150 bytes for the chunking alone.
+# The device gets the reports as ctypes char arrays over the report buffer:
+#   hid (pyhidapi, requirements.txt)  Device.write() passes them as c_char_p to
+#       hid_write(), which rejects a memoryview or bytearray. hid_write() is done
+#       with the data when it returns.
+#   hidapi (cython)  device.write() copies the report into bytes first
+#   libusb           LibusbDevice.write() copies it as well
+# So a report may be refilled as soon as write() is back.
+
+import ctypes
+
+REPORT_ID = 0xf2
+REPORT_SIZE = 64
+PAYLOAD_SIZE = REPORT_SIZE - 1
+MAX_CELL_BYTES = 5   # attribute low/high + up to 3 bytes utf-8
+
+ARROW_UP = b'\xe2\x86\x91'     # last line, vertical slew keys
+ARROW_DOWN = b'\xe2\x86\x93'
+
+
+class ReportBuilder:
+    def __init__(self, cells: int, report_id: int = REPORT_ID):
+        size = cells * MAX_CELL_BYTES
+        self.count = (size + PAYLOAD_SIZE - 1) // PAYLOAD_SIZE
+        self.frame = bytearray(self.count * PAYLOAD_SIZE)   # encoder writes the payload here
+        self.length = 0                                     # used bytes of frame
+        self._buf = bytearray(self.count * REPORT_SIZE)
+        for i in range(self.count):
+            self._buf[i * REPORT_SIZE] = report_id
+        frame = memoryview(self.frame)
+        buf = memoryview(self._buf)
+        self._chunks = [frame[i * PAYLOAD_SIZE:(i + 1) * PAYLOAD_SIZE] for i in range(self.count)]
+        self._payloads = [buf[i * REPORT_SIZE + 1:(i + 1) * REPORT_SIZE] for i in range(self.count)]
+        report = ctypes.c_char * REPORT_SIZE
+        self.reports = [report.from_buffer(self._buf, i * REPORT_SIZE) for i in range(self.count)]
+
+    def finish(self, length: int, changed: int = 0):
+        '''Copy the first length bytes of frame into the reports, return the number of reports.
+        Bytes before changed are the same as in the last frame and already in the reports.'''
+        frame = self.frame
+        for i in range(length, self.length):
+            frame[i] = 0   # left over from a longer frame, the rest of frame is zero already
+        self.length = length
+        count = (length + PAYLOAD_SIZE - 1) // PAYLOAD_SIZE
+        for i in range(changed // PAYLOAD_SIZE, count):
+            self._payloads[i][:] = self._chunks[i]
+        return count
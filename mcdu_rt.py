@@ -0,0 +1,159 @@
+# Scheduling of the MCDU input path (simbridge.py --rt-priority, --nice, --input-cpu, --mlock).
+# The HID reader thread can get the real-time class SCHED_FIFO or a raised priority
+# (a lower nice value) and can be pinned to one CPU. On Linux these apply to the
+# calling thread only. --mlock locks the memory of the whole process, so a page
+# fault does not delay a report.
+# Without the permission (CAP_SYS_NICE, an rtprio/memlock limit) a setting is
+# skipped with a message and the bridge runs on with the default scheduling.
+# The jitter test reads the MCDU with a 1 ms timeout, once with the default
+# scheduling and once with the settings: the inter-arrival times of the reports
+# (while the MCDU sends them) and how late the thread wakes up after a timeout.
+
+import ctypes
+import ctypes.util
+import os
+from threading import Thread, get_native_id
+from time import perf_counter
+
+MCL_CURRENT = 1
+MCL_FUTURE = 2
+JITTER_TIMEOUT_MS = 1
+JITTER_SECONDS = 10.0  # per run
+
+
+class InputScheduling:
+    def __init__(self, rt_priority: int = None, nice: int = None, cpu: int = None, mlock: bool = False):
+        self.rt_priority = rt_priority
+        self.nice = nice
+        self.cpu = cpu
+        self.mlock = mlock
+
+    def __bool__(self):
+        return bool(self.rt_priority or self.nice is not None or self.cpu is not None or self.mlock)
+
+    def __str__(self):
+        parts = []
+        if self.rt_priority:
+            parts.append(f'SCHED_FIFO {self.rt_priority}')
+        if self.nice is not None:
+            parts.append(f'nice {self.nice}')
+        if self.cpu is not None:
+            parts.append(f'CPU {self.cpu}')
+        if self.mlock:
+            parts.append('mlock')
+        return ', '.join(parts) or 'default scheduling'
+
+    def apply(self, name: str):
+        '''Apply the settings to the calling thread, return False if one could not be applied.'''
+        ok = True
+        if self.rt_priority:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(self.rt_priority))
+                print(f"{name}: input thread runs with real-time priority {self.rt_priority} (SCHED_FIFO)")
+            except (AttributeError, OSError) as error:
+                ok = False
+                print(f"{name}: *** no real-time priority for the input thread ({_reason(error)}). "
+                      f"Needs CAP_SYS_NICE or an rtprio limit in /etc/security/limits.conf ***")
+        if self.nice is not None:
+            try:
+                os.setpriority(os.PRIO_PROCESS, get_native_id(), self.nice)
+                print(f"{name}: input thread runs with nice {self.nice}")
+            except (AttributeError, OSError) as error:
+                ok = False
+                print(f"{name}: *** could not set nice {self.nice} for the input thread ({_reason(error)}). "
+                      f"A negative nice needs CAP_SYS_NICE or a nice limit in /etc/security/limits.conf ***")
+        if self.cpu is not None:
+            try:
+                os.sched_setaffinity(0, {self.cpu})
+                print(f"{name}: input thread pinned to CPU {self.cpu}")
+            except (AttributeError, OSError) as error:
+                ok = False
+                print(f"{name}: *** could not pin the input thread to CPU {self.cpu} ({_reason(error)}) ***")
+        if self.mlock:
+            ok = lock_memory(name) and ok
+        return ok
+
+
+def _reason(error):
+    if isinstance(error, AttributeError):
+        return 'not supported on this system'
+    return error.strerror or str(error)
+
+
+def lock_memory(name: str):
+    # MCL_FUTURE only when the limit cannot be hit later, a locked process over its
+    # limit would fail its allocations
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_MEMLOCK)
+        unlimited = os.geteuid() == 0 or soft == resource.RLIM_INFINITY
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    except (ImportError, OSError, AttributeError):
+        print(f"{name}: *** memory locking is not supported on this system ***")
+        return False
+    flags = MCL_CURRENT | MCL_FUTURE if unlimited else MCL_CURRENT
+    if libc.mlockall(flags) != 0:
+        print(f"{name}: *** could not lock the memory ({os.strerror(ctypes.get_errno())}), "
+              f"raise the memlock limit (ulimit -l) or run with CAP_IPC_LOCK ***")
+        return False
+    if unlimited:
+        print(f"{name}: memory locked")
+    else:
+        print(f"{name}: memory in use locked, memory allocated later is not (memlock limit {soft // 1024} KiB)")
+    return True
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else float('nan')
+
+
+def measure_jitter(read, seconds: float, scheduling: InputScheduling = None, name: str = 'jitter test'):
+    '''Read with a 1 ms timeout for seconds in a new thread (with the scheduling applied),
+    return (report inter-arrival ms, wakeup lateness ms, report sizes, all settings applied).'''
+    arrivals, lateness, sizes = [], [], {}
+    applied = [True]
+
+    def run():
+        if scheduling:
+            applied[0] = scheduling.apply(name)
+        last = None
+        end = perf_counter() + seconds
+        while perf_counter() < end:
+            start = perf_counter()
+            data = read(0x81, JITTER_TIMEOUT_MS)
+            now = perf_counter()
+            if data:
+                sizes[len(data)] = sizes.get(len(data), 0) + 1
+                if last is not None:
+                    arrivals.append((now - last) * 1000)
+                last = now
+            else:
+                lateness.append((now - start) * 1000 - JITTER_TIMEOUT_MS)
+
+    thread = Thread(target=run, name=f'{name} input')
+    thread.start()
+    thread.join()
+    return sorted(arrivals), sorted(lateness), sizes, applied[0]
+
+
+def jitter_test(read, name: str, scheduling: InputScheduling, seconds: float = JITTER_SECONDS):
+    '''Compare the input timing with the default scheduling and with the settings, print the results.'''
+    print(f"{name}: jitter test, {seconds:g} s per run. Keep the sim running, "
+          f"press keys for report inter-arrival times")
+    runs = [('default scheduling', None)]
+    if scheduling:
+        runs.append((str(scheduling), scheduling))
+    results = []
+    for label, settings in runs:
+        arrivals, lateness, sizes, applied = measure_jitter(read, seconds, settings, name)
+        results.append((label if applied else f'{label} (not all applied)', arrivals, lateness, sizes))
+    for label, arrivals, lateness, sizes in results:
+        print(f"{name}: {label}")
+        print(f"    wakeup late   p50 {percentile(lateness, 50):7.3f}  p99 {percentile(lateness, 99):7.3f}  "
+              f"max {max(lateness, default=float('nan')):7.3f} ms  ({len(lateness)} timeouts)")
+        if arrivals:
+            print(f"    inter-arrival p50 {percentile(arrivals, 50):7.3f}  p99 {percentile(arrivals, 99):7.3f}  "
+                  f"max {arrivals[-1]:7.3f} ms  ({sum(sizes.values())} reports, sizes {sizes})")
+        else:
+            print("    no reports from the MCDU")
+    return results
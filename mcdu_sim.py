@@ -0,0 +1,222 @@
+# Simulator connections of the bridges. A SimSource connects to one simulator and
+# hands what it sends to the front end (simbridge.py, winwing_mcdu.py), which
+# renders it with mcdu_core. The front end sets the handlers:
+#   on_connect()           connected, data follows
+#   on_data(data)          a SimBridge message (str), the X-Plane values (dict) or
+#                          a line of a replay file (decoded if it has a decode)
+#   on_disconnect(reason)  the connection is gone
+#   on_error(error)        the connection failed
+# send() takes what the front end encoded for its sim once (TextFrame, UDP packet).
+#   SimBridgeSource   FlyByWire SimBridge websocket (MSFS)
+#   XPlaneSource      X-Plane UDP, XPlaneUdp.py
+#   ReplaySource      messages recorded to a file, replayed at a fixed rate without a sim
+
+import os
+from threading import Thread
+from time import sleep, monotonic
+
+SIMBRIDGE_URL = "ws://localhost:8380/interfaces/v1/mcdu"
+XPLANE_RETRY_MAX = 10  # s, while X-Plane does not answer the requests get less frequent
+
+
+def _ignore(*args):
+    pass
+
+
+class SimSource:
+    name = 'sim'
+
+    def __init__(self):
+        self.connected = False
+        self.on_connect = _ignore
+        self.on_data = _ignore
+        self.on_disconnect = _ignore
+        self.on_error = _ignore
+
+    def start(self):
+        '''run() in its own thread.'''
+        thread = Thread(target=self.run, name=self.name)
+        thread.start()
+        return thread
+
+    def run(self):
+        raise NotImplementedError
+
+    def send(self, message):
+        raise NotImplementedError
+
+
+# --- SimBridge ---
+
+
+class TextFrame:
+    # Client websocket text frame for WebSocket.send_frame(), header and payload are
+    # encoded once. Only the mask key is new on every send, as RFC 6455 wants it.
+    # Stands in for a websocket-client ABNF: send_frame() sets get_mask_key and sends
+    # what format() returns. That is not public API, websocket-client is pinned in
+    # requirements.txt and tests/test_mcdu_sim.py checks it against ws.send().
+    def __init__(self, text: str):
+        payload = text.encode()
+        if len(payload) > 125:
+            raise ValueError('text too long for a one byte frame length')
+        self.length = len(payload)
+        self.header = bytes([0x81, 0x80 | self.length])  # FIN + text, masked + length
+        self.payload = int.from_bytes(payload, 'big')
+        self.repeat = self.length // 4 + 1
+        self.get_mask_key = None  # set by send_frame() if the connection has its own
+
+    def format(self):
+        mask = self.get_mask_key(4) if self.get_mask_key else os.urandom(4)
+        masked = self.payload ^ int.from_bytes((mask * self.repeat)[:self.length], 'big')
+        return self.header + mask + masked.to_bytes(self.length, 'big')
+
+
+class SimBridgeSource(SimSource):
+    name = 'SimBridge'
+
+    def __init__(self, url: str = SIMBRIDGE_URL):
+        super().__init__()
+        self.url = url
+        self.ws = None
+
+    def run(self):
+        import websocket
+        try:
+            self.ws = websocket.WebSocketApp(self.url,
+                                             on_open=self._opened,
+                                             on_message=lambda ws, message: self.on_data(message),
+                                             on_error=lambda ws, error: self.on_error(error),
+                                             on_close=self._closed)
+            self.ws.run_forever()
+        except Exception as e:
+            print(f"WebSocket error: {e}")
+
+    def send(self, message):
+        # a TextFrame goes out as it is, text is framed by websocket-client
+        ws = self.ws
+        if not ws or not ws.sock:
+            raise ConnectionError('not connected to SimBridge')
+        if isinstance(message, TextFrame):
+            ws.sock.send_frame(message)
+        else:
+            ws.send(message)
+
+    def _opened(self, ws):
+        self.connected = True
+        self.on_connect()
+
+    def _closed(self, ws, close_status_code, close_msg):
+        self.connected = False
+        self.on_disconnect(f'{close_status_code} - {close_msg}')
+
+
+# --- X-Plane ---
+
+
+class XPlaneSource(SimSource):
+    # datarefs: (dataref, frequency) to subscribe on every connect
+
+    name = 'X-Plane'
+
+    def __init__(self, ip: str, port: int, datarefs: list, retry_max: float = XPLANE_RETRY_MAX):
+        super().__init__()
+        self.ip = ip
+        self.port = port
+        self.datarefs = datarefs
+        self.retry_max = retry_max
+        self.xp = None
+
+    def run(self):
+        import XPlaneUdp
+        xp = self.xp = XPlaneUdp.XPlaneUdp()
+        xp.BeaconData["IP"] = self.ip  # workaround to set IP and port
+        xp.BeaconData["Port"] = self.port
+        xp.UDP_PORT = xp.BeaconData["Port"]
+        timeout = xp.socket.gettimeout()
+        print(f'waiting for X-Plane to connect on port {self.port}')
+        while True:
+            if not self.connected:
+                try:
+                    xp.AddDataRef("sim/aircraft/view/acf_tailnum")
+                    xp.GetValues()
+                    print("X-Plane connected")
+                    self.connected = True
+                    self.on_connect()
+                    self._subscribe(xp)
+                    xp.AddDataRef("sim/aircraft/view/acf_tailnum", 0)
+                    xp.socket.settimeout(timeout)
+                except XPlaneUdp.XPlaneTimeout:
+                    self.connected = False
+                    # ask again less often, an answer still ends the wait at once
+                    xp.socket.settimeout(min(xp.socket.gettimeout() * 2, self.retry_max))
+                continue
+
+            try:
+                values = xp.GetValues()
+            except XPlaneUdp.XPlaneTimeout:
+                print(f'X-Plane timeout, could not connect on port {self.port}, waiting for X-Plane')
+                self.connected = False
+                self.on_disconnect('timeout')
+                sleep(2)
+                continue
+            self.on_data(values)
+
+    def send(self, message):
+        if not self.xp:
+            raise ConnectionError('not connected to X-Plane')
+        self.xp.SendPacket(message)
+
+    def _subscribe(self, xp):
+        print(f"register {len(self.datarefs)} datarefs ", end='')
+        for i, (dataref, freq) in enumerate(self.datarefs):
+            xp.AddDataRef(dataref, freq)
+            if i % 100 == 99:
+                print(".", end='', flush=True)
+        print("")
+
+
+# --- Replay ---
+
+
+class ReplaySource(SimSource):
+    # One message per line (simbridge.py --record), rate messages per second
+    # (0: as fast as they are taken), from the start again at the end if loop.
+    # What the front end sends is counted and dropped.
+
+    name = 'replay'
+
+    def __init__(self, path: str, rate: float = 4, loop: bool = True, decode=None):
+        super().__init__()
+        self.path = path
+        self.rate = rate
+        self.loop = loop
+        self.decode = decode
+        self.replayed = 0
+        self.sent = 0
+
+    def run(self):
+        with open(self.path) as f:
+            lines = [line.rstrip('\n') for line in f if line.strip()]
+        if not lines:
+            self.on_error(f'nothing to replay in {self.path}')
+            return
+        print(f"replaying {len(lines)} messages from {self.path}"
+              f"{f' at {self.rate:g}/s' if self.rate else ''}")
+        self.connected = True
+        self.on_connect()
+        interval = 1 / self.rate if self.rate else 0
+        next_message = monotonic()
+        while True:
+            for line in lines:
+                self.on_data(self.decode(line) if self.decode else line)
+                self.replayed += 1
+                if interval:
+                    next_message += interval
+                    sleep(max(0, next_message - monotonic()))
+            if not self.loop:
+                break
+        self.connected = False
+        self.on_disconnect('end of replay')
+
+    def send(self, message):
+        self.sent += 1
@@ -0,0 +1,94 @@
+# Last rendered page and LED state per MCDU side, kept in a small state file so a
+# restarted bridge can show the last page at once (marked stale) until live data
+# arrives. Written atomically (temp file + rename) and at most every MIN_INTERVAL s.
+
+import json
+import os
+from threading import Thread, Condition
+from time import monotonic, sleep
+
+STATE_VERSION = 1
+MIN_INTERVAL = 5.0  # seconds between two writes of the state file
+
+
+def default_state_file():
+    base = os.environ.get('XDG_STATE_HOME') or os.path.join(os.path.expanduser('~'), '.local', 'state')
+    return os.path.join(base, 'winwing_mcdu', 'simbridge_state.json')
+
+
+class StateStore:
+    def __init__(self, path: str = None, min_interval: float = MIN_INTERVAL):
+        self.path = path or default_state_file()
+        self.min_interval = min_interval
+        self._sides = {}    # side -> {'page': ..., 'leds': {led name: brightness}}
+        self._dirty = False
+        self._changed = Condition()
+        self._thread = None
+        self.writes = 0
+
+    def load(self):
+        '''Return {side: (page, {led name: brightness})} from the state file, {} if there is none.'''
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as error:
+            print(f"state file {self.path} ignored: {error}")
+            return {}
+        if state.get('version') != STATE_VERSION:
+            return {}
+        restored = {}
+        for side, s in state.get('sides', {}).items():
+            restored[side] = (s['page'], s.get('leds', {}))
+            self._sides[side] = s
+        return restored
+
+    def start(self):
+        self._thread = Thread(target=self._run, name='state writer', daemon=True)
+        self._thread.start()
+
+    def update(self, side: str, page, leds: dict):
+        snapshot = {
+            'page': [row[:] for row in page],
+            'leds': {getattr(led, 'name', str(led)): brightness for led, brightness in leds.items()},
+        }
+        with self._changed:
+            if self._sides.get(side) == snapshot:
+                return
+            self._sides[side] = snapshot
+            self._dirty = True
+            self._changed.notify()
+
+    def flush(self):
+        with self._changed:
+            if not self._dirty:
+                return
+            state = {'version': STATE_VERSION, 'sides': dict(self._sides)}
+            self._dirty = False
+        self._write(state)
+
+    def _run(self):
+        next_write = monotonic() + self.min_interval
+        while True:
+            with self._changed:
+                while not self._dirty:
+                    self._changed.wait()
+            delay = next_write - monotonic()
+            if delay > 0:
+                sleep(delay)  # newer changes replace the pending state meanwhile
+            self.flush()
+            next_write = monotonic() + self.min_interval
+
+    def _write(self, state):
+        tmp = self.path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp, 'w') as f:
+                json.dump(state, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)  # readers see the old or the new file, never half of it
+            self.writes += 1
+        except OSError as error:
+            print(f"could not write state file {self.path}: {error}")
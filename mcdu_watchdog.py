@@ -0,0 +1,188 @@
+# Accounting and stall detection for the HID writes to an MCDU.
+# WatchedDevice wraps a hid device: every write is timed into a histogram, failed
+# writes are retried, and a watchdog thread reports writes that take longer than
+# the stall threshold, with the report type, thread and counters as context.
+# A blocked write cannot be cancelled from Python, the stall policy decides what
+# happens around it:
+#   retry  - only log the stall (failed writes are always retried)
+#   drop   - drop the rest of the stalled frame if a newer frame is waiting
+#   reopen - give up the handle, the device supervisor opens the device again
+
+from bisect import bisect_left
+from threading import Thread, Event, Lock, current_thread
+from time import perf_counter, sleep
+
+STALL_MS = 250
+POLICIES = ('retry', 'drop', 'reopen')
+RETRIES = 1
+RETRY_DELAY_MS = 2  # before a retry, a write failing at once would likely fail again at once
+HISTOGRAM_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000)  # upper bounds, last bucket is open
+
+REPORT_NAMES = {0xf0: 'init', 0xf2: 'page', 0x02: 'led'}
+
+
+class FrameDropped(Exception):
+    # rest of a stalled frame is not written, a newer frame replaces it
+    pass
+
+
+class WatchedDevice:
+    def __init__(self, device, name: str, stall_ms: float = STALL_MS, policy: str = 'drop',
+                 retries: int = RETRIES, on_stall=None):
+        if policy not in POLICIES:
+            raise ValueError(f'unknown stall policy {policy}')
+        self.device = device
+        self.name = name
+        self.stall_s = stall_ms / 1000
+        self.policy = policy
+        self.retries = retries
+        self.on_stall = on_stall      # callable(WatchedDevice), called from the watchdog thread
+        self.newer_frame = None       # callable, True if a newer frame is waiting
+        self.pacer = None             # optional ReportPacer, keeps the device at its calibrated rate
+        self.frame_stalled = False    # reset by the writer at the start of each frame
+        self.abandoned = False
+        self.closed = False
+
+        self._lock = Lock()
+        self._busy = 0                # reads and writes in flight
+        self._close_pending = False
+        self._inflight = None         # (start, thread name, report id, length)
+        self._write_started = Event()
+        self._write_done = Event()
+        self._write_done.set()
+
+        self.writes = 0
+        self.failures = 0
+        self.retried = 0
+        self.stalls = 0
+        self.frames_dropped = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.histogram = [0] * (len(HISTOGRAM_MS) + 1)
+        self.last_ok = None
+
+        Thread(target=self._watch, name=f'{name} usb watchdog', daemon=True).start()
+
+    def write(self, data):
+        if self.abandoned:
+            raise OSError('handle given up after a stalled write')
+        if self.frame_stalled and self.policy == 'drop' and self.newer_frame and self.newer_frame():
+            self.frames_dropped += 1
+            self.frame_stalled = False
+            raise FrameDropped()
+        if self.pacer:
+            self.pacer.wait()
+        self._enter()
+        start = perf_counter()
+        report_id = bytes(data[:1])[0]  # a ctypes report gives bytes for data[0]
+        self._inflight = (start, current_thread().name, report_id, len(data))
+        self._write_done.clear()
+        self._write_started.set()
+        try:
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    self.retried += 1
+                    sleep(RETRY_DELAY_MS / 1000)
+                try:
+                    result = self.device.write(data)
+                    if result is None or result >= 0:
+                        self.last_ok = perf_counter()
+                        break
+                    error = OSError(f'write returned {result}')
+                except Exception as e:
+                    error = e
+                self.failures += 1
+            else:
+                raise error
+        finally:
+            duration = perf_counter() - start
+            self._inflight = None
+            self._write_started.clear()
+            self._write_done.set()
+            self.writes += 1
+            self.total_s += duration
+            if duration > self.max_s:
+                self.max_s = duration
+            self.histogram[bisect_left(HISTOGRAM_MS, duration * 1000)] += 1
+            self._leave()
+            dropped = self.abandoned
+        if dropped:  # given up while this write was blocked, a write error is raised as it is
+            raise FrameDropped()
+        return result
+
+    def read(self, *args):
+        self._enter()
+        try:
+            return self.device.read(*args)
+        finally:
+            self._leave()
+
+    def close(self):
+        # the handle is freed once no other thread is inside read() or write()
+        self.closed = True
+        self._write_started.set()  # ends the watchdog thread
+        with self._lock:
+            if self._busy:
+                self._close_pending = True
+                return
+        self.device.close()
+
+    def abandon(self):
+        self.abandoned = True
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def _enter(self):
+        with self._lock:
+            self._busy += 1
+
+    def _leave(self):
+        with self._lock:
+            self._busy -= 1
+            close = self._close_pending and not self._busy
+            if close:
+                self._close_pending = False
+        if close:
+            self.device.close()
+
+    def _watch(self):
+        while True:
+            self._write_started.wait()
+            if self.closed:
+                return
+            if self._write_done.wait(self.stall_s):
+                continue
+            inflight = self._inflight
+            if inflight is None:
+                continue
+            start, thread, report, length = inflight
+            self.stalls += 1
+            self.frame_stalled = True
+            last_ok = f'{(perf_counter() - self.last_ok) * 1000:.0f} ms ago' if self.last_ok else 'never'
+            print(f" *** {self.name}: USB write stalled for {(perf_counter() - start) * 1000:.0f} ms: "
+                  f"{REPORT_NAMES.get(report, hex(report))} report ({length} bytes) from '{thread}', "
+                  f"policy {self.policy}, last good write {last_ok}, {self.summary()} ***")
+            if self.on_stall:
+                self.on_stall(self)
+            self._write_done.wait()
+            print(f"{self.name}: stalled write returned after {(perf_counter() - start) * 1000:.0f} ms")
+
+    def stats(self):
+        return {
+            'writes': self.writes,
+            'failures': self.failures,
+            'retried': self.retried,
+            'stalls': self.stalls,
+            'frames_dropped': self.frames_dropped,
+            'mean_ms': round(self.total_s / self.writes * 1000, 3) if self.writes else 0,
+            'max_ms': round(self.max_s * 1000, 3),
+            'histogram_ms': {(f'<={b}' if i < len(HISTOGRAM_MS) else f'>{HISTOGRAM_MS[-1]}'): n
+                             for i, (b, n) in enumerate(zip(HISTOGRAM_MS + (HISTOGRAM_MS[-1],), self.histogram)) if n},
+        }
+
+    def summary(self):
+        s = self.stats()
+        return (f"{s['writes']} writes, mean {s['mean_ms']} ms, max {s['max_ms']} ms, "
+                f"{s['failures']} failed, {s['stalls']} stalls, {s['frames_dropped']} frames dropped")
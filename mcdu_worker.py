@@ -0,0 +1,248 @@
+# Out-of-process USB I/O for an MCDU (simbridge.py --usb-worker).
+# A worker process owns the HID device: it reads the buttons and writes the frames,
+# so parsing and rendering in the bridge process do not add jitter to the input.
+#
+# Both processes share one block of memory:
+#   page     seqlock: seq u32 (odd while written), vertslew u8, PAGE_CELLS * cell
+#   commands ring bridge -> worker, raw HID reports (LEDs, init), up to 64 bytes
+#   buttons  ring worker -> bridge, 12 byte button bit field + read time (ns)
+#
+#   cell     attr u8 (color index | 0x10 small font), char u16, see remote_head.py
+#   ring     head u32 (written by the producer), tail u32 (written by the consumer), slots
+#
+# The rings have one producer and one consumer each and need no lock. A one byte
+# message on a pipe wakes the other side, nothing polls.
+#
+# A worker that loses its MCDU (unplugged, read or write error) exits. The bridge
+# sees the closed pipes, read() and write() of the WorkerLink raise OSError, and
+# the device supervisor of the bridge starts a new worker once the MCDU is back.
+
+import atexit
+import os
+import struct
+import time
+import multiprocessing
+from multiprocessing import parent_process
+from multiprocessing.connection import wait
+from multiprocessing.shared_memory import SharedMemory
+from threading import Thread
+
+from remote_head import CELL, PAGE_CELLS, PAGE_LINES, PAGE_CHARS_PER_LINE, page_to_cells, decode_cell
+
+PAGE_HEADER = struct.Struct('<IB3x')
+PAGE_SIZE = PAGE_HEADER.size + PAGE_CELLS * CELL.size
+RING_HEADER = struct.Struct('<II')
+COMMAND = struct.Struct('<H64s')
+BUTTONS = struct.Struct('<12sQ')
+COMMAND_SLOTS = 64
+BUTTON_SLOTS = 64
+
+EXIT_DEVICE_LOST = 3
+
+# the bridge has threads when the workers start, a forked child could inherit a held lock.
+# A spawned child imports the main script of the bridge again (as __mp_main__, main()
+# does not run), about 20 ms more than mcdu_worker and mcdu_core alone.
+_mp = multiprocessing.get_context('spawn')
+
+
+class ShmRing:
+    # single producer, single consumer ring of fixed size slots
+    def __init__(self, buf, offset: int, slots: int, slot: struct.Struct):
+        self.buf = buf
+        self.offset = offset
+        self.slots = slots
+        self.slot = slot
+        self.overflows = 0
+
+    @staticmethod
+    def size(slots, slot):
+        return RING_HEADER.size + slots * slot.size
+
+    def push(self, *values):
+        head, tail = RING_HEADER.unpack_from(self.buf, self.offset)
+        if (head - tail) & 0xffffffff >= self.slots:
+            self.overflows += 1
+            return False
+        self.slot.pack_into(self.buf, self.offset + RING_HEADER.size + (head % self.slots) * self.slot.size, *values)
+        struct.pack_into('<I', self.buf, self.offset, (head + 1) & 0xffffffff)  # publish after the slot
+        return True
+
+    def pop(self):
+        head, tail = RING_HEADER.unpack_from(self.buf, self.offset)
+        if head == tail:
+            return None
+        values = self.slot.unpack_from(self.buf, self.offset + RING_HEADER.size + (tail % self.slots) * self.slot.size)
+        struct.pack_into('<I', self.buf, self.offset + 4, (tail + 1) & 0xffffffff)
+        return values
+
+
+class SharedFrame:
+    def __init__(self, buf):
+        self.buf = buf
+        self.commands = ShmRing(buf, PAGE_SIZE, COMMAND_SLOTS, COMMAND)
+        self.buttons = ShmRing(buf, PAGE_SIZE + ShmRing.size(COMMAND_SLOTS, COMMAND), BUTTON_SLOTS, BUTTONS)
+
+    @staticmethod
+    def size():
+        return PAGE_SIZE + ShmRing.size(COMMAND_SLOTS, COMMAND) + ShmRing.size(BUTTON_SLOTS, BUTTONS)
+
+    def seq(self):
+        return struct.unpack_from('<I', self.buf, 0)[0]
+
+    def write_page(self, cells, vertslew_key):
+        seq = self.seq()
+        struct.pack_into('<I', self.buf, 0, (seq + 1) & 0xffffffff)  # odd: being written
+        self.buf[PAGE_HEADER.size:PAGE_SIZE] = b''.join(CELL.pack(*c) for c in cells)
+        PAGE_HEADER.pack_into(self.buf, 0, (seq + 2) & 0xffffffff, vertslew_key or 0)
+
+    def read_page(self):
+        '''Return (seq, cells bytes, vertslew) of a consistent copy of the page.'''
+        while True:
+            seq = self.seq()
+            if seq & 1:
+                time.sleep(0)
+                continue
+            cells = bytes(self.buf[PAGE_HEADER.size:PAGE_SIZE])
+            seq2, vertslew = PAGE_HEADER.unpack_from(self.buf, 0)
+            if seq2 == seq:
+                return seq, cells, vertslew
+
+
+def cells_to_page(cells: bytes):
+    page = []
+    for line in range(PAGE_LINES):
+        row = []
+        for i in range(line * PAGE_CHARS_PER_LINE, (line + 1) * PAGE_CHARS_PER_LINE):
+            row.extend(decode_cell(*CELL.unpack_from(cells, i * CELL.size)))
+        page.append(row)
+    return page
+
+
+# --- Bridge side ---
+
+class WorkerLink:
+    # Bridge end of the worker. Looks like a HID device to the input and LED code
+    # (read() returns MCDU button reports, write() queues raw reports) and takes
+    # the pages through send_page() like the remote display head link.
+    # Raises OSError once the worker has ended.
+
+    def __init__(self, usb: dict, name: str, warm_start: bool = True, scheduling=None):
+        self.name = name
+        self.shm = SharedMemory(create=True, size=SharedFrame.size())
+        self.shm.buf[:SharedFrame.size()] = bytes(SharedFrame.size())
+        self.frame = SharedFrame(self.shm.buf)
+        worker_wake, self._wake_worker = _mp.Pipe(duplex=False)
+        self._buttons_wake, worker_buttons = _mp.Pipe(duplex=False)
+        self.process = _mp.Process(target=worker_main, name=f'{name} usb worker', daemon=True,
+                               args=(self.shm.name, {k: usb.get(k) for k in ('vid', 'pid', 'path', 'backend')},
+                                     warm_start, worker_wake, worker_buttons, scheduling))
+        self.process.start()
+        # only the worker holds its pipe ends now, they close when it ends
+        worker_wake.close()
+        worker_buttons.close()
+        atexit.register(self.close)
+        self.last_read_ns = 0  # when the worker read the last button report
+
+    def send_page(self, page, vertslew_key=0):
+        self.frame.write_page(page_to_cells(page), vertslew_key)
+        self._wake()
+
+    def write(self, report):
+        if not self.frame.commands.push(len(report), bytes(report)):
+            print(f" *** {self.name}: command ring full, report dropped ***")
+        self._wake()
+        return len(report)
+
+    def _wake(self):
+        try:
+            self._wake_worker.send_bytes(b'\0')
+        except OSError:
+            raise self._ended() from None
+
+    def _ended(self):
+        self.process.join(1)
+        return OSError(f'usb worker ended (exit code {self.process.exitcode})')
+
+    def read(self, max_length, timeout_ms=0):
+        while True:
+            item = self.frame.buttons.pop()
+            if item:
+                buttons, self.last_read_ns = item
+                return [0x01] + list(buttons) + [0] * 12  # same layout as the 25 byte MCDU report
+            try:
+                self._buttons_wake.recv_bytes()
+                while self._buttons_wake.poll():
+                    self._buttons_wake.recv_bytes()
+            except (EOFError, OSError):
+                raise self._ended() from None
+
+    def close(self):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+        self._wake_worker.close()
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
+
+
+# --- Worker process ---
+
+def worker_main(shm_name, usb, warm_start, wake, buttons_wake, scheduling=None):
+    from mcdu_core import UsbManager, DisplayManager
+
+    shm = SharedMemory(shm_name)
+    frame = SharedFrame(shm.buf)
+    usb_mgr = UsbManager()
+    usb_mgr.backend = usb['backend'] or usb_mgr.backend
+    usb_mgr.connect_device(usb['vid'], usb['pid'], usb['path'])
+    device = usb_mgr.device
+    display = DisplayManager(device, usb['path'], warm_start)
+
+    def device_lost(error):
+        # the closed pipes tell the bridge, its supervisor starts a new worker
+        print(f' *** usb worker: {error}, worker ends ***')
+        os._exit(EXIT_DEVICE_LOST)
+
+    def read_buttons():
+        if scheduling:
+            scheduling.apply('usb worker')  # mcdu_rt.InputScheduling
+        while True:
+            try:
+                data_in = device.read(0x81)  # blocks until the MCDU sends a report
+            except Exception as error:
+                device_lost(f'usb-in error: {error}')
+            if len(data_in) != 25:
+                continue
+            frame.buttons.push(bytes(data_in[1:13]), time.monotonic_ns())
+            buttons_wake.send_bytes(b'\0')
+
+    Thread(target=read_buttons, name='usb worker input', daemon=True).start()
+
+    # also watch the bridge process itself, it may end without closing the pipe
+    bridge = parent_process().sentinel
+    seq = None
+    while True:
+        if bridge in wait([wake, bridge]):
+            break  # the bridge is gone
+        try:
+            while wake.poll():
+                wake.recv_bytes()
+        except (EOFError, OSError):
+            break
+        try:
+            while True:
+                command = frame.commands.pop()
+                if command is None:
+                    break
+                length, report = command
+                device.write(report[:length])
+            new_seq, cells, vertslew = frame.read_page()
+            if new_seq != seq and new_seq:
+                seq = new_seq
+                display.set_from_page(cells_to_page(cells), vertslew)
+        except Exception as error:
+            device_lost(f'usb-out error: {error}')
+    shm.close()
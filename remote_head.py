@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# Remote display head for the Winwing MCDU.
+#
+# The host (simbridge.py --remote-head HOST:PORT) connects to SimBridge, parses and
+# renders, the head (this script, on the box the MCDU is plugged into) only owns the
+# HID device. Both talk a small binary protocol over TCP or UDP:
+#
+#   header   '<BHI'  message type, payload length, sequence number
+#   FULL     vertslew u8, PAGE_CELLS * cell                       host -> head
+#   DELTA    vertslew u8, count u16, count * (index u16, cell)    host -> head
+#   LEDS     count u8, count * (led u8, brightness u8)            host -> head
+#   BUTTONS  12 bytes button bit field as read from the MCDU      head -> host
+#   RESYNC   -                                                    head -> host
+#
+#   cell     attr u8 (color index | 0x10 small font), char u16
+#
+# Host messages are numbered. The head drops DELTA/LEDS after a gap in the sequence
+# numbers and asks for a RESYNC, the host answers with FULL and all LEDS. A message
+# with a wrong length, a cell index out of the page or an unknown LED is answered
+# the same way.
+
+import argparse
+import socket
+import struct
+from threading import Thread, Event, Lock, Condition
+from time import sleep
+
+PAGE_LINES = 14
+PAGE_CHARS_PER_LINE = 24
+PAGE_BYTES_PER_CHAR = 3
+PAGE_CELLS = PAGE_LINES * PAGE_CHARS_PER_LINE
+
+DEFAULT_PORT = 8390
+
+MSG_FULL = 1
+MSG_DELTA = 2
+MSG_LEDS = 3
+MSG_BUTTONS = 4
+MSG_RESYNC = 5
+
+HEADER = struct.Struct('<BHI')
+CELL = struct.Struct('<BH')
+DELTA_CELL = struct.Struct('<HBH')
+
+COLORS = 'LAWBGMRYE '  # index on the wire -> page color, see DisplayManager.col_map
+SMALL = 0x10
+
+# a DELTA larger than this is sent as FULL
+FULL_THRESHOLD = (PAGE_CELLS * CELL.size) // DELTA_CELL.size
+
+
+def encode_cell(color, font_small, char):
+    idx = COLORS.find(str(color).upper())
+    if idx < 0:
+        idx = COLORS.index('W')
+    return (idx | (SMALL if font_small else 0)), (ord(char) if char else 0x20) & 0xffff
+
+
+def decode_cell(attr, char):
+    return COLORS[attr & 0x0f] if (attr & 0x0f) < len(COLORS) else 'W', bool(attr & SMALL), chr(char)
+
+
+def page_to_cells(page):
+    cells = []
+    for row in page:
+        for j in range(0, PAGE_CHARS_PER_LINE * PAGE_BYTES_PER_CHAR, PAGE_BYTES_PER_CHAR):
+            cells.append(encode_cell(row[j], row[j + 1], row[j + PAGE_BYTES_PER_CHAR - 1]))
+    return cells
+
+
+def encode_message(msg_type, seq, payload=b''):
+    return HEADER.pack(msg_type, len(payload), seq & 0xffffffff) + payload
+
+
+def encode_full(cells, vertslew_key):
+    return bytes([vertslew_key or 0]) + b''.join(CELL.pack(*c) for c in cells)
+
+
+def encode_delta(cells, changed, vertslew_key):
+    return struct.pack('<BH', vertslew_key or 0, len(changed)) + \
+        b''.join(DELTA_CELL.pack(i, *cells[i]) for i in changed)
+
+
+def encode_leds(leds):
+    return bytes([len(leds)]) + b''.join(bytes([led, brightness & 0xff]) for led, brightness in leds.items())
+
+
+def recv_exact(sock, n):
+    buf = b''
+    while len(buf) < n:
+        chunk = sock.recv(n - len(buf))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        buf += chunk
+    return buf
+
+
+def recv_message(sock):
+    msg_type, length, seq = HEADER.unpack(recv_exact(sock, HEADER.size))
+    return msg_type, seq, recv_exact(sock, length) if length else b''
+
+
+def parse_datagram(data):
+    msg_type, length, seq = HEADER.unpack_from(data)
+    return msg_type, seq, data[HEADER.size:HEADER.size + length]
+
+
+def parse_address(address, default_host=''):
+    host, _, port = address.rpartition(':')
+    return host or default_host, int(port) if port else DEFAULT_PORT
+
+
+# --- Host side ---
+
+class HostLink:
+    # Host end of the link to a display head. Looks like a HID device to the
+    # input path (read() returns MCDU button reports, write() takes LED reports).
+
+    def __init__(self, address: str, udp: bool = False):
+        self.address = parse_address(address)
+        self.udp = udp
+        self.sock = None
+        self.connected = Event()
+        self._lock = Lock()        # one sender at a time, keeps seq in order
+        self._seq = 0
+        self._cells = None         # page as last sent to the head
+        self._vertslew = 0
+        self._leds = {}
+        self._buttons = None
+        self._buttons_ready = Condition()
+        self.bytes_sent = 0
+        self.resyncs = 0
+
+    def start(self):
+        Thread(target=self._run, name='remote head link', daemon=True).start()
+
+    def _connect(self):
+        if self.udp:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect(self.address)
+        else:
+            sock = socket.create_connection(self.address, timeout=5)
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _run(self):
+        while True:
+            try:
+                self.sock = self._connect()
+                print(f"remote head {self.address[0]}:{self.address[1]} connected")
+                self.connected.set()
+                self.resync()
+                while True:
+                    if self.udp:
+                        msg_type, seq, payload = parse_datagram(self.sock.recv(2048))
+                    else:
+                        msg_type, seq, payload = recv_message(self.sock)
+                    self._handle(msg_type, payload)
+            except (OSError, ConnectionError, struct.error) as error:
+                if self.connected.is_set():
+                    print(f"remote head connection lost: {error}")
+                self.connected.clear()
+                if self.sock:
+                    self.sock.close()
+                sleep(2)
+
+    def _handle(self, msg_type, payload):
+        if msg_type == MSG_RESYNC:
+            self.resyncs += 1
+            self.resync()
+        elif msg_type == MSG_BUTTONS:
+            with self._buttons_ready:
+                self._buttons = list(payload[:12])
+                self._buttons_ready.notify()
+
+    def _send(self, msg_type, payload):
+        with self._lock:
+            if not self.connected.is_set():
+                return
+            self._seq += 1
+            msg = encode_message(msg_type, self._seq, payload)
+            try:
+                self.sock.send(msg) if self.udp else self.sock.sendall(msg)
+                self.bytes_sent += len(msg)
+            except OSError as error:
+                print(f"remote head send failed: {error}")
+
+    def resync(self):
+        if self._cells is not None:
+            self._send(MSG_FULL, encode_full(self._cells, self._vertslew))
+        if self._leds:
+            self._send(MSG_LEDS, encode_leds(self._leds))
+
+    def send_page(self, page, vertslew_key=0):
+        cells = page_to_cells(page)
+        vertslew_key = vertslew_key or 0
+        old, old_vertslew = self._cells, self._vertslew
+        self._cells, self._vertslew = cells, vertslew_key
+        if old is None:
+            changed = None
+        else:
+            changed = [i for i, c in enumerate(cells) if c != old[i]]
+            if not changed and vertslew_key == old_vertslew:
+                return
+        if changed is None or len(changed) > FULL_THRESHOLD:
+            self._send(MSG_FULL, encode_full(cells, self._vertslew))
+        else:
+            self._send(MSG_DELTA, encode_delta(cells, changed, self._vertslew))
+
+    # HID device interface, used by the LED and input code of the bridge
+
+    def write(self, report):
+        if len(report) >= 9 and report[0] == 0x02:  # led report
+            self._leds[report[7]] = report[8]
+            self._send(MSG_LEDS, encode_leds({report[7]: report[8]}))
+        return len(report)
+
+    def read(self, max_length, timeout_ms=0):
+        with self._buttons_ready:
+            while self._buttons is None:
+                self._buttons_ready.wait()
+            buttons = self._buttons
+            self._buttons = None
+        return [0x01] + buttons + [0] * 12  # same layout as the 25 byte MCDU report
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+
+
+# --- Head side ---
+
+class Head:
+    def __init__(self, mcdu_device, display, set_led, leds=None):
+        self.device = mcdu_device
+        self.display = display
+        self.set_led = set_led
+        self.leds = leds           # LED numbers the host may set, None: any
+        self.page = [[' ' for _ in range(PAGE_CHARS_PER_LINE * PAGE_BYTES_PER_CHAR)]
+                     for _ in range(PAGE_LINES)]
+        self.vertslew_key = 0
+        self.seq = None            # last applied host sequence number, None: need FULL
+        self.peer = None
+        self.sock = None
+        self.udp = False
+        self._own_seq = 0
+        self._send_lock = Lock()   # BUTTONS from the input thread, RESYNC from the serve thread
+        self._dirty = Condition()
+        self._frame_pending = False
+        self._page_lock = Lock()
+
+    def send(self, msg_type, payload=b''):
+        with self._send_lock:
+            self._own_seq += 1
+            msg = encode_message(msg_type, self._own_seq, payload)
+            try:
+                if self.udp:
+                    if self.peer:
+                        self.sock.sendto(msg, self.peer)
+                elif self.sock:
+                    self.sock.sendall(msg)
+            except OSError as error:
+                print(f"send to host failed: {error}")
+
+    def resync(self, reason):
+        print(f"{reason}, resync")
+        self.seq = None
+        self.send(MSG_RESYNC)
+
+    def invalid(self, msg_type, payload):
+        '''Why a host message cannot be applied, None if it can.'''
+        if msg_type == MSG_FULL:
+            if len(payload) != 1 + PAGE_CELLS * CELL.size:
+                return f"FULL of {len(payload)} bytes"
+        elif msg_type == MSG_DELTA:
+            if len(payload) < 3:
+                return f"DELTA of {len(payload)} bytes"
+            count = struct.unpack_from('<H', payload, 1)[0]
+            if len(payload) != 3 + count * DELTA_CELL.size:
+                return f"DELTA of {len(payload)} bytes for {count} cells"
+            for i in range(count):
+                idx = struct.unpack_from('<H', payload, 3 + i * DELTA_CELL.size)[0]
+                if idx >= PAGE_CELLS:
+                    return f"DELTA cell {idx}"
+        elif msg_type == MSG_LEDS:
+            if not payload or len(payload) != 1 + 2 * payload[0]:
+                return f"LEDS of {len(payload)} bytes"
+            if self.leds is not None:
+                for led in payload[1::2]:
+                    if led not in self.leds:
+                        return f"unknown LED {led}"
+        return None
+
+    def apply(self, msg_type, seq, payload):
+        error = self.invalid(msg_type, payload)
+        if error:
+            self.resync(f"invalid message: {error}")
+            return
+
+        if msg_type == MSG_FULL:
+            vertslew_key = payload[0]
+            cells = [CELL.unpack_from(payload, 1 + i * CELL.size) for i in range(PAGE_CELLS)]
+            with self._page_lock:
+                for idx, c in enumerate(cells):
+                    self._set_cell(idx, *c)
+                self.vertslew_key = vertslew_key
+            self.seq = seq
+            self._frame_ready()
+            return
+
+        if self.seq is None or seq != (self.seq + 1) & 0xffffffff:
+            if self.seq is not None:
+                self.resync(f"sequence gap {self.seq} -> {seq}")
+            else:
+                self.send(MSG_RESYNC)
+            return
+        self.seq = seq
+
+        if msg_type == MSG_DELTA:
+            vertslew_key, count = struct.unpack_from('<BH', payload)
+            with self._page_lock:
+                for i in range(count):
+                    idx, attr, char = DELTA_CELL.unpack_from(payload, 3 + i * DELTA_CELL.size)
+                    self._set_cell(idx, attr, char)
+                self.vertslew_key = vertslew_key
+            self._frame_ready()
+        elif msg_type == MSG_LEDS:
+            try:
+                for i in range(payload[0]):
+                    self.set_led(payload[1 + 2 * i], payload[2 + 2 * i])
+            except Exception as error:
+                print(f" *** usb-out error: {error} ***")
+
+    def _set_cell(self, idx, attr, char):
+        color, font_small, char = decode_cell(attr, char)
+        row, col = divmod(idx, PAGE_CHARS_PER_LINE)
+        pos = col * PAGE_BYTES_PER_CHAR
+        line = self.page[row]
+        line[pos] = color
+        line[pos + 1] = font_small
+        line[pos + PAGE_BYTES_PER_CHAR - 1] = char
+
+    def _frame_ready(self):
+        with self._dirty:
+            self._frame_pending = True
+            self._dirty.notify()
+
+    def write_frames(self):
+        # the newest page state is written, frames arriving meanwhile are merged
+        while True:
+            with self._dirty:
+                while not self._frame_pending:
+                    self._dirty.wait()
+                self._frame_pending = False
+            with self._page_lock:
+                page = [row[:] for row in self.page]
+                vertslew_key = self.vertslew_key
+            try:
+                self.display.set_from_page(page, vertslew_key)
+            except Exception as error:
+                print(f" *** usb-out error: {error} ***")
+
+    def read_buttons(self):
+        # blocks in read() until the MCDU sends a report, like the bridges
+        from mcdu_core import input_error
+        buttons_last = None
+        while True:
+            try:
+                data_in = self.device.read(0x81)
+            except Exception as error:
+                input_error(error)
+                continue
+            if len(data_in) != 25:
+                continue
+            buttons = bytes(data_in[1:13])
+            if buttons != buttons_last:
+                self.send(MSG_BUTTONS, buttons)
+                buttons_last = buttons
+
+    def serve_tcp(self, address):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(address)
+        server.listen(1)
+        print(f"display head listening on tcp {address[0] or '*'}:{address[1]}")
+        while True:
+            conn, peer = server.accept()
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            print(f"host {peer[0]} connected")
+            self.sock, self.seq = conn, None
+            try:
+                self.send(MSG_RESYNC)
+                while True:
+                    message = recv_message(conn)
+                    try:
+                        self.apply(*message)
+                    except Exception as error:  # a bad message must not end the head
+                        self.resync(f"message not applied: {error}")
+            except (OSError, ConnectionError, struct.error) as error:
+                print(f"host disconnected: {error}")
+            finally:
+                self.sock = None
+                conn.close()
+
+    def serve_udp(self, address):
+        self.udp = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(address)
+        print(f"display head listening on udp {address[0] or '*'}:{address[1]}")
+        while True:
+            data, peer = self.sock.recvfrom(4096)
+            if peer != self.peer:
+                print(f"host {peer[0]} connected")
+                self.peer, self.seq = peer, None
+            try:
+                self.apply(*parse_datagram(data))
+            except struct.error:
+                self.resync(f"invalid datagram from {peer[0]}")
+            except Exception as error:  # a bad message must not end the head
+                self.resync(f"message not applied: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Remote display head for the Winwing MCDU')
+    parser.add_argument('--listen', default=f':{DEFAULT_PORT}',
+                        help=f'address to listen on (default: :{DEFAULT_PORT})')
+    parser.add_argument('--udp', action='store_true', help='use UDP instead of TCP')
+    args = parser.parse_args()
+
+    # only the USB side of the bridge is needed here
+    from mcdu_core import UsbManager, DisplayManager, winwing_mcdu_set_led, Leds
+
+    found = UsbManager().find_devices()
+    if not found:
+        print("No compatible MCDU USB device found.")
+        return
+    usb = UsbManager()
+    usb.connect_device(found[0]['vid'], found[0]['pid'], found[0]['path'])
+    display = DisplayManager(usb.device, found[0]['path'], warm_start=True)
+    display.clear()
+    display.write_line_to_page(8, 1, 'waiting for host', 'A')
+    display.set_from_page()
+
+    device_lock = Lock()
+
+    def set_led(led, brightness):
+        with device_lock:
+            winwing_mcdu_set_led(usb.device, Leds(led), brightness)
+
+    class LockedDisplay:
+        def set_from_page(self, page, vertslew_key):
+            with device_lock:
+                display.set_from_page(page, vertslew_key)
+
+    head = Head(usb.device, LockedDisplay(), set_led, leds={led.value for led in Leds})
+    Thread(target=head.write_frames, name='head writer', daemon=True).start()
+    Thread(target=head.read_buttons, name='head input', daemon=True).start()
+    if args.udp:
+        head.serve_udp(parse_address(args.listen))
+    else:
+        head.serve_tcp(parse_address(args.listen))
+
+
+if __name__ == '__main__':
+    main()
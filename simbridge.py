@@ -1,91 +1,58 @@
-import websocket
 import time
-import json
+STARTUP_T0 = time.perf_counter()
+
+import argparse
 import re
-import hid
 import math
-import rel
 from dataclasses import dataclass
-from threading import Thread, Event, Lock
-from enum import Enum, IntEnum
+from threading import Thread, Event, Lock, RLock, Condition
 from time import sleep
 
+from mcdu_core import (PAGE_LINES, PAGE_CHARS_PER_LINE, PAGE_BYTES_PER_LINE, DEVICEMASK, ButtonType, Leds,
+                       DrefType, Button, UsbManager, PageBuffer, DisplayManager, winwing_mcdu_set_leds,
+                       read_buttons, input_error, dispatch_buttons)
+from mcdu_sim import SimBridgeSource, TextFrame
+from mcdu_console import TerminalMirror
+from mcdu_watchdog import WatchedDevice, FrameDropped, STALL_MS
+from mcdu_pacing import ReportPacer, calibrated_rate, selftest, save_calibration, SAFETY
+from mcdu_input import ButtonEventRing
+from mcdu_decode import decode_update
+from mcdu_idle import IdleMonitor
+import mcdu_init
+# websocket, the proxy, remote head and web mirror are imported when used
 
 # Global vars
-display_mgr = ''
-device = ''
-buttonlist = []
+devices = []    # McduDevice for every attached MCDU
+devices_lock = Lock()
+last_frames = {}  # MCDU side -> last McduFrame, for devices that come up later
+renderers = {}  # MCDU side -> PageBuffer, every side is rendered once per update
 values = []
 
-ws = ''
-
-
-BUTTONS_CNT = 99  # TODO
-PAGE_LINES = 14  # Header + 6 * label + 6 * cont + textbox
-PAGE_CHARS_PER_LINE = 24
-PAGE_BYTES_PER_CHAR = 3
-PAGE_BYTES_PER_LINE = PAGE_CHARS_PER_LINE * PAGE_BYTES_PER_CHAR
-PAGE_BYTES_PER_PAGE = PAGE_BYTES_PER_LINE * PAGE_LINES
-
-buttons_press_event = [0] * BUTTONS_CNT
-
-
-class DEVICEMASK(IntEnum):
-    NONE = 0
-    MCDU = 0x01
-    PFP3N = 0x02
-    PFP4 = 0x04
-    PFP7 = 0x08
-    CAP = 0x10
-    FO = 0x20
-    OBS = 0x40
-
-
-class ButtonType(Enum):
-    SWITCH = 0
-    TOGGLE = 1
-    SEND_0 = 2
-    SEND_1 = 3
-    SEND_2 = 4
-    SEND_3 = 5
-    SEND_4 = 6
-    SEND_5 = 7
-    NONE = 5  # for testing
-
-
-class Leds(Enum):
-    BACKLIGHT = 0  # 0 .. 255
-    SCREEN_BACKLIGHT = 1  # 0 .. 255
-    FAIL = 8
-    FM = 9
-    MCDU = 10
-    MENU = 11
-    FM1 = 12
-    IND = 13
-    RDY = 14
-    STATUS = 15
-    FM2 = 16
-
-
-class DrefType(Enum):
-    DATA = 0
-    CMD = 1
-    NONE = 2  # for testing
+sim = None  # SimSource: the SimBridge websocket, or a file with --replay
+quiet = False
+proxy = None    # optional SimBridgeProxy for more MCDU clients
+web_mirror = None  # optional WebMirror of the rendered pages
+console_mirror = None
+state_store = None  # optional StateStore, last page and LEDs for the next start
+supervisor = None  # DeviceSupervisor, reopens unplugged MCDUs
+usb_watchdog = {}  # WatchedDevice options from the command line
+pacing = True  # pace the writes to the rate measured by --selftest
+usb_worker = False  # HID I/O in a worker process per MCDU
+recorder = None  # optional file, every SimBridge message is appended to it (--record)
+debug_hooks = None  # DebugHooks, profiler/heap/stack dumps on SIGUSR1/SIGUSR2 or the debug socket
+idle_monitor = IdleMonitor()  # started in main(), SimBridge messages and key presses are the activity
+input_scheduling = None  # optional InputScheduling of the input threads (--rt-priority, --nice, --input-cpu, --mlock)
 
 
 @dataclass
-class Button:
-    id: int
+class Binding:
+    # what a key sends to SimBridge, encoded once per MCDU side, see create_bindings()
     label: str
-    dataref: str = None
-    dreftype: DrefType = DrefType.DATA
-    type: ButtonType = ButtonType.NONE
-    led: Leds = None
+    frame: object = None  # websocket frame sent on press
+    log: str = None
 
 
-values_processed = Event()
 xplane_connected = False
-buttonlist = []
 values = []
 
 led_brightness = 180
@@ -93,505 +60,251 @@ led_brightness = 180
 device_config = DEVICEMASK.NONE
 
 
-class Byte(Enum):
-    H0 = 0
-
-
-@dataclass
-class Flag:
-    name: str
-    byte: Byte
-    mask: int
-    value: bool = False
-
-# --- USB Manager Class for Device Detection ---
-
-
-class UsbManager:
-    def __init__(self):
-        self.device = None
-        self.device_config = 0
-
-    def connect_device(self, vid: int, pid: int):
-        try:
-            self.device = hid.device()
-            self.device.open(vid, pid)
-        except AttributeError:
-            print("Using hidapi mac version")
-            self.device = hid.Device(vid=vid, pid=pid)
-
-        if self.device is None:
-            raise RuntimeError("Device not found")
-
-        print("Device connected.")
-
-    def find_device(self):
-        devlist = [
-            {'vid': 0x4098, 'pid': 0xbb36, 'name': 'MCDU - Captain',
-                'mask': DEVICEMASK.MCDU | DEVICEMASK.CAP},
-            {'vid': 0x4098, 'pid': 0xbb3e, 'name': 'MCDU - First Officer',
-                'mask': DEVICEMASK.MCDU | DEVICEMASK.FO},
-            {'vid': 0x4098, 'pid': 0xbb3a, 'name': 'MCDU - Observer',
-                'mask': DEVICEMASK.MCDU | DEVICEMASK.OBS},
-            {'vid': 0x4098, 'pid': 0xbc1e,
-                'name': 'PFP 3N (not tested)', 'mask': DEVICEMASK.PFP3N},
-            {'vid': 0x4098, 'pid': 0xbc1d,
-                'name': 'PFP 4 (not tested)', 'mask': DEVICEMASK.PFP4},
-            {'vid': 0x4098, 'pid': 0xba01,
-                'name': 'PFP 7 (not tested)', 'mask': DEVICEMASK.PFP7}
-        ]
-        for d in devlist:
-            print(f"Searching for {d['name']}... ", end='')
-            for dev in hid.enumerate():
-                if dev['vendor_id'] == d['vid'] and dev['product_id'] == d['pid']:
-                    print("found")
-                    self.device_config |= d['mask']
-                    return d['vid'], d['pid'], self.device_config
-            print("not found")
-        return None, None, 0
-
-
-class DisplayManager:
-    col_map = {
-        'L': 0x0000,  # black with grey background
-        'A': 0x0021,  # amber
-        'W': 0x0042,  # white
-        'B': 0x0063,  # cyan
-        'G': 0x0084,  # green
-        'M': 0x00A5,  # magenta
-        'R': 0x00C6,  # red
-        'Y': 0x00E7,  # yellow
-        'E': 0x0108,  # grey
-        ' ': 0x0042  # use white
-    }
-
-    def __init__(self, device):
-        self.device = device
-        self.page = [[' ' for _ in range(PAGE_BYTES_PER_LINE)]
-                     for _ in range(PAGE_LINES)]
-        device.write(bytes([0xf0, 0x0, 0x1, 0x38, 0x32, 0xbb, 0x0, 0x0, 0x1e, 0x1, 0x0, 0x0, 0xc4, 0x24, 0xa, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x18, 0x1, 0x0, 0x0, 0xc4,
-                     0x24, 0xa, 0x0, 0x0, 0x8, 0x0, 0x0, 0x0, 0x34, 0x0, 0x18, 0x0, 0xe, 0x0, 0x18, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0xc4, 0x24, 0xa, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x2, 0x38, 0x0, 0x0, 0x0, 0x1, 0x0, 0x5, 0x0, 0x0, 0x0, 0x2, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0xc4,
-                     0x24, 0xa, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x0, 0x0, 0x3, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x3, 0x38, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x0, 0x0, 0x0, 0xff, 0x4, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0,
-                     0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x0, 0xa5, 0xff, 0xff, 0x5, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x4, 0x38, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0xff, 0xff, 0xff, 0xff, 0x6, 0x0, 0x0, 0x0, 0x0,
-                     0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0xff, 0xff, 0x0, 0xff, 0x7, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x5, 0x38, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x3d, 0xff, 0x0,
-                     0xff, 0x8, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0xff, 0x63, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x6, 0x38, 0xff, 0xff, 0x9, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0,
-                     0x0, 0x2, 0x0, 0x0, 0x0, 0xff, 0xff, 0xa, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x7, 0x38, 0x0, 0x0, 0x2, 0x0, 0x0, 0xff, 0xff, 0xff, 0xb, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72,
-                     0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x42, 0x5c, 0x61, 0xff, 0xc, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x8, 0x38, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x77, 0x77, 0x77, 0xff, 0xd, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0,
-                     0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x5e, 0x73, 0x79, 0xff, 0xe, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x9, 0x38, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x20, 0x20, 0x20, 0xff, 0xf, 0x0, 0x0, 0x0, 0x0, 0x0,
-                     0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x0, 0xa5, 0xff, 0xff, 0x10, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xa, 0x38, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0xff, 0xff, 0xff, 0xff,
-                     0x11, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0xff, 0xff, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xb, 0x38, 0xff, 0x12, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0,
-                     0x3, 0x0, 0x3d, 0xff, 0x0, 0xff, 0x13, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xc, 0x38, 0x0, 0x3, 0x0, 0xff, 0x63, 0xff, 0xff, 0x14, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19,
-                     0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x0, 0x0, 0xff, 0xff, 0x15, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xd, 0x38, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x0, 0xff, 0xff, 0xff, 0x16, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19,
-                     0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x42, 0x5c, 0x61, 0xff, 0x17, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xe, 0x38, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x77, 0x77, 0x77, 0xff, 0x18, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0,
-                     0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x5e, 0x73, 0x79, 0xff, 0x19, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xf, 0x38, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x4, 0x0, 0x0, 0x0, 0x0, 0x0, 0x1a,
-                     0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x4, 0x0, 0x1, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x10, 0x38, 0x1b, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x4,
-                     0x0, 0x2, 0x0, 0x0, 0x0, 0x1c, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x1a, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0x1, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x11, 0x12, 0x2, 0x32, 0xbb, 0x0, 0x0, 0x1c, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0,
-                     0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-
-    def startupscreen(self, new_version: str = None):
-        self.clear()
-        self.write_line_to_page(0, 3,  'MCDU for MSFS', 'W')
-        self.write_line_to_page(1, 3,  'FlyByWire SimBridge', 'W')
-        self.write_line_to_page(12, 0, 'www.github.com/schenlap', 'W', True)
-        self.write_line_to_page(13, 0, '/winwing_mcdu', 'W', True)
-        self.write_line_to_page(8, 1, 'waiting for SimBridge ', 'A')
-        self.write_line_to_page(3, 1, f'version {0.1}', 'W')
-        if new_version:
-            self.write_line_to_page(4, 1, f'New version {new_version}', 'A')
-            self.write_line_to_page(5, 1, f'available', 'A')
-        self.set_from_page()
-
-    def _data_from_col_font(self, color: str, font_small: bool = False):
-        if type(color) == int:
-            color = chr(color)
-        if color.upper() not in self.col_map:
-            raise ValueError(f"Invalid color '{color}'")
-        if font_small:
-            color = self.col_map[color.upper()] + 0x016b
-        else:
-            color = self.col_map[color.upper()]
-        data_low = color & 0x0ff
-        data_high = (color >> 8) & 0xff
-        return (data_low, data_high)
+class RemoteDisplay(DisplayManager):
+    # DisplayManager for an MCDU on a remote display head (remote_head.py),
+    # sends cell deltas over the link instead of HID reports
 
-    def empty_page(self):
-        self.page = [[' ' for _ in range(PAGE_BYTES_PER_LINE)]
-                     for _ in range(PAGE_LINES)]
+    def __init__(self, link):
+        PageBuffer.__init__(self)
+        self.device = link
+        self.mirror = None
+        self.warm = False
 
     def clear(self):
-        blank_line = [0xf2] + [0x42, 0x00, ord(' ')] * PAGE_CHARS_PER_LINE
-        for _ in range(16):
-            self.device.write(bytes(blank_line))
-
-    def write_line_repeated(self, text: str, repeat: int = 16):
-        encoded = [ord(c) for c in text]
-        c = 0
-        for _ in range(repeat):
-            buf = [0xf2]
-            for _ in range(21):
-                buf.extend([0x42, 0x00, encoded[c]])
-                c = (c + 1) % len(encoded)
-            self.device.write(bytes(buf))
-
-    def set_from_page(self, page=None, vertslew_key=0):
+        self.device.send_page(PageBuffer().page)
+
+    def set_from_page(self, page=None, vertslew_key=0, stale=False):
         if page == None:  # use internal page
             page = self.page
-        buf = []
-        for i in range(PAGE_LINES):
-            for j in range(PAGE_CHARS_PER_LINE):
-                color = page[i][j * PAGE_BYTES_PER_CHAR]
-                font_small = page[i][j * PAGE_BYTES_PER_CHAR + 1]
-                data_low, data_high = self._data_from_col_font(
-                    color, font_small)
-                buf.append(data_low)
-                buf.append(data_high)
-                val = ord(page[i][j * PAGE_BYTES_PER_CHAR +
-                          PAGE_BYTES_PER_CHAR - 1])
-                if val == 35:
-                    buf.extend([0xe2, 0x98, 0x90])
-                # elif val == 60: # <
-                #     buf.extend([0xe2, 0x86, 0x90])
-                # elif val == 62: # >
-                #     buf.extend([0xe2, 0x86, 0x92])
-                elif val == 96:  # °
-                    buf.extend([0xc2, 0xb0])
-                # elif val == "A": # down arrow
-                #    buf.extend([0xe2, 0x86, 0x93])
-                # elif val == "ö": # up arrow
-                #    buf.extend([0xe2, 0x86, 0x91])
-                else:
-                    if i == PAGE_LINES - 1 and j == PAGE_CHARS_PER_LINE - 2 and (vertslew_key == 1 or vertslew_key == 2):
-                        buf.extend([0xe2, 0x86, 0x91])
-                    elif i == PAGE_LINES - 1 and j == PAGE_CHARS_PER_LINE - 1 and (vertslew_key == 1 or vertslew_key == 3):
-                        buf.extend([0xe2, 0x86, 0x93])
-                    else:
-                        buf.append(val)
-
-        while len(buf):
-            max_len = min(63, len(buf))
-            usb_buf = buf[:max_len]
-            usb_buf.insert(0, 0xf2)
-            if max_len < 63:
-                usb_buf.extend([0] * (63 - max_len))
-            self.device.write(bytes(usb_buf))
-            del buf[:max_len]
-
-    def write_line_to_page(self, line, pos, text: str, color: str = 'W', font_small: bool = False):
-        if line < 0 or line >= PAGE_LINES:
-            raise ValueError("Line number out of range")
-        if pos < 0 or pos + len(text) > PAGE_CHARS_PER_LINE:
-            raise ValueError("Position number out of range")
-        if len(text) > PAGE_CHARS_PER_LINE:
-            raise ValueError("Text too long for line")
-
-        # data_low, data_high = self._data_from_col_font(color, font_small)
-        pos = pos * PAGE_BYTES_PER_CHAR
-        c = 0
-        buf = []
-        for c in range(len(text)):
-            self.page[line][pos + c * PAGE_BYTES_PER_CHAR] = color
-            self.page[line][pos + c * PAGE_BYTES_PER_CHAR + 1] = font_small
-            self.page[line][pos + c * PAGE_BYTES_PER_CHAR +
-                            PAGE_BYTES_PER_CHAR - 1] = text[c]
-
-
-def create_button_list_mcdu():
-    buttonlist.append(Button(0, "LSK1L", "event:left:L1",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(1, "LSK2L", "event:left:L2",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(2, "LSK3L", "event:left:L3",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(3, "LSK4L", "event:left:L4",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(4, "LSK5L", "event:left:L5",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(5, "LSK6L", "event:left:L6",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(6, "LSK1R", "event:left:R1",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(7, "LSK2R", "event:left:R2",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(8, "LSK3R", "event:left:R3",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(9, "LSK4R", "event:left:R4",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(10, "LSK5R", "event:left:R5",
-                      DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(11, "LSK6R", "event:left:R6",
+        self.device.send_page(page, vertslew_key)
+        if self.mirror:
+            self.mirror.update(page, vertslew_key, stale)
+
+
+def create_button_list_mcdu(side: str = 'left'):
+    # SimBridge names the MCDUs 'left' (CAP) and 'right' (F/O)
+    buttonlist = []
+    buttonlist.append(Button(0, "LSK1L", f"event:{side}:L1",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(1, "LSK2L", f"event:{side}:L2",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(2, "LSK3L", f"event:{side}:L3",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(3, "LSK4L", f"event:{side}:L4",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(4, "LSK5L", f"event:{side}:L5",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(5, "LSK6L", f"event:{side}:L6",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(6, "LSK1R", f"event:{side}:R1",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(7, "LSK2R", f"event:{side}:R2",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(8, "LSK3R", f"event:{side}:R3",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(9, "LSK4R", f"event:{side}:R4",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(10, "LSK5R", f"event:{side}:R5",
+                      DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(11, "LSK6R", f"event:{side}:R6",
                       DrefType.CMD, ButtonType.TOGGLE))  # 0x800
-    buttonlist.append(Button(12, "DIRTO", "event:left:DIR",
+    buttonlist.append(Button(12, "DIRTO", f"event:{side}:DIR",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(13, "PROG", "event:left:PROG",
+    buttonlist.append(Button(13, "PROG", f"event:{side}:PROG",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(14, "PERF", "event:left:PERF",
+    buttonlist.append(Button(14, "PERF", f"event:{side}:PERF",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(15, "INIT", "event:left:INIT",
+    buttonlist.append(Button(15, "INIT", f"event:{side}:INIT",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(16, "DATA", "event:left:DATA",
+    buttonlist.append(Button(16, "DATA", f"event:{side}:DATA",
                       DrefType.CMD, ButtonType.TOGGLE))
     # buttonlist.append(Button(17, "EMTYR", "toliss_airbus/iscs_open",
     #                   DrefType.CMD, ButtonType.TOGGLE))  # 17 emtpy, map to open ICSC screen
     buttonlist.append(
-        Button(18, "BRT", "event:left:BRT", DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(19, "FPLN", "event:left:FPLN",
+        Button(18, "BRT", f"event:{side}:BRT", DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(19, "FPLN", f"event:{side}:FPLN",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(20, "RADNAV", "event:left:RAD",
+    buttonlist.append(Button(20, "RADNAV", f"event:{side}:RAD",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(21, "FUEL", "event:left:FUEL",
+    buttonlist.append(Button(21, "FUEL", f"event:{side}:FUEL",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(22, "SEC-FPLN", "event:left:SEC",
+    buttonlist.append(Button(22, "SEC-FPLN", f"event:{side}:SEC",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(23, "ATC", "event:left:ATC",
+    buttonlist.append(Button(23, "ATC", f"event:{side}:ATC",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(24, "MENU", "event:left:MENU",
+    buttonlist.append(Button(24, "MENU", f"event:{side}:MENU",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(25, "DIM", "event:left:DIM",
+    buttonlist.append(Button(25, "DIM", f"event:{side}:DIM",
                       DrefType.CMD, ButtonType.TOGGLE))
     buttonlist.append(
-        Button(26, "AIRPORT", "event:left:AIRPORT", DrefType.CMD, ButtonType.TOGGLE))
+        Button(26, "AIRPORT", f"event:{side}:AIRPORT", DrefType.CMD, ButtonType.TOGGLE))
     # buttonlist.append(Button(27, "PURSER", "AirbusFBW/purser/fwd",
     #                   DrefType.CMD, ButtonType.TOGGLE))  # 27 empty, map to CALL purser FWD
-    buttonlist.append(Button(28, "SLEW_LEFT", "event:left:LEFT",
+    buttonlist.append(Button(28, "SLEW_LEFT", f"event:{side}:LEFT",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(29, "SLEW_UP", "event:left:UP",
+    buttonlist.append(Button(29, "SLEW_UP", f"event:{side}:UP",
                       DrefType.CMD, ButtonType.TOGGLE))
     buttonlist.append(
-        Button(30, "SLEW_RIGHT", "event:left:RIGHT", DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(31, "SLEW_DOWN", "event:left:DOWN",
+        Button(30, "SLEW_RIGHT", f"event:{side}:RIGHT", DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(31, "SLEW_DOWN", f"event:{side}:DOWN",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(32, "KEY1", "event:left:1",
+    buttonlist.append(Button(32, "KEY1", f"event:{side}:1",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(33, "KEY2", "event:left:2",
+    buttonlist.append(Button(33, "KEY2", f"event:{side}:2",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(34, "KEY3", "event:left:3",
+    buttonlist.append(Button(34, "KEY3", f"event:{side}:3",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(35, "KEY4", "event:left:4",
+    buttonlist.append(Button(35, "KEY4", f"event:{side}:4",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(36, "KEY5", "event:left:5",
+    buttonlist.append(Button(36, "KEY5", f"event:{side}:5",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(37, "KEY6", "event:left:6",
+    buttonlist.append(Button(37, "KEY6", f"event:{side}:6",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(38, "KEY7", "event:left:7",
+    buttonlist.append(Button(38, "KEY7", f"event:{side}:7",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(39, "KEY8", "event:left:8",
+    buttonlist.append(Button(39, "KEY8", f"event:{side}:8",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(40, "KEY9", "event:left:9",
+    buttonlist.append(Button(40, "KEY9", f"event:{side}:9",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(41, "DOT", "event:left:DOT",
+    buttonlist.append(Button(41, "DOT", f"event:{side}:DOT",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(42, "KEY0", "event:left:0",
+    buttonlist.append(Button(42, "KEY0", f"event:{side}:0",
                       DrefType.CMD, ButtonType.TOGGLE))
     buttonlist.append(Button(
-        43, "PLUSMINUS", "event:left:PLUSMINUS", DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(44, "KEYA", "event:left:A",
+        43, "PLUSMINUS", f"event:{side}:PLUSMINUS", DrefType.CMD, ButtonType.TOGGLE))
+    buttonlist.append(Button(44, "KEYA", f"event:{side}:A",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(45, "KEYB", "event:left:B",
+    buttonlist.append(Button(45, "KEYB", f"event:{side}:B",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(46, "KEYC", "event:left:C",
+    buttonlist.append(Button(46, "KEYC", f"event:{side}:C",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(47, "KEYD", "event:left:D",
+    buttonlist.append(Button(47, "KEYD", f"event:{side}:D",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(48, "KEYE", "event:left:E",
+    buttonlist.append(Button(48, "KEYE", f"event:{side}:E",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(49, "KEYF", "event:left:F",
+    buttonlist.append(Button(49, "KEYF", f"event:{side}:F",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(50, "KEYG", "event:left:G",
+    buttonlist.append(Button(50, "KEYG", f"event:{side}:G",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(51, "KEYH", "event:left:H",
+    buttonlist.append(Button(51, "KEYH", f"event:{side}:H",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(52, "KEYI", "event:left:I",
+    buttonlist.append(Button(52, "KEYI", f"event:{side}:I",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(53, "KEYJ", "event:left:J",
+    buttonlist.append(Button(53, "KEYJ", f"event:{side}:J",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(54, "KEYK", "event:left:K",
+    buttonlist.append(Button(54, "KEYK", f"event:{side}:K",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(55, "KEYL", "event:left:L",
+    buttonlist.append(Button(55, "KEYL", f"event:{side}:L",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(56, "KEYM", "event:left:M",
+    buttonlist.append(Button(56, "KEYM", f"event:{side}:M",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(57, "KEYN", "event:left:N",
+    buttonlist.append(Button(57, "KEYN", f"event:{side}:N",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(58, "KEYO", "event:left:O",
+    buttonlist.append(Button(58, "KEYO", f"event:{side}:O",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(59, "KEYP", "event:left:P",
+    buttonlist.append(Button(59, "KEYP", f"event:{side}:P",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(60, "KEYQ", "event:left:Q",
+    buttonlist.append(Button(60, "KEYQ", f"event:{side}:Q",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(61, "KEYR", "event:left:R",
+    buttonlist.append(Button(61, "KEYR", f"event:{side}:R",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(62, "KEYS", "event:left:S",
+    buttonlist.append(Button(62, "KEYS", f"event:{side}:S",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(63, "KEYT", "event:left:T",
+    buttonlist.append(Button(63, "KEYT", f"event:{side}:T",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(64, "KEYU", "event:left:U",
+    buttonlist.append(Button(64, "KEYU", f"event:{side}:U",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(65, "KEYV", "event:left:V",
+    buttonlist.append(Button(65, "KEYV", f"event:{side}:V",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(66, "KEYW", "event:left:W",
+    buttonlist.append(Button(66, "KEYW", f"event:{side}:W",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(67, "KEYX", "event:left:X",
+    buttonlist.append(Button(67, "KEYX", f"event:{side}:X",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(68, "KEYY", "event:left:Y",
+    buttonlist.append(Button(68, "KEYY", f"event:{side}:Y",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(69, "KEYZ", "event:left:Z",
+    buttonlist.append(Button(69, "KEYZ", f"event:{side}:Z",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(70, "SLASH", "event:left:DIV",
+    buttonlist.append(Button(70, "SLASH", f"event:{side}:DIV",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(71, "SPACE", "event:left:SP",
+    buttonlist.append(Button(71, "SPACE", f"event:{side}:SP",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(72, "OVERFLY", "event:left:OVFY",
+    buttonlist.append(Button(72, "OVERFLY", f"event:{side}:OVFY",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(73, "Clear", "event:left:CLR",
+    buttonlist.append(Button(73, "Clear", f"event:{side}:CLR",
                       DrefType.CMD, ButtonType.TOGGLE))
-    buttonlist.append(Button(75, "LCDBright", "event:left:BRIGHTUP",
+    buttonlist.append(Button(75, "LCDBright", f"event:{side}:BRIGHTUP",
                       DrefType.DATA, ButtonType.NONE, Leds.SCREEN_BACKLIGHT))
     buttonlist.append(Button(75, "Backlight", "ckpt/fped/lights/mainPedLeft/anim",
                       DrefType.DATA, ButtonType.NONE, Leds.BACKLIGHT))
+    return buttonlist
 
 
-def xor_bitmask(a, b, bitmask):
-    return (a & bitmask) != (b & bitmask)
-
-
-def mcdu_button_event():
-    # print(f'events: press: {buttons_press_event}, release: {buttons_release_event}')
+def create_bindings(buttonlist):
+    # every key of one MCDU side encoded into its websocket frame,
+    # a key press is then a lookup and one send
+    bindings = {}
     for b in buttonlist:
-
-        if not any(buttons_press_event):  # and not any(buttons_release_event):
-            break
-        if b.id == None:
+        if b.id is None:
             continue
-        if buttons_press_event[b.id]:
-            buttons_press_event[b.id] = 0
-
-            if device_config & DEVICEMASK.FO:
-                b.dataref = b.dataref.replace(
-                    'AirbusFBW/MCDU1', 'AirbusFBW/MCDU2')
-
-            # print(f'button {b.label} pressed')
-            if b.type == ButtonType.TOGGLE:
-                val = b.dataref
-                if b.dreftype == DrefType.DATA:
-                    print(
-                        f'set dataref {b.dataref} from {bool(val)} to {not bool(val)}')
-                    # xp.WriteDataRef(b.dataref, not bool(val))
-                elif b.dreftype == DrefType.CMD:
-                    ws.send(b.dataref)
-                    print(f'send command {b.dataref}')
-                    # xp.sendCommand(b.dataref)
-            elif b.type == ButtonType.SWITCH:
-                # val = datacache[b.dataref]
-                # if b.dreftype == DrefType.DATA:
-                #     print(f'set dataref {b.dataref} to 1')
-                #     # xp.WriteDataRef(b.dataref, 1)
-                # elif b.dreftype == DrefType.CMD:
-                    print(f'send command {b.dataref}')
-                    # xp.sendCommand(b.dataref)
-            # elif b.type == ButtonType.SEND_0:
-            #     if b.dreftype == DrefType.DATA:
-            #         print(f'set dataref {b.dataref} to 0')
-            #         # xp.WriteDataRef(b.dataref, 0)
-            # elif b.type == ButtonType.SEND_1:
-            #     if b.dreftype == DrefType.DATA:
-            #         print(f'set dataref {b.dataref} to 1')
-            #         # xp.WriteDataRef(b.dataref, 1)
-            # elif b.type == ButtonType.SEND_2:
-            #     if b.dreftype == DrefType.DATA:
-            #         print(f'set dataref {b.dataref} to 2')
-            #         # xp.WriteDataRef(b.dataref, 2)
-            # elif b.type == ButtonType.SEND_3:
-            #     if b.dreftype == DrefType.DATA:
-            #         print(f'set dataref {b.dataref} to 3')
-            #         # xp.WriteDataRef(b.dataref, 3)
-            # elif b.type == ButtonType.SEND_4:
-            #     if b.dreftype == DrefType.DATA:
-            #         print(f'set dataref {b.dataref} to 4')
-            #         # xp.WriteDataRef(b.dataref, 4)
-            # elif b.type == ButtonType.SEND_5:
-            #     if b.dreftype == DrefType.DATA:
-            #         print(f'set dataref {b.dataref} to 5')
-            #         # xp.WriteDataRef(b.dataref, 5)
-            else:
-                print(f'no known button type for button {b.label}')
-        # if buttons_release_event[b.id]:
-        #     buttons_release_event[b.id] = 0
-        #     print(f'button {b.label} released')
-        #     if b.type == ButtonType.SWITCH:
-        #         print("asd")
-        #         #xp.WriteDataRef(b.dataref, 0)
+        binding = Binding(b.label)
+        if b.type == ButtonType.TOGGLE:
+            if b.dreftype == DrefType.DATA:
+                binding.log = f'set dataref {b.dataref} from {bool(b.dataref)} to {not bool(b.dataref)}'
+            elif b.dreftype == DrefType.CMD:
+                binding.frame = TextFrame(b.dataref)
+                binding.log = f'send command {b.dataref}'
+        elif b.type == ButtonType.SWITCH:
+            binding.log = f'send command {b.dataref}'
+        else:
+            binding.log = f'no known button type for button {b.label}'
+        bindings[b.id] = binding
+    return bindings
 
 
-def mcdu_create_events(usb_mgr, display_mgr):
-    global values
-    sleep(2)  # wait for values to be available
-    buttons_last = 0
-    while True:
+def mcdu_button_event(mcdu, button_id, pressed):
+    if not pressed:
+        return  # SimBridge only knows key presses
+    binding = mcdu.bindings.get(button_id)
+    if binding is None:
+        return
+    if binding.frame:
+        sim.send(binding.frame)
+    if binding.log:
+        print(binding.log)
 
-        # set_datacache(usb_mgr, display_mgr, values.copy())
-        values_processed.set()
-        sleep(0.005)
-        # print('#', end='', flush=True) # TEST1: should print many '#' in console
-        try:
-            data_in = usb_mgr.device.read(0x81, 25)
-        except Exception as error:
-            print(f' *** continue after usb-in error: {error} ***')  # TODO
-            sleep(0.5)  # TODO remove
-            continue
-        if len(data_in) == 14:  # we get this often but don't understand yet. May have someting to do with leds set
-            continue
-        if len(data_in) != 25:
-            print(f'rx data count {len(data_in)} not valid')
-            continue
-        # print(f"data_in: {data_in}")
 
-        # create button bit-pattern
-        buttons = 0
-        for i in range(12):
-            buttons |= data_in[i + 1] << (8 * i)
-        # print(hex(buttons)) # TEST2: you should see a difference when pressing buttons
-        for i in range(BUTTONS_CNT):
-            mask = 0x01 << i
-            if xor_bitmask(buttons, buttons_last, mask):
-                # print(f"buttons: {format(buttons, "#04x"):^14}")
-                if buttons & mask:
-                    buttons_press_event[i] = 1
-                # else: Button releasing not necessary in simbrief
-                #     buttons_release_event[i] = 1
+def mcdu_dispatch_buttons(mcdu):
+    dispatch_buttons(mcdu.name, mcdu.button_events, lambda button_id, pressed: mcdu_button_event(mcdu, button_id, pressed))
+
 
-                mcdu_button_event()
+def mcdu_input_error(mcdu, error):
+    if not mcdu.usb:
+        return input_error(error)
+    # unplugged, wait for the supervisor to reopen it
+    mcdu.lost(error)
+    mcdu.connected.wait()
+    return True
 
-        buttons_last = buttons
 
+def mcdu_create_events(mcdu):
+    if input_scheduling:
+        input_scheduling.apply(mcdu.name)
+    sleep(2)  # wait for values to be available
+    read_buttons(mcdu.name, lambda: mcdu.device, mcdu.button_events,
+                 lambda error: mcdu_input_error(mcdu, error), activity=idle_monitor.activity)
 
-def update_mcdu(display_mgr, data):
-    display_mgr.empty_page()
+
+def update_mcdu(page_buf, data):
+    # Renders the data of one MCDU side into page_buf, returns the frame for the devices
+    page_buf.empty_page()
+    leds = {Leds.FAIL: 0}
 
     # Update status LEDs
-    update_annunciators(data['annunciators'])
+    leds.update(update_annunciators(data['annunciators']))
 
     # Update brightness
-    screen_backlight_brightness = math.ceil(data['displayBrightness'] * 255)
-    backlight_brightness = math.ceil(data['integralBrightness'] * 255)
-
-    winwing_mcdu_set_leds(Leds.SCREEN_BACKLIGHT, screen_backlight_brightness)
-    winwing_mcdu_set_leds(Leds.BACKLIGHT, backlight_brightness)
+    leds[Leds.SCREEN_BACKLIGHT] = math.ceil(data['displayBrightness'] * 255)
+    leds[Leds.BACKLIGHT] = math.ceil(data['integralBrightness'] * 255)
 
     # TITLE TEXT
     text, spaces, color, font_small = line_parser(data['title'])
@@ -601,7 +314,7 @@ def update_mcdu(display_mgr, data):
         print('Warning: no title location')
         spaces = math.floor(12 - (len(text) / 2))
 
-    display_mgr.write_line_to_page(0, spaces, text, color, font_small)
+    page_buf.write_line_to_page(0, spaces, text, color, font_small)
 
     # SCRATCHPAD TEXT
     text, spaces, color, font_small = line_parser(data['scratchpad'])
@@ -611,18 +324,14 @@ def update_mcdu(display_mgr, data):
         print('Warning: no scratchpad location')
         spaces = 0
 
-    display_mgr.write_line_to_page(13, spaces, text, color, font_small)
+    page_buf.write_line_to_page(13, spaces, text, color, font_small)
 
-    update_mcdu_lines(data.get('lines', {}))
+    update_mcdu_lines(page_buf, data.get('lines', {}))
 
-    # Finalize the update
-    # display_mgr.clear()
-    display_mgr.set_from_page()
+    return McduFrame(page_buf.page, leds)
 
 
-def update_mcdu_lines(lines):
-    global display_mgr
-
+def update_mcdu_lines(page_buf, lines):
     for i, line in enumerate(lines):
         # Index for line heigth should always be lower to accomodate for title
         idx = i + 1
@@ -649,13 +358,13 @@ def update_mcdu_lines(lines):
                 s2_text = s2_spaces = s2_color = s2_font_small = None
 
             if s1_present:
-                display_mgr.write_line_to_page(
+                page_buf.write_line_to_page(
                     idx, s1_spaces, s1_text, s1_color, s1_font_small)
 
             if s2_present:
                 s2_spaces = (s2_spaces or 0) + s1_spaces + len(s1_text)
 
-                display_mgr.write_line_to_page(
+                page_buf.write_line_to_page(
                     idx, s2_spaces, s2_text.rstrip(), s2_color, s2_font_small)
             continue
 
@@ -666,13 +375,13 @@ def update_mcdu_lines(lines):
 
         if s1:
             s1_text, s1_spaces, s1_color, s1_font_small = s1
-            display_mgr.write_line_to_page(
+            page_buf.write_line_to_page(
                 idx, s1_spaces, s1_text, s1_color, s1_font_small)
 
         if s2:
             s2_text, s2_spaces, s2_color, s2_font_small = s2
             s2_spaces = 24 - (len(s2_text) + s2_spaces)
-            display_mgr.write_line_to_page(
+            page_buf.write_line_to_page(
                 idx, s2_spaces, s2_text, s2_color, s2_font_small)
 
         if s3:
@@ -680,7 +389,7 @@ def update_mcdu_lines(lines):
             total_width = len(s3_text) + s3_spaces
             s3_spaces = math.ceil(
                 (PAGE_CHARS_PER_LINE / 2) - (total_width / 2))
-            display_mgr.write_line_to_page(
+            page_buf.write_line_to_page(
                 idx, s3_spaces, s3_text, s3_color, s3_font_small)
 
 
@@ -793,126 +502,603 @@ def update_annunciators(annunciators):
         "fm2": Leds.FM2
     }
 
+    leds = {}
     for attribute, value in annunciators.items():
         led_enum = annunciator_to_led.get(attribute)
         if led_enum:
-            brightness = 1 if value else 0
-            winwing_mcdu_set_leds(led_enum, brightness)
+            leds[led_enum] = 1 if value else 0
+    return leds
 
 
-def winwing_mcdu_set_leds(leds, brightness):
-    if isinstance(leds, list):
-        for i in range(len(leds)):
-            winwing_mcdu_set_led(leds[i], brightness)
-    else:
-        winwing_mcdu_set_led(leds, brightness)
+# --- MCDU device pipeline ---
 
+@dataclass
+class McduFrame:
+    page: list
+    leds: dict
+    stale: bool = False  # restored from the state file, not live data
 
-def winwing_mcdu_set_led(led, brightness):
-    global device
-    data = [0x02, 0x32, 0xbb, 0, 0, 3, 0x49,
-            led.value, brightness, 0, 0, 0, 0, 0]
-    if 'data' in locals():
-        cmd = bytes(data)
-        device.write(cmd)
 
+def device_side(mask, observer_side='left'):
+    if mask & DEVICEMASK.FO:
+        return 'right'
+    if mask & DEVICEMASK.OBS:
+        return observer_side
+    return 'left'
 
-# --- Handle simbrige websocket ---
 
-def on_open(ws):
-    global display_mgr
-    print("Opened connection")
-    display_mgr.write_line_to_page(8, 1, 'Connected to SimBridge', 'G')
-    display_mgr.write_line_to_page(9, 1, 'Waiting for display', 'A')
-    display_mgr.set_from_page()
+class McduDevice:
+    # One attached MCDU. Gets the frames of its side (rendered once per side) and
+    # writes them in its own thread, the newest frame replaces one not yet written.
 
+    def __init__(self, device, name: str, mask: int, side: str, display=None, usb: dict = None):
+        self.device = device
+        self.name = name
+        self.mask = mask
+        self.side = side
+        self.usb = usb  # vid, pid and path of a local USB device, None for a remote head
+        self.lock = RLock()  # serializes all writes to the device
+        self.leds = {}
+        self.buttonlist = create_button_list_mcdu(side)
+        self.bindings = create_bindings(self.buttonlist)
+        self.button_events = ButtonEventRing()
+        self.display = display or DisplayManager(self.device)
+        self._frame = None
+        self._frame_ready = Condition()
+        self.frames_written = 0
+        self.stale = False  # showing a restored frame
+        self._last_frame = None  # replayed after a reconnect
+        self.connected = Event()
+        self.connected.set()
+        self._state_lock = Lock()
+        self._watch(device)
+        self.lost_at = None
+        self.reconnects = 0
+        self.last_recovery_ms = None  # from the disconnect until the display was back
+
+    def start(self):
+        Thread(target=mcdu_create_events, args=[self],
+               name=f'{self.name} input').start()
+        Thread(target=mcdu_dispatch_buttons, args=[self],
+               name=f'{self.name} buttons', daemon=True).start()
+        Thread(target=self._write_frames,
+               name=f'{self.name} writer', daemon=True).start()
+
+    def publish(self, frame: McduFrame):
+        with self._frame_ready:
+            self._frame = frame
+            self._frame_ready.notify()
+
+    def set_led(self, led, brightness):
+        if self.leds.get(led) == brightness:
+            return
+        with self.lock:
+            winwing_mcdu_set_leds(self.device, led, brightness)
+        self.leds[led] = brightness
+
+    def lost(self, error):
+        # not under self.lock, a stalled write may hold it
+        with self._state_lock:
+            if not self.connected.is_set():
+                return
+            self.connected.clear()
+            self.lost_at = time.perf_counter()
+        try:
+            if hasattr(self.device, 'abandon'):
+                self.device.abandon()  # closed once a blocked read or write returns
+            else:
+                self.device.close()
+        except Exception:
+            pass
+        print(f' *** {self.name}: disconnected ({error}) ***')
+        if supervisor:
+            supervisor.wake()
+
+    def reopen(self, device, path):
+        # replay init, LEDs and the current frame on the new handle
+        replay_start = time.perf_counter()
+        self.lock = RLock()  # the old one may still be held by a write blocked on the old handle
+        self._watch(device)
+        with self.lock:
+            self.device = device
+            self.display.device = device
+            self.usb['path'] = path
+            if not usb_worker:  # a new usb worker sends the init itself
+                version = mcdu_init.send_init(device)
+                mcdu_init.mark_initialized(path, version)
+            leds, self.leds = self.leds, {}
+            for led, brightness in leds.items():
+                self.set_led(led, brightness)
+            frame = self._last_frame
+            if frame:
+                self.display.set_from_page(frame.page, stale=frame.stale)
+            else:
+                self.display.startupscreen()
+            self.connected.set()
+        now = time.perf_counter()
+        self.reconnects += 1
+        self.last_recovery_ms = (now - self.lost_at) * 1000
+        print(f"{self.name}: reconnected, display back {self.last_recovery_ms:.0f} ms after the disconnect "
+              f"({(now - replay_start) * 1000:.0f} ms to replay)")
+
+    def _watch(self, device):
+        if isinstance(device, WatchedDevice):
+            device.newer_frame = lambda: self._frame is not None
+            device.on_stall = self._on_stall
+
+    def _on_stall(self, device):
+        if device.policy == 'reopen' and device is self.device:
+            self.lost('USB write stalled')
+
+    def _write_frames(self):
+        while True:
+            with self._frame_ready:
+                while self._frame is None:
+                    self._frame_ready.wait()
+                frame = self._frame
+                self._frame = None
+            self._last_frame = frame
+            self.connected.wait()  # an unplugged device gets the last frame when it is back
+            if isinstance(self.device, WatchedDevice):
+                self.device.frame_stalled = False
+            try:
+                with self.lock:
+                    for led, brightness in frame.leds.items():
+                        self.set_led(led, brightness)
+                    self.display.set_from_page(frame.page, stale=frame.stale)
+                    self.stale = frame.stale
+                if not self.frames_written:
+                    timeline.mark(f'first frame on {self.name}')
+                self.frames_written += 1
+            except FrameDropped:
+                pass  # stalled, the newer frame is written next
+            except Exception as error:
+                print(f' *** {self.name}: usb-out error: {error} ***')
+                if self.usb:
+                    self.lost(error)
+
+
+class DeviceSupervisor:
+    # Reopens MCDUs after they were unplugged or failed. Woken by hidraw uevents
+    # (mcdu_hotplug) and by devices that failed, without uevents it rescans every
+    # RESCAN_INTERVAL s but only while a device is missing.
+    RESCAN_INTERVAL = 2
 
-def on_close(ws, close_status_code, close_msg):
-    global display_mgr
-    print(f"WebSocket closed: {close_status_code} - {close_msg}")
-    display_mgr.startupscreen()
+    def __init__(self):
+        self._wake = Event()
+        self.monitor = None
+
+    def start(self):
+        from mcdu_hotplug import UeventMonitor
+        self.monitor = UeventMonitor(lambda action, props: self.wake())
+        if not self.monitor.start():
+            print(f"no hot-plug events, rescanning every {self.RESCAN_INTERVAL} s while an MCDU is missing")
+        Thread(target=self._run, name='device supervisor', daemon=True).start()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            missing = any(not m.connected.is_set() for m in list(devices) if m.usb)
+            if missing and not self.monitor.available:
+                self._wake.wait(self.RESCAN_INTERVAL)
+            else:
+                self._wake.wait()
+            sleep(0.1)  # one plug-in sends a burst of events
+            self._wake.clear()
+            try:
+                self.reconcile()
+            except Exception as error:
+                print(f"device supervisor: {error}")
+
+    def reconcile(self):
+        attached = {d['path']: d for d in UsbManager().find_devices(verbose=False)}
+        usb_devices = [m for m in list(devices) if m.usb]
+        for mcdu in usb_devices:
+            if mcdu.connected.is_set() and mcdu.usb['path'] not in attached:
+                mcdu.lost('unplugged')
+        in_use = {m.usb['path'] for m in usb_devices if m.connected.is_set()}
+        for mcdu in usb_devices:
+            if mcdu.connected.is_set():
+                continue
+            for path, d in attached.items():
+                if path in in_use or d['pid'] != mcdu.usb['pid']:
+                    continue
+                device = None
+                try:
+                    device = open_usb_device(d, mcdu.name)
+                    mcdu.reopen(device, path)
+                    in_use.add(path)
+                except Exception as error:
+                    # e.g. the kernel event came before udev set the permissions, the udev event follows
+                    print(f"{mcdu.name}: could not reopen yet: {error}")
+                    if device is not None:
+                        device.close()
+                break
+
+
+# --- Handle the SimBridge connection (SimSource handlers) ---
+
+def on_open():
+    print("Opened connection")
+    timeline.mark(f'{sim.name} connected')
+    for mcdu in list(devices):
+        if mcdu.stale or not mcdu.connected.is_set():
+            continue  # keep the restored page until the first update
+        with mcdu.lock:
+            mcdu.display.write_line_to_page(8, 1, f'Connected to {sim.name}', 'G')
+            mcdu.display.write_line_to_page(9, 1, 'Waiting for display', 'A')
+            mcdu.display.set_from_page()
+
+
+def on_close(reason):
+    print(f"WebSocket closed: {reason}")
+    for mcdu in list(devices):
+        if not mcdu.connected.is_set():
+            continue
+        with mcdu.lock:
+            mcdu.display.startupscreen()
+            mcdu.stale = False
 
 
-def on_error(ws, error):
-    global display_mgr
+def on_error(error):
     print(f"WebSocket error: {error}")
 
-    winwing_mcdu_set_leds(Leds.SCREEN_BACKLIGHT, 128)
-    winwing_mcdu_set_leds(Leds.FAIL, 1)
-    display_mgr.startupscreen()
-    display_mgr.write_line_to_page(4, 1, 'Connection to ', 'R')
-    display_mgr.write_line_to_page(5, 1, 'SimBridge failed ', 'R')
-    display_mgr.write_line_to_page(6, 1, str(error)[0:22], 'R', True)
-
-    display_mgr.set_from_page()
+    for mcdu in list(devices):
+        if not mcdu.connected.is_set():
+            continue
+        with mcdu.lock:
+            mcdu.set_led(Leds.SCREEN_BACKLIGHT, 128)
+            mcdu.set_led(Leds.FAIL, 1)
+            mcdu.display.startupscreen()
+            mcdu.display.write_line_to_page(4, 1, 'Connection to ', 'R')
+            mcdu.display.write_line_to_page(5, 1, 'SimBridge failed ', 'R')
+            mcdu.display.write_line_to_page(6, 1, str(error)[0:22], 'R', True)
+            mcdu.display.set_from_page()
     sleep(5)
 
-    display_mgr.empty_page()
-    display_mgr.clear()
-    display_mgr.startupscreen()
+    for mcdu in list(devices):
+        if not mcdu.connected.is_set():
+            continue
+        with mcdu.lock:
+            mcdu.display.empty_page()
+            mcdu.display.clear()
+            mcdu.display.startupscreen()
+
 
-    websocket_thread = Thread(target=setup_websocket)
+def on_message(message):
+    if not quiet:
+        print(f"Message received: {message}")
 
+    if proxy:
+        proxy.broadcast(message)
 
-def on_message(ws, message):
-    global display_mgr
-    print(f"Message received: {message}")
+    if recorder:
+        recorder.write(message + '\n')
 
-    winwing_mcdu_set_leds(Leds.FAIL, 0)
+    idle_monitor.activity('simbridge')
 
     if message.startswith("update:"):
-        dict_left = json.loads(message[len("update:"):]).get('left', {})
-        update_mcdu(display_mgr, dict_left)
-
-
-def setup_websocket():
-    global ws
-    ws = websocket.WebSocket()
-    try:
-        ws = websocket.WebSocketApp("ws://localhost:8380/interfaces/v1/mcdu",
-                                    on_open=on_open,
-                                    on_message=on_message,
-                                    on_error=on_error,
-                                    on_close=on_close)
-        ws.run_forever()
-
-    except Exception as e:
-        print(f"WebSocket error: {e}")
-    finally:
-        return
+        timeline.mark('first update received')
+        # parse once, only the sides with an MCDU, render once per side and fan out to the devices of that side
+        update = decode_update(message[len("update:"):], renderers)
+        for side, page_buf in renderers.items():
+            data = update.get(side)
+            if not data:
+                continue
+            frame = update_mcdu(page_buf, data)
+            last_frames[side] = frame
+            if state_store:
+                state_store.update(side, frame.page, frame.leds)
+            if web_mirror:
+                web_mirror.publish(side, frame.page)
+            for mcdu in list(devices):
+                if mcdu.side == side:
+                    mcdu.publish(frame)
 
-    return None
 
+def send_to_simbridge(message):
+    sim.send(message)
 
-# --- Main ---
-def main():
-    global display_mgr
-    global device
 
+# --- Main ---
+class StartupTimeline:
+    # Prints the time since start for the steps of the cold start
+
+    def __init__(self, t0):
+        self.t0 = t0
+        self.budget_ms = None
+        self.marks = {}
+        self._lock = Lock()
+
+    def mark(self, event: str):
+        with self._lock:
+            if event in self.marks:
+                return
+            ms = (time.perf_counter() - self.t0) * 1000
+            self.marks[event] = ms
+        print(f"startup: {ms:8.1f} ms  {event}")
+        if self.budget_ms and event.startswith('first frame') and ms > self.budget_ms:
+            print(f"startup: *** first frame after {ms:.0f} ms, budget is {self.budget_ms:.0f} ms ***")
+
+
+timeline = StartupTimeline(STARTUP_T0)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Winwing MCDU for MSFS via FlyByWire SimBridge')
+    parser.add_argument('--mirror', action='store_true',
+                        help='mirror the MCDU screen in the terminal (replaces the raw message dump)')
+    parser.add_argument('--mirror-fps', type=float, default=10,
+                        help='max refresh rate of the terminal mirror (default: 10)')
+    parser.add_argument('--proxy-port', type=int, default=0,
+                        help='re-broadcast the SimBridge MCDU stream to more clients on this port')
+    parser.add_argument('--web-port', type=int, default=0,
+                        help='serve a web mirror of the MCDU screens on this port')
+    parser.add_argument('--remote-head', metavar='HOST:PORT',
+                        help='drive an MCDU attached to a remote display head (remote_head.py)')
+    parser.add_argument('--remote-udp', action='store_true',
+                        help='talk to the remote display head over UDP instead of TCP')
+    parser.add_argument('--remote-side', choices=['left', 'right'], default='left',
+                        help='MCDU side shown on the remote display head (default: left)')
+    parser.add_argument('--state-file', metavar='PATH',
+                        help='where the last page and LEDs are kept (default: ~/.local/state/winwing_mcdu/)')
+    parser.add_argument('--no-state', action='store_true',
+                        help='do not restore the last page on start and do not save it')
+    parser.add_argument('--usb-stall-ms', type=float, default=STALL_MS, metavar='MS',
+                        help=f'report USB writes that take longer than this (default: {STALL_MS})')
+    parser.add_argument('--usb-stall-policy', choices=['retry', 'drop', 'reopen'], default='drop',
+                        help='on a stalled write: only log it, drop the rest of the stale frame (default) '
+                             'or reopen the device')
+    parser.add_argument('--usb-stats', type=float, metavar='S',
+                        help='print the USB write statistics every S seconds')
+    parser.add_argument('--selftest', action='store_true',
+                        help='measure the report rate the MCDUs take, used to pace the writes later')
+    parser.add_argument('--no-pacing', action='store_true',
+                        help='write as fast as possible, ignore the measured rate')
+    parser.add_argument('--usb-worker', action='store_true',
+                        help='own the HID devices in worker processes, keeps the input latency flat. '
+                             'The worker writes without the USB watchdog and pacing (--usb-stall-ms, '
+                             '--usb-stall-policy, --usb-stats, --selftest pacing); an unplugged MCDU '
+                             'gets a new worker when it is back')
+    parser.add_argument('--usb-backend', choices=['hidapi', 'libusb'], default='hidapi',
+                        help='hidapi (default) or libusb with asynchronous transfers: input always polled, '
+                             'the reports of a frame pipelined (needs pip install libusb1)')
+    parser.add_argument('--cold-start', action='store_true',
+                        help='always send the display init, even if the MCDU was initialized before')
+    parser.add_argument('--startup-budget', type=float, metavar='MS',
+                        help='warn when the first frame takes longer than this after start')
+    parser.add_argument('--record', metavar='FILE',
+                        help='append every SimBridge message to FILE, one per line (input for benchmark.py)')
+    parser.add_argument('--replay', metavar='FILE',
+                        help='no SimBridge: replay the messages of a --record file, from the start again at the end')
+    parser.add_argument('--replay-rate', type=float, default=4, metavar='N',
+                        help='messages per second of --replay, 0 for as fast as they are rendered (default: 4)')
+    parser.add_argument('--observer-side', choices=['left', 'right'], default='left',
+                        help='MCDU side shown on an observer MCDU (default: left)')
+    parser.add_argument('--idle-after', type=float, default=idle_monitor.idle_after, metavar='S',
+                        help='idle mode after S seconds without SimBridge updates or key presses, prints the '
+                             f'wakeups and CPU use of the idle period when it ends (default: {idle_monitor.idle_after:.0f})')
+    parser.add_argument('--rt-priority', type=int, metavar='N',
+                        help='real-time priority (SCHED_FIFO 1..99) for the MCDU input threads')
+    parser.add_argument('--nice', type=int, metavar='N',
+                        help='nice value of the MCDU input threads, e.g. -10 (negative needs CAP_SYS_NICE)')
+    parser.add_argument('--input-cpu', type=int, metavar='CPU',
+                        help='pin the MCDU input threads to this CPU')
+    parser.add_argument('--mlock', action='store_true',
+                        help='lock the memory of the bridge (and of the usb workers) in RAM')
+    parser.add_argument('--jitter-test', type=float, nargs='?', const=10, metavar='S',
+                        help='measure the input timing for S s (default 10) with the default scheduling '
+                             'and with the settings above, then quit')
+    parser.add_argument('--debug-dir', metavar='DIR',
+                        help='where profiles, heap snapshots and thread stacks are written '
+                             '(default: ~/.local/state/winwing_mcdu/debug/)')
+    parser.add_argument('--no-debug-hooks', action='store_true',
+                        help='no SIGUSR1/SIGUSR2 handlers and no debug socket')
+    return parser.parse_args()
+
+
+def restored_frame(page, leds):
+    # last page of the previous run, the scratchpad line shows that it is not live
+    if len(page) != PAGE_LINES or any(len(row) != PAGE_BYTES_PER_LINE for row in page):
+        return None
+    page_buf = PageBuffer()
+    page_buf.page = page
+    page_buf.write_line_to_page(PAGE_LINES - 1, 0, ' ' * PAGE_CHARS_PER_LINE)
+    page_buf.write_line_to_page(PAGE_LINES - 1, 0, 'NO LIVE DATA', 'A')
+    leds = {Leds[name]: brightness for name, brightness in leds.items() if name in Leds.__members__}
+    return McduFrame(page_buf.page, leds, stale=True)
+
+
+def watched(device, name, vid, pid):
+    device = WatchedDevice(device, name, **usb_watchdog)
+    if pacing:
+        rate = calibrated_rate(f'{vid:04x}:{pid:04x}')
+        if rate:
+            device.pacer = ReportPacer(rate)
+    return device
+
+
+def run_selftest(d):
+    # ramp the report rate on one MCDU and keep the result for the pacing
     usb = UsbManager()
+    usb.connect_device(d['vid'], d['pid'], d['path'])
+    display = DisplayManager(usb.device, d['path'])
+    print(f"{d['name']}: self-test, watch the display, the stripes must stay unbroken")
+    result = selftest(display, d['name'])
+    save_calibration(f"{d['vid']:04x}:{d['pid']:04x}", result)
+    print(f"{d['name']}: sustainable rate {result['safe_reports_per_s']} reports/s, "
+          f"the bridge will use {result['safe_reports_per_s'] * SAFETY:.0f}/s")
+
+
+def add_device(mcdu):
+    if not mcdu.display.warm:
+        mcdu.display.startupscreen()
+    with devices_lock:
+        if console_mirror and not devices:
+            mcdu.display.mirror = console_mirror
+        devices.append(mcdu)
+    mcdu.start()
+    timeline.mark(f'{mcdu.name} ready')
+    frame = last_frames.get(mcdu.side)
+    if frame:  # SimBridge was faster than the device
+        mcdu.publish(frame)
+
+
+def open_usb_device(d, name, warm_start=True):
+    # the device for an MCDU, after a reconnect as well
+    if usb_worker:
+        from mcdu_worker import WorkerLink
+        return WorkerLink(dict(d, backend=UsbManager.backend), name, warm_start, input_scheduling)
+    usb = UsbManager()
+    usb.connect_device(d['vid'], d['pid'], d['path'])
+    return watched(usb.device, name, d['vid'], d['pid'])
 
-    vid, pid, device_config = usb.find_device()
-    if not vid or not pid:
-        print("No compatible MCDU USB device found.")
-        return
-
-    usb.connect_device(vid, pid)
-
-    device = usb.device
 
-    display_mgr = DisplayManager(device)
+def bring_up_usb_device(d, warm_start=True):
+    usb_ids = {'vid': d['vid'], 'pid': d['pid'], 'path': d['path']}
+    if usb_worker:
+        # the HID device is owned by a worker process, pages go through shared memory
+        print(f"{d['name']} shows the {d['side']} MCDU (usb worker process)")
+        link = open_usb_device(d, d['name'], warm_start)
+        add_device(McduDevice(link, d['name'], d['mask'], d['side'], RemoteDisplay(link), usb=usb_ids))
+        return
+    device = open_usb_device(d, d['name'])
+    print(f"{d['name']} shows the {d['side']} MCDU")
+    display = DisplayManager(device, d['path'], warm_start)
+    if display.warm:
+        print(f"{d['name']} already initialized, warm start")
+    add_device(McduDevice(device, d['name'], d['mask'], d['side'], display, usb=usb_ids))
 
-    create_button_list_mcdu()
 
-    display_mgr.empty_page()
-    display_mgr.clear()
-    display_mgr.startupscreen()
+def print_usb_stats(interval):
+    while True:
+        idle_monitor.wait_active()  # nothing changes while idle
+        sleep(interval)
+        for mcdu in list(devices):
+            if isinstance(mcdu.device, WatchedDevice):
+                print(f"{mcdu.name}: {mcdu.device.summary()}, {mcdu.device.stats()['histogram_ms']}")
 
-    usb_thread = Thread(target=mcdu_create_events, args=[usb, display_mgr])
-    usb_thread.start()
 
-    websocket_thread = Thread(target=setup_websocket)
-    websocket_thread.start()
+def main():
+    global quiet
+    global proxy
+    global web_mirror
+    global console_mirror
+    global state_store
+    global supervisor
+    global pacing
+    global usb_worker
+    global recorder
+    global debug_hooks
+    global input_scheduling
+    global sim
+
+    timeline.mark('imports done')
+    args = parse_args()
+    if not args.no_debug_hooks:
+        from mcdu_debug import DebugHooks
+        debug_hooks = DebugHooks(args.debug_dir)
+        debug_hooks.install()
+    timeline.budget_ms = args.startup_budget
+    usb_watchdog.update(stall_ms=args.usb_stall_ms, policy=args.usb_stall_policy)
+    pacing = not args.no_pacing
+    usb_worker = args.usb_worker
+    UsbManager.backend = args.usb_backend
+    idle_monitor.idle_after = args.idle_after
+    idle_monitor.start()
+    if args.rt_priority or args.nice is not None or args.input_cpu is not None or args.mlock or args.jitter_test:
+        from mcdu_rt import InputScheduling
+        input_scheduling = InputScheduling(args.rt_priority, args.nice, args.input_cpu, args.mlock)
+
+    found = []
+    if args.remote_head:
+        from remote_head import HostLink
+        # the MCDU is attached to a display head somewhere else
+        link = HostLink(args.remote_head, udp=args.remote_udp)
+        link.start()
+        sides = [args.remote_side]
+    else:
+        found = UsbManager().find_devices()
+        timeline.mark('devices found')
+        if not found:
+            print("No compatible MCDU USB device found.")
+            return
+        if args.selftest:
+            for d in found:
+                run_selftest(d)
+            return
+        if args.jitter_test:
+            from mcdu_rt import jitter_test
+            for d in found:
+                usb = UsbManager()
+                usb.connect_device(d['vid'], d['pid'], d['path'])
+                jitter_test(usb.device.read, d['name'], input_scheduling, args.jitter_test)
+            return
+        for d in found:
+            d['side'] = device_side(d['mask'], args.observer_side)
+        sides = [d['side'] for d in found]
+
+    for side in sides:
+        renderers.setdefault(side, PageBuffer())
+
+    if not args.no_state:
+        from mcdu_state import StateStore
+        state_store = StateStore(args.state_file)
+        for side, (page, leds) in state_store.load().items():
+            frame = restored_frame(page, leds)
+            if side in renderers and frame:
+                last_frames[side] = frame
+        state_store.start()
+
+    if args.mirror:
+        console_mirror = TerminalMirror(fps=args.mirror_fps)
+        console_mirror.start()
+        quiet = True
+
+    if args.web_port:
+        from web_mirror import WebMirror
+        web_mirror = WebMirror(args.web_port)
+        web_mirror.start()
+
+    if args.record:
+        recorder = open(args.record, 'a', buffering=1)  # line buffered, a crash keeps all but the last message
+        print(f"recording SimBridge messages to {args.record}")
+
+    if args.proxy_port:
+        from simbridge_proxy import SimBridgeProxy
+        proxy = SimBridgeProxy(args.proxy_port, send_to_simbridge)
+        proxy.start()
+
+    # connect to SimBridge while the devices are initialized
+    if args.replay:
+        from mcdu_sim import ReplaySource
+        sim = ReplaySource(args.replay, args.replay_rate)
+    else:
+        sim = SimBridgeSource()
+    sim.on_connect = on_open
+    sim.on_data = on_message
+    sim.on_disconnect = on_close
+    sim.on_error = on_error
+    sim.start()
+
+    if args.remote_head:
+        mask = DEVICEMASK.MCDU | (DEVICEMASK.FO if args.remote_side == 'right' else DEVICEMASK.CAP)
+        add_device(McduDevice(link, f'MCDU at {args.remote_head}', mask,
+                              args.remote_side, RemoteDisplay(link)))
+    else:
+        init_threads = [Thread(target=bring_up_usb_device, args=[d, not args.cold_start]) for d in found]
+        for t in init_threads:
+            t.start()
+        for t in init_threads:
+            t.join()
+        supervisor = DeviceSupervisor()
+        supervisor.start()
+        if args.usb_stats:
+            Thread(target=print_usb_stats, args=[args.usb_stats], name='usb stats', daemon=True).start()
+    timeline.mark('all devices ready')
 
 
 if __name__ == "__main__":
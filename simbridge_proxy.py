@@ -0,0 +1,283 @@
+# Local websocket that re-broadcasts the SimBridge MCDU stream to any number of
+# clients (tablets, second screens, ...) over the one upstream connection of the
+# bridge, and forwards their 'event:' commands upstream.
+# Minimal RFC 6455 server, stdlib only.
+
+import base64
+import hashlib
+import json
+import socket
+import struct
+from collections import deque
+from socketserver import ThreadingTCPServer, BaseRequestHandler
+from threading import Thread, Condition, Lock
+from time import time
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONT = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xa
+
+MAX_PAYLOAD = 1 << 20      # clients only send short commands
+QUEUE_LEN = 16             # non 'update:' messages kept per client
+SEND_TIMEOUT = 10          # seconds until a client that does not read is dropped
+
+
+class WebSocketClosed(Exception):
+    pass
+
+
+def encode_frame(payload: bytes, opcode: int = OP_TEXT) -> bytes:
+    n = len(payload)
+    if n < 126:
+        header = struct.pack('!BB', 0x80 | opcode, n)
+    elif n < 0x10000:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+    return header + payload
+
+
+def _read_exact(rfile, n):
+    data = rfile.read(n)
+    if data is None or len(data) < n:
+        raise WebSocketClosed()
+    return data
+
+
+def read_frame(rfile):
+    b0, b1 = _read_exact(rfile, 2)
+    fin = bool(b0 & 0x80)
+    opcode = b0 & 0x0f
+    n = b1 & 0x7f
+    if n == 126:
+        n = struct.unpack('!H', _read_exact(rfile, 2))[0]
+    elif n == 127:
+        n = struct.unpack('!Q', _read_exact(rfile, 8))[0]
+    if n > MAX_PAYLOAD:
+        raise WebSocketClosed(f'frame too large ({n} bytes)')
+    mask = _read_exact(rfile, 4) if b1 & 0x80 else None
+    payload = _read_exact(rfile, n) if n else b''
+    if mask:
+        key = int.from_bytes((mask * (n // 4 + 1))[:n], 'big')
+        payload = (int.from_bytes(payload, 'big') ^ key).to_bytes(n, 'big')
+    return fin, opcode, payload
+
+
+def read_http_request(rfile):
+    request_line = rfile.readline(4096).decode('latin-1').strip()
+    headers = {}
+    while True:
+        line = rfile.readline(4096).decode('latin-1')
+        if line in ('\r\n', '\n', ''):
+            break
+        key, _, value = line.partition(':')
+        headers[key.strip().lower()] = value.strip()
+    parts = request_line.split()
+    path = parts[1] if len(parts) > 1 else '/'
+    return path, headers
+
+
+def accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+class ProxyClient:
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = f'{addr[0]}:{addr[1]}'
+        self.connected = time()
+        self.closed = False
+        self._send_lock = Lock()
+        self._pending = Condition()
+        self._update = None                   # latest 'update:' frame, latest wins
+        self._queue = deque(maxlen=QUEUE_LEN)  # other messages, oldest dropped
+
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.updates_dropped = 0   # replaced by a newer update before it was sent
+        self.messages_dropped = 0
+        self.events_forwarded = 0
+        self.events_failed = 0
+
+    def push(self, frame: bytes, is_update: bool):
+        with self._pending:
+            if is_update:
+                if self._update is not None:
+                    self.updates_dropped += 1
+                self._update = frame
+            else:
+                if len(self._queue) == self._queue.maxlen:
+                    self.messages_dropped += 1
+                self._queue.append(frame)
+            self._pending.notify()
+
+    def send(self, frame: bytes):
+        with self._send_lock:
+            self.sock.sendall(frame)
+        self.frames_sent += 1
+        self.bytes_sent += len(frame)
+
+    def close(self):
+        with self._pending:
+            self.closed = True
+            self._pending.notify()
+
+    def write_loop(self):
+        try:
+            while True:
+                with self._pending:
+                    while not self.closed and self._update is None and not self._queue:
+                        self._pending.wait()
+                    if self.closed:
+                        return
+                    frames = list(self._queue)
+                    self._queue.clear()
+                    if self._update is not None:
+                        frames.append(self._update)
+                        self._update = None
+                for frame in frames:
+                    self.send(frame)
+        except OSError:
+            self.close()
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)  # wakes up the reader
+            except OSError:
+                pass
+
+    def stats(self):
+        return {
+            'client': self.addr,
+            'connected_s': round(time() - self.connected, 1),
+            'frames_sent': self.frames_sent,
+            'bytes_sent': self.bytes_sent,
+            'updates_dropped': self.updates_dropped,
+            'messages_dropped': self.messages_dropped,
+            'events_forwarded': self.events_forwarded,
+            'events_failed': self.events_failed,
+        }
+
+
+class _Handler(BaseRequestHandler):
+    def handle(self):
+        self.server.proxy.serve_client(self.request, self.client_address)
+
+
+class _Server(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SimBridgeProxy:
+    def __init__(self, port: int, send_upstream, host: str = '0.0.0.0'):
+        self.host = host
+        self.port = port
+        self.send_upstream = send_upstream  # callable(str), sends to SimBridge
+        self.clients = []
+        self._lock = Lock()
+        self._last_update = None
+        self._server = None
+
+    def start(self):
+        self._server = _Server((self.host, self.port), _Handler)
+        self._server.proxy = self
+        Thread(target=self._server.serve_forever,
+               name='simbridge proxy', daemon=True).start()
+        print(f"SimBridge proxy listening on ws://{self.host}:{self.port}/interfaces/v1/mcdu")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def broadcast(self, message: str):
+        # encoded once, the same frame is shared by all clients
+        frame = encode_frame(message.encode('utf-8'))
+        is_update = message.startswith('update:')
+        with self._lock:
+            if is_update:
+                self._last_update = frame
+            clients = list(self.clients)
+        for client in clients:
+            client.push(frame, is_update)
+
+    def stats(self):
+        with self._lock:
+            return [c.stats() for c in self.clients]
+
+    def serve_client(self, sock, addr):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(SEND_TIMEOUT)
+        rfile = sock.makefile('rb')
+        path, headers = read_http_request(rfile)
+
+        if headers.get('upgrade', '').lower() != 'websocket' or 'sec-websocket-key' not in headers:
+            if path.rstrip('/') == '/stats':
+                body = json.dumps(self.stats(), indent=1).encode()
+                sock.sendall(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                             + f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            else:
+                sock.sendall(b'HTTP/1.1 400 Bad Request\r\nConnection: close\r\nContent-Length: 0\r\n\r\n')
+            return
+
+        sock.sendall(('HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+                      f'Sec-WebSocket-Accept: {accept_key(headers["sec-websocket-key"])}\r\n\r\n').encode())
+        sock.settimeout(None)
+        try:
+            # reads block forever, but a client that stops reading is dropped
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO, struct.pack('ll', SEND_TIMEOUT, 0))
+        except (OSError, struct.error):
+            pass
+
+        client = ProxyClient(sock, addr)
+        with self._lock:
+            self.clients.append(client)
+            keyframe = self._last_update
+        if keyframe:
+            client.push(keyframe, True)
+        print(f"proxy: client {client.addr} connected ({len(self.clients)} clients)")
+
+        writer = Thread(target=client.write_loop, name=f'proxy {client.addr}', daemon=True)
+        writer.start()
+        try:
+            self._read_loop(client, rfile)
+        except (WebSocketClosed, OSError):
+            pass
+        finally:
+            client.close()
+            with self._lock:
+                if client in self.clients:
+                    self.clients.remove(client)
+            print(f"proxy: client {client.addr} disconnected {client.stats()}")
+
+    def _read_loop(self, client, rfile):
+        message = b''
+        while not client.closed:
+            fin, opcode, payload = read_frame(rfile)
+            if opcode == OP_CLOSE:
+                client.send(encode_frame(payload[:2], OP_CLOSE))
+                return
+            if opcode == OP_PING:
+                client.send(encode_frame(payload, OP_PONG))
+                continue
+            if opcode == OP_PONG:
+                continue
+            message += payload
+            if len(message) > MAX_PAYLOAD:
+                raise WebSocketClosed('message too large')
+            if not fin:
+                continue
+            text = message.decode('utf-8', errors='replace')
+            message = b''
+            if not text.startswith('event:'):
+                continue
+            try:
+                self.send_upstream(text)
+                client.events_forwarded += 1
+            except Exception as error:
+                client.events_failed += 1
+                print(f"proxy: could not forward {text} from {client.addr}: {error}")
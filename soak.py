@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# Soak test of simbridge.py, no MCDU or simulator needed.
+# usage: python3 soak.py [--profile realistic|stress] [--duration S] [--interval S]
+#
+# A mock SimBridge feed sends updates for both sides at the rate of the profile and
+# answers the keys like SimBridge (the scratchpad shows them), the bridge drives an
+# emulated MCDU (mcdu_emulator.py). Key presses on the MCDU are the latency probe:
+# from the input report until the screen shows the key, through the input ring,
+# the dispatch, the websocket, the decoding, the render and the USB writes.
+# The SimBridge connection is dropped and opened again every --reconnect-every s.
+#
+# Every --interval s a line is printed with the RSS, the number of Python objects,
+# the threads, the queue depths and the latency percentiles of that interval.
+# After the run the samples after --warmup are checked:
+#   - RSS and the objects of every type must not grow more than the allowed
+#     rate (least squares fit over the samples, so a single spike does not count)
+#   - the number of threads must not grow
+#   - the p50 and p90 latency of the last quarter must not exceed the first quarter
+#     by more than --max-latency-drift
+# The exit code is 1 if one of the checks failed.
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import queue
+import random
+import sys
+from collections import Counter
+from threading import Thread, Lock, active_count
+from time import monotonic, perf_counter, sleep
+
+from benchmark import sample_side, typed
+
+PROFILES = {
+    # updates/s from SimBridge, key presses/s on the MCDU
+    'realistic': (4, 2),
+    'stress': (200, 10),
+}
+KEYS = {chr(ord('A') + i): 44 + i for i in range(26)}  # KEYA .. KEYZ
+
+
+class MockSimBridge:
+    # Stands in for the SimBridge websocket: sends updates for both sides at a fixed
+    # rate, a key from the MCDU is added to the scratchpad and sent at once.
+    name = 'SimBridge'
+
+    def __init__(self, simbridge, rate: float, seed: int = 1):
+        self.simbridge = simbridge
+        self.rate = rate
+        self.rnd = random.Random(seed)
+        self.sides = {'left': sample_side(self.rnd, ''), 'right': sample_side(self.rnd, '')}
+        self.updates = 0
+        self.keys = queue.Queue()
+        self._lock = Lock()  # one update at a time, like the one websocket
+        Thread(target=self._feed, name='mock simbridge feed', daemon=True).start()
+        Thread(target=self._answer, name='mock simbridge keys', daemon=True).start()
+
+    def send(self, frame):
+        data = frame.format()
+        mask = data[2:6]
+        self.keys.put(bytes(b ^ mask[i % 4] for i, b in enumerate(data[6:])).decode())
+
+    def scratchpad(self, side='left'):
+        return self.sides[side]['scratchpad'][len('{amber}'):-len('{end}')]
+
+    def send_update(self):
+        with self._lock:
+            self.simbridge.on_message('update:' + json.dumps(self.sides, separators=(',', ':')))
+            self.updates += 1
+
+    def _feed(self):
+        interval = 1 / self.rate
+        next_update = monotonic()
+        while True:
+            with self._lock:
+                side = self.rnd.choice(('left', 'right'))
+                self.sides[side] = sample_side(self.rnd, self.scratchpad(side))  # new page, same scratchpad
+            self.send_update()
+            next_update += interval
+            sleep(max(0, next_update - monotonic()))
+
+    def _answer(self):
+        while True:
+            message = self.keys.get()
+            side, key = message.split(':')[1:3]   # event:left:A
+            with self._lock:
+                self.sides[side]['scratchpad'] = '{amber}' + typed(self.scratchpad(side), key) + '{end}'
+            self.send_update()
+
+
+def rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # peak, not current
+
+
+def object_counts():
+    return Counter(type(o).__name__ for o in gc.get_objects())
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))] if values else float('nan')
+
+
+def growth(samples, key):
+    # least squares slope over the samples, per hour
+    ts = [s['t'] for s in samples]
+    ys = [key(s) for s in samples]
+    n = len(ts)
+    mean_t, mean_y = sum(ts) / n, sum(ys) / n
+    var = sum((t - mean_t) ** 2 for t in ts)
+    if not var:
+        return 0.0
+    return sum((t - mean_t) * (y - mean_y) for t, y in zip(ts, ys)) / var * 3600
+
+
+def check(samples, latencies, args):
+    '''Return the failed checks as text.'''
+    failures = []
+    hours = (samples[-1]['t'] - samples[0]['t']) / 3600
+    rss = growth(samples, lambda s: s['rss'] / 2 ** 20)
+    if rss * hours > max(args.max_rss_growth * hours, args.rss_slack):
+        failures.append(f'RSS grows {rss:.1f} MiB/h (allowed {args.max_rss_growth} MiB/h)')
+    types = set().union(*(s['objects'] for s in samples))
+    for name in sorted(types):
+        per_hour = growth(samples, lambda s: s['objects'].get(name, 0))
+        if per_hour * hours > max(args.max_object_growth * hours, args.object_slack):
+            failures.append(f'{name} objects grow {per_hour:.0f}/h (allowed {args.max_object_growth}/h)')
+    if samples[-1]['threads'] > samples[0]['threads']:
+        failures.append(f"threads grew from {samples[0]['threads']} to {samples[-1]['threads']}")
+    quarter = max(1, len(latencies) // 4)
+    first, last = sorted(latencies[:quarter]), sorted(latencies[-quarter:])
+    for p in (0.5, 0.9):
+        before, after = percentile(first, p), percentile(last, p)
+        if after > before * args.max_latency_drift + args.latency_slack:
+            failures.append(f'p{p * 100:.0f} latency drifted from {before:.2f} ms to {after:.2f} ms')
+    if not latencies:
+        failures.append('no key press reached the display')
+    return failures
+
+
+def soak(args):
+    import simbridge
+    from mcdu_emulator import EmulatedDevice
+
+    rate, keys_per_s = PROFILES[args.profile]
+    rate = args.rate or rate
+    out = sys.__stdout__
+    csv = open(args.csv, 'w') if args.csv else None
+    print(f'soak: {args.profile} profile, {rate:g} updates/s, {keys_per_s} keys/s, '
+          f'{args.duration:.0f} s, emulated MCDU at {args.report_rate:g} reports/s', file=out)
+
+    device = EmulatedDevice(args.report_rate)
+    with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):  # the bridge log, still written
+        simbridge.quiet = False
+        simbridge.renderers['left'] = simbridge.PageBuffer()
+        mcdu = simbridge.McduDevice(device, 'emulated MCDU', simbridge.DEVICEMASK.MCDU | simbridge.DEVICEMASK.CAP,
+                                    'left', simbridge.DisplayManager(device))
+        simbridge.add_device(mcdu)
+        feed = MockSimBridge(simbridge, rate)
+        simbridge.sim = feed
+        device.wait_for(lambda d: d.frames > 1)
+        sleep(2.5)  # the input thread starts after 2 s
+
+        start = monotonic()
+        next_sample = start + args.interval
+        next_reconnect = start + args.reconnect_every if args.reconnect_every else None
+        samples, interval_latencies = [], []
+        missed = 0
+        n = 0
+        header = None
+        while monotonic() - start < args.duration:
+            key = chr(ord('A') + n % 26)
+            n += 1
+            expected = typed(feed.scratchpad(), key)
+            t0 = perf_counter()
+            device.press(KEYS[key])
+            device.release(KEYS[key])
+            shown = device.wait_for(lambda d: d.row_text(13).rstrip() == expected, timeout=args.key_timeout)
+            if shown is None:
+                missed += 1
+            else:
+                interval_latencies.append((shown - t0) * 1000)
+            sleep(max(0, 1 / keys_per_s - (perf_counter() - t0)))
+
+            now = monotonic()
+            if next_reconnect and now >= next_reconnect:
+                simbridge.on_close('1006 - soak test')
+                simbridge.on_open()
+                feed.send_update()
+                next_reconnect += args.reconnect_every
+            if now < next_sample:
+                continue
+            next_sample += args.interval
+            gc.collect()
+            interval_latencies.sort()
+            sample = {
+                't': now - start, 'rss': rss_bytes(), 'objects': object_counts(), 'threads': active_count(),
+                'ring': len(mcdu.button_events), 'overflows': mcdu.button_events.overflows,
+                'keys_queued': feed.keys.qsize(), 'frame_pending': int(mcdu._frame is not None),
+                'updates': feed.updates, 'frames': mcdu.frames_written, 'writes': device.writes, 'missed': missed,
+                'p50': percentile(interval_latencies, 0.5), 'p90': percentile(interval_latencies, 0.9),
+                'p99': percentile(interval_latencies, 0.99), 'latencies': interval_latencies,
+            }
+            interval_latencies = []
+            print(f"{sample['t']:8.0f} s  rss {sample['rss'] / 2 ** 20:7.1f} MiB  "
+                  f"objects {sum(sample['objects'].values()):8}  threads {sample['threads']:3}  "
+                  f"ring {sample['ring']:3}  keys queued {sample['keys_queued']:3}  "
+                  f"updates {sample['updates']:8}  frames {sample['frames']:7}  missed {missed:3}  "
+                  f"latency p50 {sample['p50']:6.2f}  p90 {sample['p90']:6.2f}  p99 {sample['p99']:6.2f} ms",
+                  file=out, flush=True)
+            if csv:
+                row = {k: v for k, v in sample.items() if k not in ('objects', 'latencies')}
+                row['objects'] = sum(sample['objects'].values())
+                if header is None:
+                    header = list(row)
+                    csv.write(','.join(header) + '\n')
+                csv.write(','.join(f'{row[k]:.3f}' if isinstance(row[k], float) else str(row[k]) for k in header) + '\n')
+                csv.flush()
+            samples.append(sample)
+
+    warm = [s for s in samples if s['t'] >= args.warmup]
+    if len(warm) < 3:
+        print('soak: too few samples after the warmup to check anything, run longer', file=out)
+        return 1
+    warm_latencies = [ms for s in warm for ms in s['latencies']]
+    grown = warm[-1]['objects'] - warm[0]['objects']
+    print('soak: most grown object types ' + ', '.join(f'{name} +{count}' for name, count in grown.most_common(5)),
+          file=out)
+    failures = check(warm, warm_latencies, args)
+    for failure in failures:
+        print(f'soak: FAIL {failure}', file=out)
+    if not failures:
+        print(f'soak: ok, {len(warm)} samples, {len(warm_latencies)} key presses, {missed} missed', file=out)
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='winwing_mcdu soak test, memory and latency drift')
+    parser.add_argument('--profile', choices=list(PROFILES), default='realistic',
+                        help='realistic: 4 updates/s, 2 keys/s; stress: 200 updates/s, 10 keys/s')
+    parser.add_argument('--rate', type=float, help='SimBridge updates per second (default: from the profile)')
+    parser.add_argument('--duration', type=float, default=3600, help='seconds to run (default: 3600)')
+    parser.add_argument('--interval', type=float, default=60, help='seconds between two samples (default: 60)')
+    parser.add_argument('--warmup', type=float, help='seconds not checked at the start (default: 10%% of the run)')
+    parser.add_argument('--reconnect-every', type=float, default=300, metavar='S',
+                        help='drop and open the SimBridge connection every S seconds, 0 = never (default: 300)')
+    parser.add_argument('--report-rate', type=float, default=1000,
+                        help='reports per second of the emulated MCDU (default: 1000, 0 = no delay)')
+    parser.add_argument('--key-timeout', type=float, default=2, help='a key not shown after this is missed')
+    parser.add_argument('--max-rss-growth', type=float, default=4, metavar='MIB_PER_H',
+                        help='allowed RSS growth in MiB per hour (default: 4)')
+    parser.add_argument('--rss-slack', type=float, default=2, metavar='MIB',
+                        help='RSS growth over the whole run that always passes (default: 2)')
+    parser.add_argument('--max-object-growth', type=float, default=2000, metavar='N_PER_H',
+                        help='allowed growth of the objects of one type per hour (default: 2000)')
+    parser.add_argument('--object-slack', type=float, default=500, metavar='N',
+                        help='object growth per type over the whole run that always passes (default: 500)')
+    parser.add_argument('--max-latency-drift', type=float, default=1.5, metavar='FACTOR',
+                        help='allowed latency of the last quarter relative to the first one (default: 1.5)')
+    parser.add_argument('--latency-slack', type=float, default=2, metavar='MS',
+                        help='latency increase that always passes (default: 2)')
+    parser.add_argument('--csv', metavar='FILE', help='also write the samples to FILE')
+    args = parser.parse_args()
+    if args.warmup is None:
+        args.warmup = args.duration / 10
+    result = soak(args)
+    sys.stdout.flush()
+    os._exit(result)  # the input thread of the emulated MCDU does not end
+
+
+if __name__ == '__main__':
+    main()
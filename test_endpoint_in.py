@@ -1,11 +1,35 @@
 #!/bin/env python3
+# Input latency and jitter of the MCDU, read through libusb (pyusb) and through hidapi.
+# usage: python3 test_endpoint_in.py [--access libusb|hidapi|both] [--seconds S] [--raw]
+#
+# Reads the interrupt endpoint 0x81 without any sleep and timestamps every report
+# with a monotonic clock as soon as the read returns. The reports are classified
+# (25 byte button reports, 14 byte reports, others) and for every class the tool
+# prints the report rate, an inter-arrival histogram and percentiles. Gaps longer
+# than GAP_FACTOR times the median inter-arrival time of a steady stream are
+# counted as dropped reports (the reports have no sequence number).
+# hidapi is measured first, libusb detaches the kernel driver and gives it back
+# at the end. Press keys (or hold one) during the runs to get button reports.
 
-from dataclasses import dataclass
+import argparse
 import time
 import usb.core
 import usb.backend.libusb1
 import usb.util
 
+DEVICES = [  # vid, pid, name
+    (0x4098, 0xbb36, 'MCDU - Captain'),
+    (0x4098, 0xbb3e, 'MCDU - First Officer'),
+    (0x4098, 0xbb3a, 'MCDU - Observer'),
+]
+ENDPOINT_IN = 0x81
+REPORT_SIZE = 64  # bytes asked for per read, the MCDU reports are shorter
+READ_TIMEOUT_MS = 100
+HISTOGRAM_MS = (0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256, 1000)  # upper bounds, last bucket is open
+GAP_FACTOR = 2.5
+STEADY_MIN_REPORTS = 20  # drop detection needs at least this many reports of a class
+
+
 def find_usblib():
     path = ['/opt/homebrew/lib/libusb-1.0.0.dylib',
             '/usr/lib/x86_64-linux-gnu/libusb-1.0.so.0',
@@ -24,34 +48,176 @@ def find_usblib():
     print(f"***   https://github.com/schenlap/winwing_fcu")
     return None
 
-backend = find_usblib()
 
-device = usb.core.find(idVendor=0x4098, idProduct=0xbb36, backend=backend)
-if device is None:
-    print(f"searching for MCDU ... not found")
-    device = usb.core.find(idVendor=0x4098, idProduct=0xbc1e, backend=backend)
-    if device is None:
-        print(f"searching for MCDU F/O ... not found")
-        raise RuntimeError('No device not found')
-    else:
-        print(f"searching for MCDU F/O ... found")
-else:
-    print(f"searching for MCDU ... found")
+def classify(report):
+    if len(report) == 25:
+        return 'buttons (25)'
+    if len(report) == 14:
+        return 'short (14)'
+    return f'other ({len(report)})'
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else float('nan')
+
+
+def histogram(values):
+    counts = [0] * (len(HISTOGRAM_MS) + 1)
+    for v in values:
+        i = 0
+        while i < len(HISTOGRAM_MS) and v > HISTOGRAM_MS[i]:
+            i += 1
+        counts[i] += 1
+    return counts
+
+
+def record(read, seconds, raw=False):
+    '''Read reports for seconds, return [(monotonic ns, report bytes)] and the number of read errors.'''
+    reports = []
+    errors = 0
+    end = time.monotonic_ns() + int(seconds * 1e9)
+    while time.monotonic_ns() < end:
+        try:
+            data = read()
+        except usb.core.USBTimeoutError:
+            continue
+        except (usb.core.USBError, OSError, ValueError) as error:
+            errors += 1
+            print(f"read error: {error}")
+            time.sleep(0.01)
+            continue
+        now = time.monotonic_ns()
+        if not data:
+            continue  # hidapi timeout
+        reports.append((now, bytes(data)))
+        if raw:
+            print(f"{now / 1e9:.6f} {len(data):3} {bytes(data).hex()}")
+    return reports, errors
+
+
+def analyze(reports, seconds):
+    '''Statistics per report class.'''
+    classes = {}
+    for t, data in reports:
+        classes.setdefault(classify(data), []).append((t, data))
+    result = {}
+    for name, items in sorted(classes.items()):
+        gaps = sorted((b[0] - a[0]) / 1e6 for a, b in zip(items, items[1:]))
+        stats = {'count': len(items), 'rate': len(items) / seconds, 'gaps': gaps, 'dropped': None}
+        if name.startswith('buttons'):
+            stats['changes'] = sum(1 for a, b in zip(items, items[1:]) if a[1][1:13] != b[1][1:13])
+        if len(items) >= STEADY_MIN_REPORTS:
+            median = percentile(gaps, 50)
+            # a steady stream: every gap longer than GAP_FACTOR medians hides reports
+            stats['dropped'] = sum(round(g / median) - 1 for g in gaps if median and g > median * GAP_FACTOR)
+        result[name] = stats
+    return result
 
-interface = device[0].interfaces()[0]
-if device.is_kernel_driver_active(interface.bInterfaceNumber):
-    device.detach_kernel_driver(interface.bInterfaceNumber)
 
-device.set_configuration()
+def print_stats(access, stats, errors, seconds):
+    print(f"\n=== {access}: {sum(s['count'] for s in stats.values())} reports in {seconds:g} s, {errors} read errors")
+    if not stats:
+        print("no reports, press some keys during the run")
+    for name, s in stats.items():
+        gaps = s['gaps']
+        line = f"{name:14} {s['count']:7} reports  {s['rate']:8.1f}/s"
+        if 'changes' in s:
+            line += f"  {s['changes']} button changes"
+        if s['dropped'] is not None:
+            line += f"  {s['dropped']} dropped"
+        print(line)
+        if not gaps:
+            continue
+        print(f"{'':14} inter-arrival p50 {percentile(gaps, 50):8.3f}  p99 {percentile(gaps, 99):8.3f}  "
+              f"max {gaps[-1]:8.3f} ms")
+        bounds = [f'<={b}' for b in HISTOGRAM_MS] + [f'>{HISTOGRAM_MS[-1]}']
+        for bound, count in zip(bounds, histogram(gaps)):
+            if count:
+                print(f"{'':14} {bound:>7} ms {count:7} {'#' * max(1, round(40 * count / len(gaps)))}")
+
+
+def print_comparison(all_stats):
+    # the same report class side by side, lower and steadier inter-arrival times are better
+    names = sorted(set().union(*(stats for stats in all_stats.values())))
+    print("\n=== comparison (inter-arrival ms)")
+    for name in names:
+        for access, stats in all_stats.items():
+            s = stats.get(name)
+            if not s or not s['gaps']:
+                continue
+            gaps = s['gaps']
+            print(f"{name:14} {access:7} rate {s['rate']:8.1f}/s  p50 {percentile(gaps, 50):8.3f}  "
+                  f"p99 {percentile(gaps, 99):8.3f}  max {gaps[-1]:8.3f}  "
+                  f"dropped {'-' if s['dropped'] is None else s['dropped']}")
+
+
+def measure_hidapi(vid, pid, seconds, raw):
+    import hid
+    try:
+        device = hid.device()
+        device.open(vid, pid)
+    except AttributeError:
+        device = hid.Device(vid=vid, pid=pid)  # hidapi mac version
+    try:
+        return record(lambda: device.read(REPORT_SIZE, READ_TIMEOUT_MS), seconds, raw)
+    finally:
+        device.close()
+
+
+def measure_libusb(device, seconds, raw):
+    interface = device[0].interfaces()[0]
+    number = interface.bInterfaceNumber
+    detached = False
+    if device.is_kernel_driver_active(number):
+        device.detach_kernel_driver(number)
+        detached = True
+    try:
+        device.set_configuration()
+        usb.util.claim_interface(device, number)
+        endpoint_in = usb.util.find_descriptor(interface, bEndpointAddress=ENDPOINT_IN)
+        return record(lambda: endpoint_in.read(REPORT_SIZE, READ_TIMEOUT_MS), seconds, raw)
+    finally:
+        usb.util.release_interface(device, number)
+        usb.util.dispose_resources(device)
+        if detached:
+            try:
+                device.attach_kernel_driver(number)  # hidapi and the bridge use the kernel driver
+            except usb.core.USBError as error:
+                print(f"*** could not give the MCDU back to the kernel driver ({error}), replug it ***")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MCDU input latency and jitter, libusb and hidapi')
+    parser.add_argument('--access', choices=['libusb', 'hidapi', 'both'], default='both',
+                        help='how the endpoint is read (default: both, hidapi first)')
+    parser.add_argument('--seconds', type=float, default=10, help='seconds per access path (default: 10)')
+    parser.add_argument('--raw', action='store_true', help='also print every report')
+    args = parser.parse_args()
+
+    backend = find_usblib()
+    for vid, pid, name in DEVICES:
+        device = usb.core.find(idVendor=vid, idProduct=pid, backend=backend)
+        print(f"searching for {name} ... {'found' if device else 'not found'}")
+        if device is not None:
+            break
+    else:
+        raise RuntimeError('No MCDU found')
+
+    results = {}
+    if args.access in ('hidapi', 'both'):
+        print(f"hidapi: reading for {args.seconds:g} s, press keys")
+        results['hidapi'] = measure_hidapi(vid, pid, args.seconds, args.raw)
+    if args.access in ('libusb', 'both'):
+        print(f"libusb: reading for {args.seconds:g} s, press keys")
+        results['libusb'] = measure_libusb(device, args.seconds, args.raw)
 
-endpoints = device[0].interfaces()[0].endpoints()
-print(endpoints)
+    all_stats = {}
+    for access, (reports, errors) in results.items():
+        all_stats[access] = analyze(reports, args.seconds)
+        print_stats(access, all_stats[access], errors, args.seconds)
+    if len(all_stats) > 1:
+        print_comparison(all_stats)
 
-endpoint_in = endpoints[0]
-print(endpoint_in)
 
-while True:
-    buf_in = [None] * 12
-    num_bytes = endpoint_in.read(0x81, 12)
-    print(num_bytes)
-    time.sleep(0.1)
+if __name__ == '__main__':
+    main()
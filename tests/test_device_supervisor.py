@@ -0,0 +1,227 @@
+# DeviceSupervisor with --usb-backend libusb, with and without --usb-worker, on a
+# fake usb1: claiming the MCDU detaches the kernel HID driver and its hidraw node
+# goes away, like on Linux. The supervisor must not take that for an unplug.
+import sys
+import types
+from threading import Condition
+
+import pytest
+
+try:
+    import hid  # noqa: F401
+except ImportError:  # mcdu_core imports it, the libusb backend does not use it
+    sys.modules['hid'] = types.ModuleType('hid')
+try:
+    import usb1  # noqa: F401
+except ImportError:  # mcdu_libusb imports it, the tests replace it with the fake below
+    sys.modules['usb1'] = types.ModuleType('usb1')
+
+import mcdu_init
+import mcdu_libusb
+import mcdu_worker
+import simbridge
+from mcdu_core import UsbManager
+
+VID, PID = 0x4098, 0xbb36
+TRANSFER_COMPLETED, TRANSFER_CANCELLED = 0, 3
+
+
+class USBError(Exception):
+    pass
+
+
+class USBErrorInterrupted(USBError):
+    pass
+
+
+class Bus:
+    # one MCDU on bus 1, a new address each time it is plugged in
+    def __init__(self):
+        self.address = 5
+        self.plugged = True
+        self.claimed = 0
+
+    def hidraw_nodes(self):
+        return ['/dev/hidraw3'] if self.plugged and not self.claimed else []
+
+
+class Transfer:
+    def __init__(self, context):
+        self.context = context
+        self.submitted = False
+        self.status = None
+
+    def setInterrupt(self, endpoint, data, callback=None, timeout=0):
+        self.endpoint = endpoint
+        self.callback = callback
+
+    def submit(self):
+        with self.context.changed:
+            self.submitted = True
+            if not self.endpoint & 0x80:  # output completes at once, input never
+                self.status = TRANSFER_COMPLETED
+                self.context.done.append(self)
+                self.context.changed.notify_all()
+
+    def cancel(self):
+        with self.context.changed:
+            self.status = TRANSFER_CANCELLED
+            self.context.done.append(self)
+            self.context.changed.notify_all()
+
+    def isSubmitted(self):
+        return self.submitted
+
+    def getStatus(self):
+        return self.status
+
+
+class Endpoint:
+    def __init__(self, address):
+        self.address = address
+
+    def getAddress(self):
+        return self.address
+
+
+class Setting:
+    def getNumber(self):
+        return 0
+
+    def iterEndpoints(self):
+        return [Endpoint(0x81), Endpoint(0x02)]
+
+
+class Handle:
+    def __init__(self, context, bus):
+        self.context = context
+        self.bus = bus
+
+    def setAutoDetachKernelDriver(self, value):
+        pass
+
+    def claimInterface(self, interface):
+        self.bus.claimed += 1
+
+    def releaseInterface(self, interface):
+        self.bus.claimed -= 1
+
+    def close(self):
+        pass
+
+    def getTransfer(self):
+        return Transfer(self.context)
+
+
+class Device:
+    def __init__(self, context, bus):
+        self.context = context
+        self.bus = bus
+
+    def getVendorID(self):
+        return VID
+
+    def getProductID(self):
+        return PID
+
+    def getBusNumber(self):
+        return 1
+
+    def getDeviceAddress(self):
+        return self.bus.address
+
+    def iterSettings(self):
+        return [Setting()]
+
+    def open(self):
+        return Handle(self.context, self.bus)
+
+
+def fake_usb1(bus):
+    class USBContext:
+        def __init__(self):
+            self.changed = Condition()
+            self.done = []
+
+        def close(self):
+            pass
+
+        def getDeviceIterator(self, skip_on_error=True):
+            return [Device(self, bus)] if bus.plugged else []
+
+        def handleEvents(self):
+            with self.changed:
+                while not self.done:
+                    self.changed.wait()
+                done, self.done = self.done, []
+                for transfer in done:
+                    transfer.submitted = False
+            for transfer in done:
+                transfer.callback(transfer)
+
+    return types.SimpleNamespace(
+        USBContext=USBContext, USBError=USBError, USBErrorInterrupted=USBErrorInterrupted,
+        TRANSFER_COMPLETED=TRANSFER_COMPLETED, TRANSFER_CANCELLED=TRANSFER_CANCELLED,
+        TRANSFER_TIMED_OUT=2)
+
+
+class WorkerLink:
+    # the worker process claims the device, here in this process
+    def __init__(self, usb, name, warm_start, input_scheduling):
+        assert usb['backend'] == 'libusb'
+        self.device = mcdu_libusb.LibusbDevice()
+        self.device.open(usb['vid'], usb['pid'], usb['path'])
+
+    def close(self):
+        self.device.close()
+
+
+class Display:
+    device = None
+
+    def startupscreen(self):
+        pass
+
+
+@pytest.fixture
+def bus(monkeypatch):
+    bus = Bus()
+    monkeypatch.setattr(mcdu_libusb, 'usb1', fake_usb1(bus))
+    monkeypatch.setattr(UsbManager, 'backend', 'libusb')
+    monkeypatch.setattr(mcdu_worker, 'WorkerLink', WorkerLink)
+    monkeypatch.setattr(mcdu_init, 'send_init', lambda device: 1)
+    monkeypatch.setattr(mcdu_init, 'mark_initialized', lambda path, version: None)
+    monkeypatch.setattr(simbridge, 'devices', [])
+    yield bus
+    for mcdu in simbridge.devices:
+        mcdu.device.close()
+
+
+@pytest.mark.parametrize('usb_worker', [False, True])
+def test_claimed_device_is_not_unplugged(bus, monkeypatch, usb_worker):
+    monkeypatch.setattr(simbridge, 'usb_worker', usb_worker)
+    d, = UsbManager().find_devices(verbose=False)
+    assert d['path'] == b'libusb:1:5'
+    device = simbridge.open_usb_device(d, d['name'])
+    mcdu = simbridge.McduDevice(device, d['name'], d['mask'], 'L', Display(),
+                                usb={'vid': d['vid'], 'pid': d['pid'], 'path': d['path']})
+    simbridge.devices.append(mcdu)
+    assert bus.claimed == 1 and not bus.hidraw_nodes()
+
+    # the hidraw remove event of the claim wakes the supervisor
+    supervisor = simbridge.DeviceSupervisor()
+    supervisor.reconcile()
+    assert mcdu.connected.is_set()
+    assert mcdu.reconnects == 0 and bus.claimed == 1
+
+    bus.plugged = False
+    supervisor.reconcile()
+    assert not mcdu.connected.is_set()
+
+    bus.plugged = True
+    bus.address = 6
+    supervisor.reconcile()
+    assert mcdu.connected.is_set()
+    assert mcdu.usb['path'] == b'libusb:1:6'
+    supervisor.reconcile()
+    assert mcdu.reconnects == 1 and bus.claimed == 1
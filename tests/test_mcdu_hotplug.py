@@ -0,0 +1,26 @@
+from mcdu_hotplug import UeventMonitor, parse_uevent, vendor_id
+
+MCDU = '/devices/pci0000:00/0000:00:14.0/usb1/1-5/1-5:1.0/0003:4098:BB36.0001/hidraw/hidraw3'
+MOUSE = '/devices/pci0000:00/0000:00:14.0/usb1/1-2/1-2:1.0/0003:046D:C077.0002/hidraw/hidraw1'
+
+
+def uevent(action, devpath, **props):
+    fields = [f'{action}@{devpath}', f'ACTION={action}', f'DEVPATH={devpath}', 'SUBSYSTEM=hidraw']
+    fields += [f'{key}={value}' for key, value in props.items()]
+    return parse_uevent('\0'.join(fields).encode() + b'\0')
+
+
+def test_vendor_from_devpath_and_hid_id():
+    assert vendor_id(uevent('remove', MCDU)) == 0x4098
+    assert vendor_id(uevent('add', MOUSE)) == 0x046d
+    assert vendor_id({'HID_ID': '0003:00004098:0000BB3E'}) == 0x4098
+    assert vendor_id({'DEVPATH': '/devices/virtual/misc/uhid/hidraw0'}) is None
+
+
+def test_only_winwing_events_wake():
+    monitor = UeventMonitor(lambda action, props: None)
+    assert monitor.wanted('add', uevent('add', MCDU))
+    assert monitor.wanted('remove', uevent('remove', MCDU))
+    assert not monitor.wanted('add', uevent('add', MOUSE))
+    assert not monitor.wanted('change', uevent('change', MCDU))
+    assert UeventMonitor(lambda action, props: None, vendor=None).wanted('add', uevent('add', MOUSE))
@@ -0,0 +1,40 @@
+from threading import Condition
+from time import monotonic
+
+from mcdu_idle import IdleMonitor
+
+
+class LostRace(Condition):
+    # another thread ends idle mode just before this one gets the lock
+    def __init__(self, monitor):
+        super().__init__()
+        self.monitor = monitor
+
+    def __enter__(self):
+        result = super().__enter__()
+        self.monitor.idle = False
+        return result
+
+
+def idle_monitor():
+    monitor = IdleMonitor(verbose=True)
+    monitor.idle = True
+    monitor._idle_since = (monotonic(), 0.0, None)
+    return monitor
+
+
+def test_activity_ends_idle_and_reports(capsys):
+    monitor = idle_monitor()
+    monitor.activity('buttons')
+    assert not monitor.idle
+    assert monitor.last_report is not None
+    assert 'active again (buttons)' in capsys.readouterr().out
+
+
+def test_activity_after_lost_race_does_not_report(capsys):
+    monitor = idle_monitor()
+    monitor._changed = LostRace(monitor)
+    monitor.activity('buttons')
+    assert not monitor.idle
+    assert monitor.last_report is None
+    assert capsys.readouterr().out == ''
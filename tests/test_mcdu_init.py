@@ -0,0 +1,32 @@
+import pytest
+
+import mcdu_init
+
+
+@pytest.fixture
+def runtime_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    device = tmp_path / 'hidraw0'
+    device.touch()
+    return str(device)
+
+
+def test_marker_is_kept_for_the_boot(runtime_dir, monkeypatch):
+    monkeypatch.setattr(mcdu_init, '_boot_id', 'boot-1')
+    assert not mcdu_init.is_initialized(runtime_dir)
+    mcdu_init.mark_initialized(runtime_dir, mcdu_init.load_init_reports()[0])
+    assert mcdu_init.is_initialized(runtime_dir)
+
+
+def test_marker_is_not_trusted_after_reboot(runtime_dir, monkeypatch):
+    monkeypatch.setattr(mcdu_init, '_boot_id', 'boot-1')
+    mcdu_init.mark_initialized(runtime_dir, mcdu_init.load_init_reports()[0])
+    monkeypatch.setattr(mcdu_init, '_boot_id', 'boot-2')
+    assert not mcdu_init.is_initialized(runtime_dir)
+
+
+def test_no_warm_start_without_boot_identity(runtime_dir, monkeypatch, tmp_path):
+    monkeypatch.setattr(mcdu_init, '_boot_id', '')
+    mcdu_init.mark_initialized(runtime_dir, mcdu_init.load_init_reports()[0])
+    assert not mcdu_init.is_initialized(runtime_dir)
+    assert [p.name for p in tmp_path.iterdir()] == ['hidraw0']
@@ -0,0 +1,70 @@
+# Display reports through a fake hid.Device of hid==1.0.7 (requirements.txt): its
+# write() hands the report to a C function declared with a c_char_p argument, like
+# hid_write(). Here that is memcpy() into a buffer the test keeps.
+import ctypes
+import ctypes.util
+import sys
+import types
+
+import pytest
+
+try:
+    import hid  # noqa: F401
+except ImportError:  # mcdu_core imports it, the tests only use the fake device
+    sys.modules['hid'] = types.ModuleType('hid')
+
+from mcdu_core import DisplayManager, PAGE_CHARS_PER_LINE
+from mcdu_report import REPORT_ID, REPORT_SIZE
+import mcdu_init
+
+libc = ctypes.CDLL(ctypes.util.find_library('c') or ctypes.util.find_library('msvcrt'))
+hid_write = libc.memcpy
+hid_write.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
+hid_write.restype = ctypes.c_void_p
+
+
+class FakeHidDevice:
+    def __init__(self):
+        self.reports = []
+
+    def write(self, data):
+        out = ctypes.create_string_buffer(len(data))
+        hid_write(out, data, len(data))
+        self.reports.append(out.raw)
+        return len(data)
+
+
+@pytest.fixture
+def display(monkeypatch):
+    monkeypatch.setattr(mcdu_init, 'send_init', lambda device: 1)
+    return DisplayManager(FakeHidDevice())
+
+
+def test_fake_device_rejects_memoryview():
+    with pytest.raises(ctypes.ArgumentError):
+        FakeHidDevice().write(memoryview(bytes(REPORT_SIZE)))
+
+
+def test_frame_reports_reach_device(display):
+    display.write_line_to_page(0, 0, 'INIT', 'W')
+    display.write_line_to_page(13, 0, 'SCRATCHPAD', 'A', True)
+    display.set_from_page()
+
+    reports = display.device.reports
+    frame = bytes(display.reports.frame[:display.reports.length])
+    assert len(reports) == (len(frame) + REPORT_SIZE - 2) // (REPORT_SIZE - 1)
+    assert all(len(r) == REPORT_SIZE and r[0] == REPORT_ID for r in reports)
+    assert b''.join(r[1:] for r in reports)[:len(frame)] == frame
+    assert frame[2:3] == b'I'
+
+
+def test_reports_are_refilled_after_write(display):
+    # the device keeps what it got, the next frame must not change it
+    display.write_line_to_page(0, 0, 'A' * PAGE_CHARS_PER_LINE, 'W')
+    display.set_from_page()
+    first = list(display.device.reports)
+    display.write_line_to_page(0, 0, 'B' * PAGE_CHARS_PER_LINE, 'W')
+    display.set_from_page()
+    assert display.device.reports[:len(first)] == first
+    assert display.device.reports[len(first)][3:4] == b'B'
+    assert len(display.device.reports) == 2 * len(first)
@@ -0,0 +1,56 @@
+# TextFrame relies on websocket-client internals: WebSocket.send_frame() sets
+# frame.get_mask_key and sends what frame.format() returns (websocket-client is
+# pinned in requirements.txt). A pre-encoded frame must put the same bytes on the
+# wire as ws.send(text) with the same mask key.
+import socket
+
+import pytest
+
+websocket = pytest.importorskip('websocket')
+
+from mcdu_sim import TextFrame
+
+
+@pytest.fixture
+def ws():
+    ours, theirs = socket.socketpair()
+    ws = websocket.WebSocket()
+    ws.sock = ours
+    ws.connected = True
+    ws.set_mask_key(lambda length: b'\x01\x02\x03\x04')
+    yield ws, theirs
+    ours.close()
+    theirs.close()
+
+
+def sent(ws, send):
+    ws, peer = ws
+    length = send(ws)
+    return peer.recv(1024), length
+
+
+@pytest.mark.parametrize('text', ['event:left:L1', 'event:right:KEY0', 'x' * 125])
+def test_text_frame_bytes_match_websocket_client(ws, text):
+    expected, _ = sent(ws, lambda w: w.send(text))
+    frame = TextFrame(text)
+    data, length = sent(ws, lambda w: w.send_frame(frame))
+    assert data == expected
+    assert length == len(expected)
+    assert frame.get_mask_key is not None  # send_frame() handed over the mask key
+
+
+def test_text_frame_is_sent_again_with_a_new_mask(ws):
+    frame = TextFrame('event:left:L1')
+    keys = iter([b'\x01\x02\x03\x04', b'\x05\x06\x07\x08'])
+    ws[0].set_mask_key(lambda length: next(keys))
+    first, _ = sent(ws, lambda w: w.send_frame(frame))
+    second, _ = sent(ws, lambda w: w.send_frame(frame))
+    assert first[2:6] == b'\x01\x02\x03\x04' and second[2:6] == b'\x05\x06\x07\x08'
+    for data in (first, second):
+        mask, payload = data[2:6], data[6:]
+        assert bytes(b ^ mask[i % 4] for i, b in enumerate(payload)) == b'event:left:L1'
+
+
+def test_text_frame_too_long():
+    with pytest.raises(ValueError):
+        TextFrame('x' * 126)
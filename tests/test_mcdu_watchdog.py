@@ -0,0 +1,60 @@
+import pytest
+
+from mcdu_watchdog import WatchedDevice, FrameDropped
+
+
+class Device:
+    # write() runs the next step: a result, an exception to raise, or a callable
+    def __init__(self, *steps):
+        self.steps = list(steps)
+        self.closed = False
+
+    def write(self, data):
+        step = self.steps.pop(0)
+        if callable(step):
+            step = step()
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+    def close(self):
+        self.closed = True
+
+
+def watched(*steps):
+    return WatchedDevice(Device(*steps), 'test')
+
+
+def test_write_returns_result():
+    device = watched(64)
+    assert device.write(bytes(64)) == 64
+    device.close()
+
+
+def test_failed_write_is_retried():
+    device = watched(OSError('busy'), 64)
+    assert device.write(bytes(64)) == 64
+    assert (device.failures, device.retried) == (1, 1)
+    device.close()
+
+
+def test_write_error_is_raised():
+    device = watched(OSError('busy'), OSError('gone'))
+    with pytest.raises(OSError, match='gone'):
+        device.write(bytes(64))
+    device.close()
+
+
+def test_abandoned_during_write_drops_frame():
+    device = watched()
+    device.device.steps = [lambda: device.abandon() or 64]
+    with pytest.raises(FrameDropped):
+        device.write(bytes(64))
+    assert device.device.closed
+
+
+def test_abandoned_during_failed_write_raises_error():
+    device = watched()
+    device.device.steps = [lambda: device.abandon() or OSError('busy'), OSError('gone')]
+    with pytest.raises(OSError, match='gone'):
+        device.write(bytes(64))
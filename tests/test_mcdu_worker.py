@@ -0,0 +1,52 @@
+# simbridge.py --usb-worker started as a script: the worker process is spawned from
+# it (and imports it again as __mp_main__) and writes to the MCDU, a fake hid
+# module that logs every report with the id of the writing process.
+import os
+import subprocess
+import sys
+import time
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FAKE_HID = '''
+import os, time
+def enumerate(vid=0, pid=0):
+    return [{'vendor_id': 0x4098, 'product_id': 0xbb36, 'path': b'/dev/hidraw-test'}]
+class device:
+    def open(self, vid, pid): pass
+    def open_path(self, path): pass
+    def set_nonblocking(self, value): pass
+    def write(self, data):
+        with open(os.environ['FAKE_HID_LOG'], 'a') as f:
+            f.write(f"{os.getpid()} {bytes(data[:1]).hex()}\\n")
+        return len(data)
+    def read(self, max_length, timeout_ms=0):
+        time.sleep(1)
+        return []
+    def close(self): pass
+'''
+
+
+def test_worker_spawned_from_simbridge(tmp_path):
+    (tmp_path / 'hid.py').write_text(FAKE_HID)
+    log = tmp_path / 'writes.log'
+    env = dict(os.environ, PYTHONPATH=str(tmp_path), FAKE_HID_LOG=str(log),
+               XDG_RUNTIME_DIR=str(tmp_path), XDG_STATE_HOME=str(tmp_path))
+    bridge = subprocess.Popen([sys.executable, os.path.join(REPO, 'simbridge.py'), '--usb-worker',
+                               '--no-state', '--no-debug-hooks', '--cold-start'],
+                              cwd=REPO, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    try:
+        end = time.monotonic() + 20
+        writers = set()
+        while time.monotonic() < end and bridge.poll() is None:
+            if log.exists():
+                writes = [line.split() for line in log.read_text().splitlines()]
+                writers = {int(pid) for pid, report in writes if report == 'f2'}
+                if writers:
+                    break
+            time.sleep(0.1)
+    finally:
+        bridge.kill()
+        output = bridge.communicate()[0].decode(errors='replace')
+    assert writers, output
+    assert bridge.pid not in writers, 'pages written by the bridge, not by the worker'
@@ -0,0 +1,67 @@
+# The head answers messages it cannot apply with a RESYNC instead of raising.
+import struct
+from threading import Thread
+
+import pytest
+
+from remote_head import (Head, MSG_FULL, MSG_DELTA, MSG_LEDS, MSG_RESYNC, PAGE_CELLS,
+                         encode_full, encode_delta, encode_leds, parse_datagram)
+
+
+class Socket:
+    def __init__(self):
+        self.sent = []
+
+    def sendall(self, msg):
+        self.sent.append(parse_datagram(msg))
+
+
+@pytest.fixture
+def head():
+    leds = []
+    head = Head(None, None, lambda led, brightness: leds.append((led, brightness)), leds={8, 9})
+    head.sock = Socket()
+    head.set_leds = leds
+    cells = [(2, ord('A'))] * PAGE_CELLS
+    head.apply(MSG_FULL, 1, encode_full(cells, 0))
+    return head
+
+
+def resyncs(head):
+    return [msg for msg in head.sock.sent if msg[0] == MSG_RESYNC]
+
+
+def test_valid_messages_apply(head):
+    cells = [(2, ord('B'))] * PAGE_CELLS
+    head.apply(MSG_DELTA, 2, encode_delta(cells, [0, PAGE_CELLS - 1], 0))
+    head.apply(MSG_LEDS, 3, encode_leds({8: 255}))
+    assert head.page[0][2] == 'B' and head.page[-1][-1] == 'B'
+    assert head.set_leds == [(8, 255)]
+    assert not resyncs(head) and head.seq == 3
+
+
+@pytest.mark.parametrize('msg_type, payload', [
+    (MSG_DELTA, struct.pack('<BHHBH', 0, 1, PAGE_CELLS, 2, ord('B'))),  # index out of the page
+    (MSG_DELTA, struct.pack('<BHHBH', 0, 2, 0, 2, ord('B'))),           # fewer cells than count
+    (MSG_DELTA, b'\0'),
+    (MSG_FULL, encode_full([(2, ord('B'))] * PAGE_CELLS, 0)[:-1]),
+    (MSG_LEDS, encode_leds({42: 1})),                                   # unknown LED
+    (MSG_LEDS, bytes([2, 8, 1])),
+    (MSG_LEDS, b''),
+])
+def test_bad_message_resyncs(head, msg_type, payload):
+    page = [row[:] for row in head.page]
+    head.apply(msg_type, 2, payload)
+    assert len(resyncs(head)) == 1
+    assert head.seq is None
+    assert head.page == page and not head.set_leds
+
+
+def test_own_sequence_numbers_in_order(head):
+    # BUTTONS from the input thread and RESYNC from the serve thread
+    threads = [Thread(target=lambda: [head.send(MSG_RESYNC) for _ in range(500)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [seq for _, seq, _ in head.sock.sent] == list(range(1, 2001))
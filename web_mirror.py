@@ -0,0 +1,174 @@
+# Web mirror of the MCDU displays.
+# Serves a small page that shows exactly what is sent to the Winwing MCDUs and pushes
+# only changed cells to it with server-sent events. New viewers get a keyframe first.
+# Fed from the rendered pages of the bridge, so viewers add no load on SimBridge.
+
+import json
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Thread, Condition, Lock
+from urllib.parse import urlparse, parse_qs
+
+from mcdu_console import page_cells, diff_cells
+
+KEEPALIVE = 15     # seconds between keep-alive comments on an idle stream
+MAX_PENDING = 8    # events queued for a slow viewer before they collapse into a keyframe
+
+PAGE = '''<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>MCDU %(side)s</title>
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<style>
+body { background: #111; color: #ddd; font-family: sans-serif; margin: 1em; }
+#mcdu { display: inline-grid; grid-template-columns: repeat(24, 1.05em); grid-auto-rows: 1.5em;
+        background: #000; padding: .6em; border: 2px solid #333; border-radius: 6px;
+        font: bold 20px/1.5 "DejaVu Sans Mono", monospace; }
+#mcdu span { text-align: center; }
+#mcdu .s { font-size: 75%%; font-weight: normal; }
+.L { color: #000; background: #999; } .A { color: #ffa500; } .W { color: #fff; }
+.B { color: #0ff; } .G { color: #0f0; } .M { color: #f0f; } .R { color: #f33; }
+.Y { color: #ff0; } .E { color: #888; }
+#state { font-size: small; color: #888; } a { color: #8af; }
+</style></head><body>
+<div id="mcdu"></div>
+<p id="state">connecting</p>
+<p><a href="?side=left">left</a> <a href="?side=right">right</a></p>
+<script>
+const SYMBOLS = {'#': '\\u2610', '`': '\\u00b0'};
+const grid = document.getElementById('mcdu'), state = document.getElementById('state');
+const cells = [];
+for (let i = 0; i < 336; i++) { const c = document.createElement('span'); grid.appendChild(c); cells.push(c); }
+function set(i, cell) {
+  const [color, small, ch] = cell, el = cells[i];
+  el.className = (color.trim() || 'W') + (small ? ' s' : '');
+  el.textContent = SYMBOLS[ch] || ch;
+}
+const es = new EventSource('events?side=%(side)s');
+es.addEventListener('key', e => { JSON.parse(e.data).forEach((c, i) => set(i, c)); state.textContent = 'live'; });
+es.addEventListener('delta', e => { JSON.parse(e.data).forEach(d => set(d[0], d.slice(1))); });
+es.onerror = () => { state.textContent = 'reconnecting'; };
+</script></body></html>
+'''
+
+
+class _Viewer:
+    def __init__(self):
+        self.events = []
+        self.closed = False
+        self.ready = Condition()
+
+
+class WebMirror:
+    def __init__(self, port: int, host: str = '0.0.0.0'):
+        self.host = host
+        self.port = port
+        self._lock = Lock()
+        self._cells = {}     # side -> cells as last published
+        self._viewers = {}   # side -> [_Viewer]
+        self._server = None
+
+    def start(self):
+        mirror = self
+
+        class Handler(_Handler):
+            web_mirror = mirror
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever, name='web mirror', daemon=True).start()
+        print(f"MCDU web mirror on http://{self.host}:{self.port}/")
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def publish(self, side: str, page, vertslew_key=0):
+        cells = page_cells(page, vertslew_key)
+        with self._lock:
+            old = self._cells.get(side)
+            self._cells[side] = cells
+            viewers = list(self._viewers.get(side, ()))
+        if not viewers:
+            return
+        changed = diff_cells(old, cells)
+        if not changed:
+            return
+        # encoded once for all viewers of this side
+        event = 'event: delta\ndata: ' + json.dumps(
+            [[i, *cells[i]] for i in changed], separators=(',', ':')) + '\n\n'
+        for viewer in viewers:
+            with viewer.ready:
+                if len(viewer.events) >= MAX_PENDING:
+                    viewer.events = [self._keyframe(cells)]
+                else:
+                    viewer.events.append(event)
+                viewer.ready.notify()
+
+    def _keyframe(self, cells):
+        return 'event: key\ndata: ' + json.dumps(cells, separators=(',', ':')) + '\n\n'
+
+    def subscribe(self, side):
+        viewer = _Viewer()
+        with self._lock:
+            self._viewers.setdefault(side, []).append(viewer)
+            cells = self._cells.get(side)
+        if cells:
+            viewer.events.append(self._keyframe(cells))
+        return viewer
+
+    def unsubscribe(self, side, viewer):
+        with self._lock:
+            if viewer in self._viewers.get(side, ()):
+                self._viewers[side].remove(viewer)
+
+    def viewer_count(self):
+        with self._lock:
+            return sum(len(v) for v in self._viewers.values())
+
+
+class _Handler(BaseHTTPRequestHandler):
+    web_mirror = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        side = parse_qs(url.query).get('side', ['left'])[0]
+        if side not in ('left', 'right'):
+            side = 'left'
+        if url.path == '/':
+            self._send(200, 'text/html; charset=utf-8', (PAGE % {'side': side}).encode())
+        elif url.path == '/events':
+            self._stream(side)
+        else:
+            self._send(404, 'text/plain', b'not found')
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _stream(self, side):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        viewer = self.web_mirror.subscribe(side)
+        try:
+            while True:
+                with viewer.ready:
+                    if not viewer.events:
+                        viewer.ready.wait(KEEPALIVE)
+                    events, viewer.events = viewer.events, []
+                self.wfile.write((''.join(events) if events else ': keep-alive\n\n').encode())
+                self.wfile.flush()
+        except OSError:
+            pass
+        finally:
+            self.web_mirror.unsubscribe(side, viewer)
@@ -5,9 +5,32 @@ VERSION = "v1.4+"
 UDP_IP = "127.0.0.1"
 UDP_PORT = 49000
 
+# mirror the MCDU screen in the console (like simbridge.py --mirror), max refresh rate
+CONSOLE_MIRROR = False
+CONSOLE_MIRROR_FPS = 10
+WARM_START = True  # skip the display init if the MCDU was already initialized since it was plugged in
+# 'hidapi' or 'libusb' (asynchronous transfers, see mcdu_libusb.py, needs pip install libusb1)
+USB_BACKEND = 'hidapi'
+# idle mode after this many seconds without X-Plane changes or key presses (prints wakeups and CPU when it ends)
+IDLE_AFTER = 10
+# while X-Plane does not answer, wait up to this long for it before asking again
+XPLANE_RETRY_MAX = 10
+# append the X-Plane values to this file, one JSON object per line
+RECORD_FILE = None
+# no X-Plane: replay a RECORD_FILE at REPLAY_RATE values per second, from the start again at the end
+REPLAY_FILE = None
+REPLAY_RATE = 4
+# scheduling of the MCDU input thread, see mcdu_rt.py (None/False: default scheduling)
+INPUT_RT_PRIORITY = None  # SCHED_FIFO priority 1..99, needs CAP_SYS_NICE
+INPUT_NICE = None  # e.g. -10, negative needs CAP_SYS_NICE
+INPUT_CPU = None  # pin the input thread to this CPU
+MLOCK = False  # lock the memory of the process in RAM
+# profiler, heap snapshot and thread stacks on SIGUSR1/SIGUSR2 or the debug socket (see mcdu_debug.py)
+DEBUG_HOOKS = True
+
 import binascii
 from dataclasses import dataclass
-from enum import Enum, IntEnum
+import json
 import os
 import requests
 import socket
@@ -20,79 +43,36 @@ import subprocess
 from threading import Thread, Event, Lock
 from time import sleep
 
-import hid
 import usb.core
 import usb.backend.libusb1
 import usb.util
 
 
 import XPlaneUdp
+from mcdu_core import (PAGE_LINES, PAGE_CHARS_PER_LINE, PAGE_BYTES_PER_CHAR, PAGE_BYTES_PER_LINE, DEVICEMASK,
+                       ButtonType, Leds, DrefType, Button, UsbManager, DisplayManager, winwing_mcdu_set_leds,
+                       read_buttons, input_error, dispatch_buttons)
+from mcdu_sim import XPlaneSource, ReplaySource
+from mcdu_console import TerminalMirror
+from mcdu_input import ButtonEventRing
+from mcdu_idle import IdleMonitor
 
 # TODOLIST
 #  * show vertslew_key
 
-BUTTONS_CNT = 99 # TODO
-PAGE_LINES = 14 # Header + 6 * label + 6 * cont + textbox
-PAGE_CHARS_PER_LINE = 24
-PAGE_BYTES_PER_CHAR = 3
-PAGE_BYTES_PER_LINE = PAGE_CHARS_PER_LINE * PAGE_BYTES_PER_CHAR
-PAGE_BYTES_PER_PAGE = PAGE_BYTES_PER_LINE * PAGE_LINES
-
-#@unique
-class DEVICEMASK(IntEnum):
-    NONE =  0
-    MCDU =  0x01
-    PFP3N = 0x02
-    PFP4 =  0x04
-    PFP7 =  0x08
-    CAP =   0x10
-    FO =    0x20
-    OBS =   0x40
-
-
-class ButtonType(Enum):
-    SWITCH = 0
-    TOGGLE = 1
-    SEND_0 = 2
-    SEND_1 = 3
-    SEND_2 = 4
-    SEND_3 = 5
-    SEND_4 = 6
-    SEND_5 = 7
-    NONE = 5 # for testing
-
-
-class Leds(Enum):
-    BACKLIGHT = 0 # 0 .. 255
-    SCREEN_BACKLIGHT = 1 # 0 .. 255
-    FAIL = 8
-    FM = 9
-    MCDU = 10
-    MENU = 11
-    FM1 = 12
-    IND = 13
-    RDY = 14
-    STATUS = 15
-    FM2 = 16
-
-
-
-class DrefType(Enum):
-    DATA = 0
-    CMD = 1
-    NONE = 2 # for testing
-
-
 @dataclass
-class Button:
-    id: int
+class Binding:
+    # what a key sends to X-Plane, resolved and encoded once at startup, see create_bindings()
     label: str
-    dataref: str = None
-    dreftype: DrefType = DrefType.DATA
-    type: ButtonType = ButtonType.NONE
-    led: Leds = None
+    press: bytes = None # UDP packet sent on press
+    press_log: str = None
+    release: bytes = None # UDP packet sent on release
+    release_log: str = None
+    toggle: tuple = None # datacache key, (packet, log) if the dataref is off, (packet, log) if on
 
-values_processed = Event()
+
+values_changed = Event()  # set by the X-Plane receiver, the page is only rendered after a change
+xplane_ready = Event()     # the buttons are read while X-Plane is connected
 xplane_connected = False
 buttonlist = []
 values = []
@@ -101,170 +81,20 @@ led_brightness = 180
 
 device_config = DEVICEMASK.NONE
 
-
-class Byte(Enum):
-    H0 = 0
-
-
-@dataclass
-class Flag:
-    name : str
-    byte : Byte
-    mask : int
-    value : bool = False
-
-
-#flags = dict([("spd", Flag('spd-mach_spd', Byte.H0, 0x01)),
-#              ])
+idle_monitor = IdleMonitor(IDLE_AFTER)
 
 
-def winwing_mcdu_set_leds(device, leds, brightness):
-    if isinstance(leds, list):
-        for i in range(len(leds)):
-            winwing_mcdu_set_led(device, leds[i], brightness)
-    else:
-        winwing_mcdu_set_led(device, leds, brightness)
-
-def winwing_mcdu_set_led(device, led, brightness):
-    data = [0x02, 0x32, 0xbb, 0, 0, 3, 0x49, led.value, brightness, 0,0,0,0,0]
-    if 'data' in locals():
-      cmd = bytes(data)
-      device.write(cmd)
-
-
-class DisplayManager:
-    col_map = {
-            'L' : 0x0000, # black with grey background
-            'A' : 0x0021, # amber
-            'W' : 0x0042, # white
-            'B' : 0x0063, # cyan
-            'G' : 0x0084, # green
-            'M' : 0x00A5, # magenta
-            'R' : 0x00C6, # red
-            'Y' : 0x00E7, # yellow
-            'E' : 0x0108, # grey
-            ' ' : 0x0042  # use white
+class XPlaneDisplay(DisplayManager):
+    title = ('MCDU for X-Plane', 'for TOLISS Airbus')
+    sim_name = 'X-Plane'
+    version = VERSION
+    col_map = {**DisplayManager.col_map, 'C': 0x0063} # cyan datarefs (cont1c ...), like 'B'
+    char_map = { # page char -> utf-8 bytes sent to the MCDU
+            **DisplayManager.char_map,
+            60 : b'\xe2\x86\x90', # <
+            62 : b'\xe2\x86\x92', # >
     }
 
-    def __init__(self, device):
-        self.device = device
-        self.page = [[' ' for _ in range(PAGE_BYTES_PER_LINE)] for _ in range(PAGE_LINES)]
-        device.write(bytes([0xf0, 0x0, 0x1, 0x38, 0x32, 0xbb, 0x0, 0x0, 0x1e, 0x1, 0x0, 0x0, 0xc4, 0x24, 0xa, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x18, 0x1, 0x0, 0x0, 0xc4, 0x24, 0xa, 0x0, 0x0, 0x8, 0x0, 0x0, 0x0, 0x34, 0x0, 0x18, 0x0, 0xe, 0x0, 0x18, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0xc4, 0x24, 0xa, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x2, 0x38, 0x0, 0x0, 0x0, 0x1, 0x0, 0x5, 0x0, 0x0, 0x0, 0x2, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0xc4, 0x24, 0xa, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x1, 0x0, 0x6, 0x0, 0x0, 0x0, 0x3, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x3, 0x38, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x0, 0x0, 0x0, 0xff, 0x4, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x0, 0xa5, 0xff, 0xff, 0x5, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x4, 0x38, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0xff, 0xff, 0xff, 0xff, 0x6, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0xff, 0xff, 0x0, 0xff, 0x7, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x5, 0x38, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x3d, 0xff, 0x0, 0xff, 0x8, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0xff, 0x63, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x6, 0x38, 0xff, 0xff, 0x9, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x0, 0x0, 0xff, 0xff, 0xa, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x7, 0x38, 0x0, 0x0, 0x2, 0x0, 0x0, 0xff, 0xff, 0xff, 0xb, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x42, 0x5c, 0x61, 0xff, 0xc, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x8, 0x38, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x77, 0x77, 0x77, 0xff, 0xd, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x2, 0x0, 0x5e, 0x73, 0x79, 0xff, 0xe, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x9, 0x38, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x20, 0x20, 0x20, 0xff, 0xf, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x0, 0xa5, 0xff, 0xff, 0x10, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xa, 0x38, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0xff, 0xff, 0xff, 0xff, 0x11, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0xff, 0xff, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xb, 0x38, 0xff, 0x12, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x3d, 0xff, 0x0, 0xff, 0x13, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xc, 0x38, 0x0, 0x3, 0x0, 0xff, 0x63, 0xff, 0xff, 0x14, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x0, 0x0, 0xff, 0xff, 0x15, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xd, 0x38, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x0, 0xff, 0xff, 0xff, 0x16, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x42, 0x5c, 0x61, 0xff, 0x17, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xe, 0x38, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x77, 0x77, 0x77, 0xff, 0x18, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x3, 0x0, 0x5e, 0x73, 0x79, 0xff, 0x19, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0xf, 0x38, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x4, 0x0, 0x0, 0x0, 0x0, 0x0, 0x1a, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x4, 0x0, 0x1, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x10, 0x38, 0x1b, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x19, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0xe, 0x0, 0x0, 0x0, 0x4, 0x0, 0x2, 0x0, 0x0, 0x0, 0x1c, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x32, 0xbb, 0x0, 0x0, 0x1a, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0x1, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-        device.write(bytes([0xf0, 0x0, 0x11, 0x12, 0x2, 0x32, 0xbb, 0x0, 0x0, 0x1c, 0x1, 0x0, 0x0, 0x76, 0x72, 0x19, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0, 0x0]))
-
-    def startupscreen(self, new_version: str = None):
-        self.clear()
-        self.write_line_to_page(0, 3,  'MCDU for X-Plane', 'W')
-        self.write_line_to_page(1, 3,  'for TOLISS Airbus', 'W')
-        self.write_line_to_page(12, 0, 'www.github.com/schenlap', 'W', True)
-        self.write_line_to_page(13, 0, '/winwing_mcdu', 'W', True)
-        self.write_line_to_page(8, 1, 'waiting for X-Plane ', 'A')
-        self.write_line_to_page(3, 1, f'version {VERSION}', 'W')
-        if new_version:
-            self.write_line_to_page(4, 1, f'New version {new_version}', 'A')
-            self.write_line_to_page(5, 1, f'available', 'A')
-        self.set_from_page()
-
-    def _data_from_col_font(self, color: str, font_small: bool = False):
-        if type(color) == int:
-            color = chr(color)
-        if color.upper() not in self.col_map:
-            raise ValueError(f"Invalid color '{color}'")
-        if font_small:
-            color = self.col_map[color.upper()] + 0x016b
-        else:
-            color = self.col_map[color.upper()]
-        data_low = color & 0x0ff
-        data_high = (color >> 8) & 0xff
-        return (data_low, data_high)
-
-    def clear(self):
-        blank_line = [0xf2] + [0x42, 0x00, ord(' ')] * PAGE_CHARS_PER_LINE
-        for _ in range(16):
-            self.device.write(bytes(blank_line))
-
-    def write_line_repeated(self, text: str, repeat: int = 16):
-        encoded = [ord(c) for c in text]
-        c = 0
-        for _ in range(repeat):
-            buf = [0xf2]
-            for _ in range(21):
-                buf.extend([0x42, 0x00, encoded[c]])
-                c = (c + 1) % len(encoded)
-            self.device.write(bytes(buf))
-
-    def set_from_page(self, page = None, vertslew_key = 0):
-        if page == None: # use internal page
-            page = self.page
-        buf = []
-        for i in range(PAGE_LINES):
-            for j in range(PAGE_CHARS_PER_LINE):
-                color = page[i][j * PAGE_BYTES_PER_CHAR]
-                font_small = page[i][j * PAGE_BYTES_PER_CHAR + 1]
-                data_low, data_high = self._data_from_col_font(color, font_small)
-                buf.append(data_low)
-                buf.append(data_high)
-                val = ord(page[i][j * PAGE_BYTES_PER_CHAR + PAGE_BYTES_PER_CHAR - 1])
-                if val == 35: # #
-                    buf.extend([0xe2, 0x98, 0x90])
-                elif val == 60: # <
-                    buf.extend([0xe2, 0x86, 0x90])
-                elif val == 62: # >
-                    buf.extend([0xe2, 0x86, 0x92])
-                elif val == 96: # °
-                    buf.extend([0xc2, 0xb0])
-                #elif val == "A": # down arrow
-                #    buf.extend([0xe2, 0x86, 0x93])
-                #elif val == "ö": # up arrow
-                #    buf.extend([0xe2, 0x86, 0x91])
-                else:
-                    if i == PAGE_LINES - 1 and j == PAGE_CHARS_PER_LINE - 2 and (vertslew_key == 1 or vertslew_key == 2):
-                        buf.extend([0xe2, 0x86, 0x91])
-                    elif i == PAGE_LINES - 1 and j == PAGE_CHARS_PER_LINE - 1 and (vertslew_key == 1 or vertslew_key == 3):
-                        buf.extend([0xe2, 0x86, 0x93])
-                    else:
-                        buf.append(val)
-
-        while len(buf):
-            max_len = min(63, len(buf))
-            usb_buf = buf[:max_len]
-            usb_buf.insert(0, 0xf2)
-            if max_len < 63:
-                usb_buf.extend([0] * (63 - max_len))
-            self.device.write(bytes(usb_buf))
-            del buf[:max_len]
-
-    def write_line_to_page(self, line, pos, text: str, color: str = 'W', font_small: bool = False):
-        if line < 0 or line >= PAGE_LINES:
-            raise ValueError("Line number out of range")
-        if pos < 0 or pos + len(text) >= PAGE_CHARS_PER_LINE:
-            raise ValueError("Position number out of range")
-        if len(text) > PAGE_CHARS_PER_LINE:
-            raise ValueError("Text too long for line")
-
-        #data_low, data_high = self._data_from_col_font(color, font_small)
-        pos = pos * PAGE_BYTES_PER_CHAR
-        c = 0
-        buf = []
-        for c in range(len(text)):
-            self.page[line][pos + c * PAGE_BYTES_PER_CHAR] = color
-            self.page[line][pos + c * PAGE_BYTES_PER_CHAR + 1] = font_small
-            self.page[line][pos + c * PAGE_BYTES_PER_CHAR + PAGE_BYTES_PER_CHAR - 1] = text[c]
 
 mcdu_device = None # usb /dev/inputx device
 
@@ -409,12 +239,15 @@ datarefs = [
     ("AirbusFBW/MCDU1VertSlewKeys", None)
   ]
 
-buttons_press_event = [0] * BUTTONS_CNT
-buttons_release_event = [0] * BUTTONS_CNT
+button_events = ButtonEventRing()  # input reader -> mcdu_dispatch_buttons
+bindings = {} # button id -> Binding
 
 usb_retry = False
 
-xp = None
+recorder = None # optional file, the X-Plane values are appended to it (RECORD_FILE)
+last_values = {}
+
+sim = None # XPlaneSource, or a ReplaySource with REPLAY_FILE
 
 
 def create_button_list_mcdu():
@@ -502,145 +335,106 @@ def dataref_switch_mcdu(dataref, config):
     return dataref
 
 
-def RequestDataRefs(xp, config):
-    dataref_cnt = 0
+def RequestDataRefs(config):
+    # (dataref, frequency) for X-Plane to send, the dataref cache gets their keys
+    requests = []
+    dataref_cells.clear()
+    dataref_specials.clear()
     for idx,b in enumerate(buttonlist):
         datacache[dataref_switch_mcdu(b.dataref, config)] = None
         if b.dreftype != DrefType.CMD and b.led != None:
-            print(f"register dataref {b.dataref}")
-            xp.AddDataRef(b.dataref, 3)
-            dataref_cnt += 1
-    print(f"register array datarefs ", end='' )
+            requests.append((b.dataref, 3))
     for d in array_datarefs:
         for i in range(PAGE_CHARS_PER_LINE):
             freq = d[1]
             if freq == None:
                 freq = 2
-            xp.AddDataRef(dataref_switch_mcdu(d[0]+'['+str(i)+']', config), freq)
-            dataref_cnt += 1
-            if dataref_cnt % 100 == 0:
-                print(".", end='', flush=True)
-
-    print("")
+            requests.append((dataref_switch_mcdu(d[0]+'['+str(i)+']', config), freq))
     for d in datarefs:
-        print(f"register dataref {d[0]}")
         freq = d[1]
         if freq == None:
             freq = 2
-        xp.AddDataRef(dataref_switch_mcdu(d[0], config), freq)
-        dataref_cnt += 1
-    print(f"registered {dataref_cnt} datarefs")
+        requests.append((dataref_switch_mcdu(d[0], config), freq))
+    for dataref, freq in requests:
+        add_dataref_cell(dataref, config)
+    return requests
 
 
-def xor_bitmask(a, b, bitmask):
-    return (a & bitmask) != (b & bitmask)
+SEND_VALUES = {
+    ButtonType.SEND_0: 0, ButtonType.SEND_1: 1, ButtonType.SEND_2: 2,
+    ButtonType.SEND_3: 3, ButtonType.SEND_4: 4, ButtonType.SEND_5: 5,
+}
 
 
-def mcdu_button_event():
-    #print(f'events: press: {buttons_press_event}, release: {buttons_release_event}')
+def create_bindings(config):
+    # every key resolved for the MCDU side (CAP/FO) and encoded into its X-Plane packet,
+    # a key press is then a lookup and one send
+    result = {}
     for b in buttonlist:
-
-        if not any(buttons_press_event) and not any(buttons_release_event):
-            break
-        if b.id == None:
+        if b.id is None:
             continue
-        if buttons_press_event[b.id]:
-            buttons_press_event[b.id] = 0
-
-            if device_config & DEVICEMASK.FO:
-                b.dataref = b.dataref.replace('AirbusFBW/MCDU1', 'AirbusFBW/MCDU2')
-
-            #print(f'button {b.label} pressed')
-            if b.type == ButtonType.TOGGLE:
-                val = datacache[b.dataref]
-                if b.dreftype== DrefType.DATA:
-                    print(f'set dataref {b.dataref} from {bool(val)} to {not bool(val)}')
-                    xp.WriteDataRef(b.dataref, not bool(val))
-                elif b.dreftype== DrefType.CMD:
-                    print(f'send command {b.dataref}')
-                    xp.SendCommand(b.dataref)
-            elif b.type == ButtonType.SWITCH:
-                val = datacache[b.dataref]
-                if b.dreftype== DrefType.DATA:
-                    print(f'set dataref {b.dataref} to 1')
-                    xp.WriteDataRef(b.dataref, 1)
-                elif b.dreftype== DrefType.CMD:
-                    print(f'send command {b.dataref}')
-                    xp.SendCommand(b.dataref)
-            elif b.type == ButtonType.SEND_0:
-                if b.dreftype== DrefType.DATA:
-                    print(f'set dataref {b.dataref} to 0')
-                    xp.WriteDataRef(b.dataref, 0)
-            elif b.type == ButtonType.SEND_1:
-                if b.dreftype== DrefType.DATA:
-                    print(f'set dataref {b.dataref} to 1')
-                    xp.WriteDataRef(b.dataref, 1)
-            elif b.type == ButtonType.SEND_2:
-                if b.dreftype== DrefType.DATA:
-                    print(f'set dataref {b.dataref} to 2')
-                    xp.WriteDataRef(b.dataref, 2)
-            elif b.type == ButtonType.SEND_3:
-                if b.dreftype== DrefType.DATA:
-                    print(f'set dataref {b.dataref} to 3')
-                    xp.WriteDataRef(b.dataref, 3)
-            elif b.type == ButtonType.SEND_4:
-                if b.dreftype== DrefType.DATA:
-                    print(f'set dataref {b.dataref} to 4')
-                    xp.WriteDataRef(b.dataref, 4)
-            elif b.type == ButtonType.SEND_5:
-                if b.dreftype== DrefType.DATA:
-                    print(f'set dataref {b.dataref} to 5')
-                    xp.WriteDataRef(b.dataref, 5)
-            else:
-                print(f'no known button type for button {b.label}')
-        if buttons_release_event[b.id]:
-            buttons_release_event[b.id] = 0
-            print(f'button {b.label} released')
-            if b.type == ButtonType.SWITCH:
-                xp.WriteDataRef(b.dataref, 0)
+        dataref = dataref_switch_mcdu(b.dataref, config)
+        binding = Binding(b.label, release_log=f'button {b.label} released')
+        if b.type in (ButtonType.TOGGLE, ButtonType.SWITCH) and b.dreftype == DrefType.CMD:
+            binding.press = XPlaneUdp.XPlaneUdp.CommandPacket(dataref)
+            binding.press_log = f'send command {dataref}'
+        elif b.type == ButtonType.TOGGLE and b.dreftype == DrefType.DATA:
+            binding.toggle = (dataref,
+                              (XPlaneUdp.XPlaneUdp.DataRefPacket(dataref, 1), f'set dataref {dataref} from False to True'),
+                              (XPlaneUdp.XPlaneUdp.DataRefPacket(dataref, 0), f'set dataref {dataref} from True to False'))
+        elif b.type == ButtonType.SWITCH and b.dreftype == DrefType.DATA:
+            binding.press = XPlaneUdp.XPlaneUdp.DataRefPacket(dataref, 1)
+            binding.press_log = f'set dataref {dataref} to 1'
+        elif b.type in SEND_VALUES:
+            if b.dreftype == DrefType.DATA:
+                binding.press = XPlaneUdp.XPlaneUdp.DataRefPacket(dataref, SEND_VALUES[b.type])
+                binding.press_log = f'set dataref {dataref} to {SEND_VALUES[b.type]}'
+        elif b.type not in (ButtonType.TOGGLE, ButtonType.SWITCH):
+            binding.press_log = f'no known button type for button {b.label}'
+        if b.type == ButtonType.SWITCH:
+            binding.release = XPlaneUdp.XPlaneUdp.DataRefPacket(dataref, 0)
+        result[b.id] = binding
+    return result
+
+
+def mcdu_button_event(button_id, pressed):
+    binding = bindings.get(button_id)
+    if binding is None:
+        return
+    if pressed:
+        if binding.toggle:
+            key, off, on = binding.toggle
+            packet, log = on if datacache[key] else off
+        else:
+            packet, log = binding.press, binding.press_log
+    else:
+        packet, log = binding.release, binding.release_log
+    if log:
+        print(log)
+    if packet:
+        sim.send(packet)
+
+
+def mcdu_render_values(usb_mgr, display_mgr):
+        # renders the page when X-Plane sent different values, sleeps otherwise
+        while True:
+            values_changed.wait()
+            values_changed.clear()
+            set_datacache(usb_mgr, display_mgr, values.copy())
 
 
 def mcdu_create_events(usb_mgr, display_mgr):
-        global values
+        if INPUT_RT_PRIORITY or INPUT_NICE is not None or INPUT_CPU is not None or MLOCK:
+            from mcdu_rt import InputScheduling
+            InputScheduling(INPUT_RT_PRIORITY, INPUT_NICE, INPUT_CPU, MLOCK).apply('MCDU')
         sleep(2) # wait for values to be available
-        buttons_last = 0
-        while True:
-            if not xplane_connected: # wait for x-plane
-                sleep(1)
-                continue
+        # the buttons are read while X-Plane is connected
+        read_buttons('MCDU', lambda: usb_mgr.device, button_events, input_error,
+                     ready=xplane_ready, activity=idle_monitor.activity)
 
-            set_datacache(usb_mgr, display_mgr, values.copy())
-            values_processed.set()
-            sleep(0.005)
-            #print('#', end='', flush=True) # TEST1: should print many '#' in console
-            try:
-                data_in = usb_mgr.device.read(0x81, 25)
-            except Exception as error:
-                print(f' *** continue after usb-in error: {error} ***') # TODO
-                sleep(0.5) # TODO remove
-                continue
-            if len(data_in) == 14: # we get this often but don't understand yet. May have someting to do with leds set
-                continue
-            if len(data_in) != 25:
-                print(f'rx data count {len(data_in)} not valid')
-                continue
-            #print(f"data_in: {data_in}")
-
-            #create button bit-pattern
-            buttons = 0
-            for i in range(12):
-                buttons |= data_in[i + 1] << (8 * i)
-            #print(hex(buttons)) # TEST2: you should see a difference when pressing buttons
-            for i in range (BUTTONS_CNT):
-                mask = 0x01 << i
-                if xor_bitmask(buttons, buttons_last, mask):
-                    #print(f"buttons: {format(buttons, "#04x"):^14}")
-                    if buttons & mask:
-                        buttons_press_event[i] = 1
-                    else:
-                        buttons_release_event[i] = 1
-                    mcdu_button_event()
-            buttons_last = buttons
+
+def mcdu_dispatch_buttons():
+    dispatch_buttons('MCDU', button_events, mcdu_button_event)
 
 
 def set_button_led_lcd(ep, dataref, v):
@@ -656,6 +450,84 @@ def set_button_led_lcd(ep, dataref, v):
             winwing_mcdu_set_leds(ep, b.led, int(v))
             break
 
+# what set_datacache() takes from the name of a dataref, see dataref_cell()
+CELL_NONE = 0
+CELL_TEXT = 1 # a char of a title, label or cont line
+CELL_SPW = 2 # scratchpad, white
+CELL_SPA = 3 # scratchpad, amber
+CELL_VERTSLEW = 4
+CELL_LED = 5 # brightness
+
+# symbol font ('s' color): char -> char shown and its color
+SYMBOLS = {
+    ord('A'): (91, 'b'), # '[', should be blue
+    ord('B'): (93, 'b'), # ']', should be blue
+    ord('0'): (60, 'b'), # '<', should be a small blue arrow
+    ord('1'): (62, 'b'), # '>', should be a small bluearrow
+    ord('2'): (60, 'w'), # '<', should be a small white arrow in title
+    ord('3'): (62, 'w'), # '>', should be a small white arrow in title
+    ord('4'): (60, 'a'), # '<', should be a small orange arrow in cont
+    ord('5'): (62, 'a'), # '>'
+    ord('E'): (35, 'a'), # '#', should be an orange box
+}
+
+dataref_cells = {} # dataref name -> (kind, line, pos, color, font_small, upper), filled by RequestDataRefs
+dataref_specials = [] # names of the LED and scratchpad datarefs, 0 and space count for them
+
+
+def dataref_cell(v, config):
+    # Everything about a dataref that set_datacache needs and that is given by its name:
+    # line, position, color and font of its char. Parsed once per name, not per value.
+    if "DUBrightness" in v or "/anim" in v:
+        return (CELL_LED, 0, 0, None, 0, False)
+    color = v.split('[')[0][-1]
+    font_small = 1 # 0 .. normal, 1 .. small
+    if ('cont' in v and not 'scont' in v) or 'spw' in v:
+        font_small = 0 # normal
+    if ('title' in v and not 'stitle' in v) or 'spa' in v:
+        font_small = 0 # normal
+
+    if config & DEVICEMASK.FO:
+        v = v.replace('MCDU2', 'MCDU1')
+
+    if "MCDU1spw" in v:
+        return (CELL_SPW, 13, int(v.split('[')[1].split(']')[0]), None, 0, False)
+    if "MCDU1spa" in v:
+        pos = int(v.split('[')[1].split(']')[0])
+        if pos > 21: # prevent amber color on vert slew keys
+            return (CELL_NONE, 0, 0, None, 0, False)
+        return (CELL_SPA, 13, pos, None, 0, False)
+    if "VertSlewKeys" in v:
+        return (CELL_VERTSLEW, 0, 0, None, 0, False)
+
+    line = None
+    if "MCDU1title" in v or "MCDU1stitle" in v:
+        line = 0
+    if "MCDU1label" in v:
+        line = int(v.split('label')[1][0]) * 2 - 1
+        if v.split('[')[0][-2] == 'L':
+            font_small = 0 # normal
+    if "MCDU1cont" in v or "MCDU1scont" in v:
+        line = int(v.split('cont')[1][0]) * 2
+    if line is None:
+        return (CELL_NONE, 0, 0, None, 0, False)
+    pos = int(v.split('[')[1].split(']')[0]) * PAGE_BYTES_PER_CHAR # color and font (2 bytes) and char(1 byte) = 3 bytes per char
+
+    upper = "MCDU1s" not in v # convert y in Y, a in A, ... if not small font
+    if color == 's':
+        color = None # the symbol decides, see SYMBOLS
+    elif upper:
+        color = chr(ord(color) - 32)
+    return (CELL_TEXT, line, pos, color, font_small, upper)
+
+
+def add_dataref_cell(v, config):
+    cell = dataref_cells[v] = dataref_cell(v, config)
+    if cell[0] in (CELL_SPW, CELL_SPA, CELL_LED):
+        dataref_specials.append(v)
+    return cell
+
+
 page = [[' ' for i in range(0, PAGE_BYTES_PER_LINE)] for j in range(0, PAGE_LINES)]
 
 def set_datacache(usb_mgr, display_mgr, values):
@@ -667,10 +539,46 @@ def set_datacache(usb_mgr, display_mgr, values):
     page_tmp = [[' ' for i in range(0, PAGE_BYTES_PER_LINE)] for j in range(0, PAGE_LINES)]
     spw_line = [0] * PAGE_BYTES_PER_LINE
     spa_line = [0] * PAGE_BYTES_PER_LINE
-    for v in values:
-        pos = 0
-        val = int(values[v])
-        data_valid = False
+    cells = dataref_cells
+    for v, value in values.items():
+        if value == 0.0 or value == 32.0:
+            continue # most cells are empty. LEDs and scratchpad are read below, 0 and space count there
+        cell = cells.get(v)
+        if cell is None: # not requested by RequestDataRefs
+            cell = add_dataref_cell(v, usb_mgr.device_config)
+        kind, line, pos, color, font_small, upper = cell
+        if kind != CELL_TEXT and kind != CELL_VERTSLEW:
+            continue
+        val = int(value)
+        if val == 0x0 or val == 0x20:
+            continue
+        if kind == CELL_VERTSLEW:
+            vertslew_key = val # 1: up/down, 2: up, 3: down
+            continue
+
+        if color is None: # symbol font
+            symbol = SYMBOLS.get(val)
+            if symbol is None:
+                color = 'm' # symbol
+            else:
+                val, color = symbol
+                if upper:
+                    color = chr(ord(color) - 32)
+        newline = page_tmp[line]
+        newline[pos] = color
+        newline[pos + 1] = font_small
+        newline[pos + PAGE_BYTES_PER_CHAR - 1] = chr(val)
+
+    for v in dataref_specials:
+        if v not in values:
+            continue
+        kind, line, pos, color, font_small, upper = cells[v]
+        if kind == CELL_SPW:
+            spw_line[pos] = int(values[v])
+            continue
+        if kind == CELL_SPA:
+            spa_line[pos] = int(values[v])
+            continue
 
         if "DUBrightness" in v and values[v] <= 1:
             # brightness is in 0..1, we need 0..255
@@ -678,105 +586,12 @@ def set_datacache(usb_mgr, display_mgr, values):
         if "/anim" in v and values[v] > 255:
             # brightness is in 0..270, we need 0..255
             values[v] = 255
-
         #write leds ob buttons (also NONE Buttons)
-        if "DUBrightness" in v or "/anim" in v:
-            if datacache[v] != int(values[v]):
-                print(f'cache: v:{v} val:{int(values[v])}')
-                datacache[v] = int(values[v])
-                set_button_led_lcd(usb_mgr.device, v, int(values[v]))
-
-
-        color = v.split('[')[0][-1]
-        font_small = 1 # 0 .. normal, 1 .. small
-        if ('cont' in v and not 'scont' in v) or 'spw' in v:
-            font_small = 0 # normal
-        if ('title' in v and not 'stitle' in v) or 'spa' in v:
-            font_small = 0 # normal
+        if datacache[v] != int(values[v]):
+            print(f'cache: v:{v} val:{int(values[v])}')
+            datacache[v] = int(values[v])
+            set_button_led_lcd(usb_mgr.device, v, int(values[v]))
 
-        if usb_mgr.device_config & DEVICEMASK.FO:
-            v = v.replace('MCDU2', 'MCDU1')
-
-        #print(f"page: v:{v} val:{val},'{chr(val)}', col:{color}")
-        if val == 0x0 or (val == 0x20 and not 'MCDU1spw' in v and not 'MCDU1spa' in v):
-            continue
-        if color == 's':
-            if chr(val) == 'A':
-                val = 91 # '[', should be blue
-                color = 'b'
-            if chr(val) == 'B':
-                val = 93 # ']', should be blue
-                color = 'b'
-            if chr(val) == '0':
-                val = 60 # '<', should be a small blue arrow
-                color = 'b'
-            if chr(val) == '1':
-                val = 62 # '>', should be a small bluearrow
-                color = 'b'
-            if chr(val) == '2':
-                val = 60 # '<', should be a small white arrow in title
-                color = 'w'
-            if chr(val) == '3':
-                val = 62 # '>', should be a small white arrow in title
-                color = 'w'
-            if chr(val) == '4':
-                val = 60 # '<', should be a small orange arrow in cont
-                color = 'a'
-            if chr(val) == '5':
-                val = 62 # '>'
-                color = 'a'
-            if chr(val) == 'E':
-                val = 35 # '#', should be an orange box
-                color = 'a'
-            #print(f"page: v:{v} val:{val},'{chr(val)}', col:{color}")
-        if "MCDU1title" in v or "MCDU1stitle" in v:
-            pos = int(v.split('[')[1].split(']')[0])
-            line = 0
-            data_valid = True
-        if "MCDU1label" in v:
-            line = int(v.split('label')[1][0]) * 2 - 1
-            pos = int(v.split('[')[1].split(']')[0])
-            data_valid = True
-            if v.split('[')[0][-2] == 'L':
-                font_small = 0 # normal
-        if "MCDU1cont" in v or "MCDU1scont" in v: # and color == 'w':
-            line = int(v.split('cont')[1][0]) * 2
-            pos = int(v.split('[')[1].split(']')[0])
-            data_valid = True
-        spw_spa_data = False
-        if "MCDU1spw" in v: # and color == 'w':
-            pos = int(v.split('[')[1].split(']')[0])
-
-            spw_line[pos] = val
-            continue
-
-        if "MCDU1spa" in v: # and color == 'w':
-            pos = int(v.split('[')[1].split(']')[0])
-            if pos > 21: # prevent amber color on vert slew keys
-                continue
-            spa_line[pos] = val
-            continue
- 
-        if not spw_spa_data:
-            if color == 's':
-                color = None
-            if "MCDU1s" not in v and color != None:
-                color = chr(ord(color) - 32) # convert y in Y, a in A, ... if not small font
-            if color == None:
-                color = 'm' # symbol
-        if "VertSlewKeys" in v:
-            vertslew_key = val # 1: up/down, 2: up, 3: down
-
-        pos = pos * PAGE_BYTES_PER_CHAR # we decode color and font (2 bytes) and char(1 byte) = sum 3 bytes per char
-
-        if data_valid: # we received mcdu data
-                newline = page_tmp[line]
-                newline[pos] = str(color)
-                if PAGE_BYTES_PER_CHAR == 3:
-                    newline[pos + 1] = font_small
-                newline[pos + PAGE_BYTES_PER_CHAR - 1] = chr(val)
-                page_tmp[line] = newline
-    
     #workaround for buggy spa / spw data
     for i in range(PAGE_CHARS_PER_LINE):
         if spw_line[i] == 0:
@@ -804,39 +619,7 @@ def set_datacache(usb_mgr, display_mgr, values):
 
     if page != page_tmp:
         new = True
-
-    #display MCDU in Console
-    if page != page_tmp:
         page = page_tmp.copy()
-        up = ' '
-        down = ' '
-        if vertslew_key == 1:
-            up = '🠉'
-            down = '🠋'
-        elif vertslew_key == 2:
-            up = '🠉'
-        elif vertslew_key == 3:
-            down = '🠋'
-
-        print("|------ MCDU SCREEN -----|")
-        for i in range(PAGE_LINES):
-            print('|', end='')
-            for j in range(PAGE_CHARS_PER_LINE):
-                val = page[i][j * PAGE_BYTES_PER_CHAR + PAGE_BYTES_PER_CHAR - 1]
-                if val == '#':
-                    #val = '▯'
-                    val = '☐'
-                if val == '`':
-                    val = '°'
-                if val == '>':
-                    val = '🠊'
-                if val == '<':
-                    val = '🠈'
-                print(val, end='')
-            print('|')
-        print("|------------------------|")
-        print("")
-
 
     #display mcdu on winwing
     if new == True or usb_retry == True:
@@ -873,51 +656,6 @@ def kb_wait_quit_event():
         os._exit(0)
 
 
-class UsbManager:
-    def __init__(self):
-        self.device = None
-        self.device_config = 0
-
-    def connect_device(self, vid: int, pid: int):
-
-        # Connect to device. Linux uses device whreas mac uses Device
-        try:
-            self.device = hid.device()
-            self.device.open(vid, pid)
-        except AttributeError as e:
-            print("using hidapi mac version")
-            self.device = hid.Device(vid=vid, pid=pid)
-
-        if self.device is None:
-            raise RuntimeError("Device not found")
-
-        print("Device connected.")
-
-    def find_device(self):
-        device_config = 0
-        devlist = [
-            {'vid': 0x4098, 'pid': 0xbb36, 'name': 'MCDU - Captain', 'mask': DEVICEMASK.MCDU | DEVICEMASK.CAP},
-            {'vid': 0x4098, 'pid': 0xbb3e, 'name': 'MCDU - First Offizer', 'mask': DEVICEMASK.MCDU | DEVICEMASK.FO},
-            {'vid': 0x4098, 'pid': 0xbb3a, 'name': 'MCDU - Observer', 'mask': DEVICEMASK.MCDU | DEVICEMASK.OBS},
-            {'vid': 0x4098, 'pid': 0xbc1e, 'name': 'PFP 3N (not tested)', 'mask': DEVICEMASK.PFP3N},
-            {'vid': 0x4098, 'pid': 0xbc1d, 'name': 'PFP 4 (not tested)', 'mask': DEVICEMASK.PFP4},
-            {'vid': 0x4098, 'pid': 0xba01, 'name': 'PFP 7 (not tested)', 'mask': DEVICEMASK.PFP7}
-        ]
-        for d in devlist:
-            print(f"now searching for winwing {d['name']} ... ", end='')
-            found = False
-            for dev in hid.enumerate():
-                if dev['vendor_id'] == d['vid'] and dev['product_id'] == d['pid']:
-                    print("found")
-                    self.device_config |= d['mask']
-                    # to force F/O or CAP, uncomment the following line
-                    #self.device_config = DEVICEMASK.MCDU | DEVICEMASK.CAP
-                    #self.device_config = DEVICEMASK.MCDU | DEVICEMASK.FO
-                    return d['vid'], d['pid'], self.device_config
-            print("not found")
-        return None, None, 0
-
-
 def get_latest_release_github():
     url = "https://api.github.com/repos/schenlap/winwing_mcdu/releases/latest"
     response = requests.get(url, timeout=2)
@@ -929,13 +667,46 @@ def get_latest_release_github():
         return None
 
 
+def on_xplane_connect(usb_mgr, display_mgr):
+    global last_values
+    display_mgr.write_line_to_page(8, 1, f'{sim.name} connected', 'G')
+    display_mgr.set_from_page()
+    winwing_mcdu_set_leds(usb_mgr.device, Leds.FAIL, 0)
+    last_values = {} # the first values are rendered
+    page[0][0] = 'X' # force redraw
+    xplane_ready.set()
+
+
+def on_xplane_values(new_values):
+    # values are rendered in mcdu_render_values, only if they changed.
+    # see function set_datacache(values)
+    global values, last_values
+    if recorder:
+        recorder.write(json.dumps(new_values) + '\n')
+    values = new_values
+    if values != last_values:
+        last_values = values.copy()
+        idle_monitor.activity('x-plane')
+        values_changed.set()
+
+
+def on_xplane_lost(usb_mgr, display_mgr, new_version, reason):
+    xplane_ready.clear()
+    winwing_mcdu_set_leds(usb_mgr.device, Leds.FAIL, 1)
+    display_mgr.startupscreen(new_version)
+
+
 def main():
-    global xp
-    global values, xplane_connected
+    global sim
+    global recorder
     global device_config
 
     new_version = None
 
+    if DEBUG_HOOKS:
+        from mcdu_debug import DebugHooks
+        DebugHooks().install()
+
     # Check for new version on github. If you dont't want this, remove the following lines until 'version check end'
     print(f"Current version: {VERSION}")
     if "+" in VERSION:
@@ -948,66 +719,55 @@ def main():
             new_version = latest_release
     # version check end
 
+    UsbManager.backend = USB_BACKEND
     usb_mgr = UsbManager()
-    vid, pid, device_config = usb_mgr.find_device()
+    found = usb_mgr.find_devices()
+    # the first one, to force F/O or CAP set device_config below
+    d = found[0] if found else None
 
-    if pid is None:
+    if d is None:
         exit(f"No compatible winwing device found, quit")
     else:
-        usb_mgr.connect_device(vid=vid, pid=pid)
+        usb_mgr.connect_device(d['vid'], d['pid'], d['path'])
+        usb_mgr.device_config = device_config = d['mask']
+        #usb_mgr.device_config = device_config = DEVICEMASK.MCDU | DEVICEMASK.CAP
+        #usb_mgr.device_config = device_config = DEVICEMASK.MCDU | DEVICEMASK.FO
 
     print('compatible with X-Plane 11/12 and all Toliss Airbus')
 
-    display_mgr = DisplayManager(usb_mgr.device)
-    display_mgr.startupscreen(new_version)
+    display_mgr = XPlaneDisplay(usb_mgr.device, d['path'], warm_start=WARM_START)
+    if CONSOLE_MIRROR: # display MCDU in console
+        display_mgr.mirror = TerminalMirror(fps=CONSOLE_MIRROR_FPS, symbols={'<': '←', '>': '→'})
+        display_mgr.mirror.start()
+    if not display_mgr.warm:
+        display_mgr.startupscreen(new_version)
 
     create_button_list_mcdu()
+    bindings.update(create_bindings(device_config))
+    Thread(target=mcdu_dispatch_buttons, daemon=True).start()
 
     usb_event_thread = Thread(target=mcdu_create_events, args=[usb_mgr, display_mgr])
     usb_event_thread.start()
+    Thread(target=mcdu_render_values, args=[usb_mgr, display_mgr], daemon=True).start()
+    idle_monitor.start()
 
     kb_quit_event_thread = Thread(target=kb_wait_quit_event)
     kb_quit_event_thread.start()
 
-    xp = XPlaneUdp.XPlaneUdp()
-    xp.BeaconData["IP"] = UDP_IP # workaround to set IP and port
-    xp.BeaconData["Port"] = UDP_PORT
-    xp.UDP_PORT = xp.BeaconData["Port"]
-    print(f'waiting for X-Plane to connect on port {xp.BeaconData["Port"]}')
+    if RECORD_FILE:
+        recorder = open(RECORD_FILE, 'a', buffering=1)
+        print(f"recording X-Plane values to {RECORD_FILE}")
+    datarefs = RequestDataRefs(device_config)
+    if REPLAY_FILE:
+        sim = ReplaySource(REPLAY_FILE, REPLAY_RATE, decode=json.loads)
+    else:
+        sim = XPlaneSource(UDP_IP, UDP_PORT, datarefs, XPLANE_RETRY_MAX)
+    sim.on_connect = lambda: on_xplane_connect(usb_mgr, display_mgr)
+    sim.on_data = on_xplane_values
+    sim.on_disconnect = lambda reason: on_xplane_lost(usb_mgr, display_mgr, new_version, reason)
+    sim.on_error = lambda error: print(f"{sim.name}: {error}")
     winwing_mcdu_set_leds(usb_mgr.device, Leds.FAIL, 1)
-
-    while True:
-        if not xplane_connected:
-            try:
-                xp.AddDataRef("sim/aircraft/view/acf_tailnum")
-                values = xp.GetValues()
-
-                print(f"X-Plane connected")
-                display_mgr.write_line_to_page(8, 1, 'registering datarefs', 'G')
-                display_mgr.set_from_page()
-                RequestDataRefs(xp, device_config)
-                xp.AddDataRef("sim/aircraft/view/acf_tailnum", 0)
-                winwing_mcdu_set_leds(usb_mgr.device, Leds.FAIL, 0)
-                xplane_connected = True
-                page[0][0] = 'X' # force redraw
-            except XPlaneUdp.XPlaneTimeout:
-                winwing_mcdu_set_leds(usb_mgr.device, Leds.FAIL, 1)
-                xplane_connected = False
-                sleep(1)
-            continue
-
-        try:
-            values = xp.GetValues()
-            values_processed.wait()
-            #print(values)
-            #values will be handled in mcdu_create_events to write to usb only in one thread.
-            # see function set_datacache(values)
-        except XPlaneUdp.XPlaneTimeout:
-            print(f'X-Plane timeout, could not connect on port {xp.BeaconData["Port"]}, waiting for X-Plane')
-            winwing_mcdu_set_leds(usb_mgr.device, Leds.FAIL, 1)
-            display_mgr.startupscreen(new_version)
-            xplane_connected = False
-            sleep(2)
+    sim.run()
 
 if __name__ == '__main__':
   main() 